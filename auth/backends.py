@@ -1,13 +1,26 @@
+import re
 from datetime import datetime
-from threading import local
+from threading import Lock
 
+import jwt
 from django.conf import settings
 from oauthlib.oauth2 import BackendApplicationClient
+from requests import RequestException
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth2Session
+from urllib3.util.retry import Retry
 
+from auth.cache import IntrospectionCache, SingleFlight, Throttle
 from auth.users import User
 
 
+class IntrospectionError(Exception):
+    """
+    The Authorization Server could not be reached, or failed to answer an
+    introspection request.
+    """
+
+
 class OAuth2Backend:
     """
     Django Authentication backend that uses an external OAuth2 Authorization
@@ -17,43 +30,275 @@ class OAuth2Backend:
     the user.
     """
 
-    _local = local()
+    _client = None
+    _client_lock = Lock()
     access_token = {
         "access_token": settings.AUTHORIZATION_SERVER_ACCESS_TOKEN,
         "token_type": "Bearer",
         "scope": ["read", "write", "introspection"],
         "expires_at": 1_696_232_955.0,
     }
+    cache = IntrospectionCache(
+        max_size=settings.AUTHORIZATION_SERVER_CACHE_SIZE,
+        max_ttl=settings.AUTHORIZATION_SERVER_CACHE_TTL,
+        alias=settings.AUTHORIZATION_SERVER_CACHE_ALIAS,
+    )
+    negative_cache = IntrospectionCache(
+        max_size=settings.AUTHORIZATION_SERVER_CACHE_SIZE,
+        max_ttl=settings.AUTHORIZATION_SERVER_NEGATIVE_CACHE_TTL,
+    )
+    throttle = Throttle(
+        rate=settings.AUTHORIZATION_SERVER_THROTTLE_RATE,
+        window=settings.AUTHORIZATION_SERVER_THROTTLE_WINDOW,
+    )
+    ip_throttle = Throttle(
+        rate=settings.AUTHORIZATION_SERVER_IP_THROTTLE_RATE,
+        window=settings.AUTHORIZATION_SERVER_THROTTLE_WINDOW,
+    )
+    introspections = SingleFlight()
+
+    # Syntax of a Bearer token, as defined in RFC 6750.
+    token_re = re.compile(r"^[A-Za-z0-9\-._~+/]+=*$")
+    max_token_length = 4096
 
     def get_introspection_client(self):
         """
         Get an OAuth2 client configured with the resource server's access
-        token. This client is reused for all requests in this thread.
+        token. This client is shared by all threads in this process.
 
-        It's not apparent whetehr OAuth2Session is thread-safe and can thus be
-        reused across every thread.
+        The client keeps a bounded pool of keep-alive connections to the
+        Authorization Server, and retries failed requests with an exponential
+        backoff.
         """
-        try:
-            return self._local.client
-        except AttributeError:
-            self._local.client = OAuth2Session(token=self.access_token)
-            return self._local.client
+        if OAuth2Backend._client is None:
+            with OAuth2Backend._client_lock:
+                if OAuth2Backend._client is None:
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=settings.AUTHORIZATION_SERVER_POOL_SIZE,
+                        pool_block=True,
+                        max_retries=Retry(
+                            total=settings.AUTHORIZATION_SERVER_RETRIES,
+                            backoff_factor=settings.AUTHORIZATION_SERVER_BACKOFF,
+                            status_forcelist=[502, 503, 504],
+                            method_whitelist=False,
+                            raise_on_status=False,
+                        ),
+                    )
+                    client = OAuth2Session(token=self.access_token)
+                    client.mount("http://", adapter)
+                    client.mount("https://", adapter)
+                    OAuth2Backend._client = client
+        return OAuth2Backend._client
 
-    def authenticate(self, request):
+    def introspect(self, token):
         """
-        Retrieve the access token from the Authorization header, and validate
-        it against the Authorization Server. If the token is active, return a
-        User object with the retreived data.
+        Validate `token` against the Authorization Server. Return the
+        introspection data if the token is active, or None if the token is
+        inactive or the request is rejected with a 4xx response.
+
+        Raises IntrospectionError if the Authorization Server cannot be
+        reached, or answers with a 5xx response or invalid data, so an outage
+        is not mistaken for a rejected token.
         """
         client = self.get_introspection_client()
-        if request.META.get("HTTP_AUTHORIZATION", "").startswith("Bearer"):
-            token = request.META["HTTP_AUTHORIZATION"][len("Bearer") :].strip()
+        try:
             response = client.post(
                 f"{settings.AUTHORIZATION_SERVER_URL}/o/introspect/",
                 data={"token": token, "platform": "coursera"},
+                timeout=(
+                    settings.AUTHORIZATION_SERVER_CONNECT_TIMEOUT,
+                    settings.AUTHORIZATION_SERVER_READ_TIMEOUT,
+                ),
+            )
+        except RequestException as e:
+            raise IntrospectionError(str(e)) from e
+        if response.status_code != 200:
+            if response.status_code >= 500:
+                raise IntrospectionError(
+                    "Introspection failed with status %d" % response.status_code
+                )
+            return None
+        try:
+            data = response.json()
+            active = data["active"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise IntrospectionError("Invalid introspection response") from e
+        if active:
+            return data
+        return None
+
+    def introspect_and_cache(self, token):
+        """
+        Validate `token` against the Authorization Server, and cache the
+        introspection data if the token is active. Rejected tokens are
+        cached in the negative cache. Nothing is cached if the introspection
+        fails with an IntrospectionError.
+        """
+        data = self.introspect(token)
+        if data is not None:
+            self.cache.set(token, data)
+        else:
+            self.negative_cache.set(token, {"active": False})
+        return data
+
+    def is_well_formed(self, token):
+        """
+        Return whether `token` is a syntactically valid Bearer token.
+        """
+        return len(token) <= self.max_token_length and bool(self.token_re.match(token))
+
+    def get_client_ip(self, request):
+        """
+        Return the IP address of the client. If the request was forwarded by
+        one of the AUTHORIZATION_SERVER_TRUSTED_PROXIES, return the last
+        address in the X-Forwarded-For header that was not added by a trusted
+        proxy, as the addresses before it can be set by the client.
+        """
+        trusted = settings.AUTHORIZATION_SERVER_TRUSTED_PROXIES
+        addresses = [request.META.get("REMOTE_ADDR")] + [
+            address.strip()
+            for address in reversed(
+                request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
             )
-            if response.status_code == 200:
-                data = response.json()
-                if data["active"]:
-                    return User(**data)
+            if address.strip()
+        ]
+        for address in addresses:
+            if address not in trusted:
+                return address
+        return addresses[-1]
+
+    def is_throttled(self, token, ip_address):
+        """
+        Return whether `token`, or `ip_address` if IP addresses are
+        throttled, has too many failed authentication attempts.
+        """
+        return self.throttle.is_throttled(self.cache.make_key(token)) or (
+            settings.AUTHORIZATION_SERVER_IP_THROTTLE
+            and self.ip_throttle.is_throttled(ip_address)
+        )
+
+    def reject(self, token, ip_address):
+        """
+        Record a failed authentication attempt for `token`, and for
+        `ip_address` if IP addresses are throttled.
+        """
+        self.throttle.record_failure(self.cache.make_key(token))
+        if settings.AUTHORIZATION_SERVER_IP_THROTTLE:
+            self.ip_throttle.record_failure(ip_address)
+
+    def get_token(self, request):
+        """
+        Return the Bearer token from the Authorization header, or None if the
+        request does not contain a Bearer token.
+        """
+        if request.META.get("HTTP_AUTHORIZATION", "").startswith("Bearer"):
+            return request.META["HTTP_AUTHORIZATION"][len("Bearer") :].strip()
         return None
+
+    def authenticate(self, request):
+        """
+        Retrieve the access token from the Authorization header, and validate
+        it against the Authorization Server. If the token is active, return a
+        User object with the retreived data.
+
+        Active tokens are cached until they expire, so that subsequent
+        requests with the same token do not require another round trip to the
+        Authorization Server. Concurrent requests with the same token share a
+        single introspection request.
+
+        Malformed tokens, recently rejected tokens, and tokens with too many
+        failed attempts are rejected without a request to the Authorization
+        Server. If AUTHORIZATION_SERVER_IP_THROTTLE is set, so are tokens from
+        an IP address with too many failed attempts.
+
+        If the Authorization Server is unavailable, only this request fails:
+        the token is neither cached as rejected nor counted as a failed
+        attempt.
+        """
+        token = self.get_token(request)
+        if token is None:
+            return None
+        ip_address = self.get_client_ip(request)
+        if not self.is_well_formed(token):
+            self.reject(token, ip_address)
+            return None
+
+        data = self.cache.get(token)
+        if data is None:
+            if self.negative_cache.get(token) is not None or self.is_throttled(
+                token, ip_address
+            ):
+                return None
+            try:
+                data = self.introspections.do(
+                    self.cache.make_key(token), self.introspect_and_cache, token
+                )
+            except IntrospectionError:
+                return None
+            if data is None:
+                self.reject(token, ip_address)
+                return None
+        return User(**data)
+
+
+class SignedTokenBackend(OAuth2Backend):
+    """
+    Django Authentication backend that validates self-contained signed access
+    tokens (JWTs) locally, using the Authorization Server's public key.
+
+    The token must have a valid signature, must not be expired, must contain
+    the required scopes and must contain a list of courses. Opaque tokens
+    are validated against the Authorization Server with token introspection.
+    """
+
+    def is_signed(self, token):
+        """
+        Return whether `token` looks like a signed token rather than an
+        opaque token: it must consist of three segments, the first of which
+        is a JSON header that names the signing algorithm. Opaque tokens that
+        happen to contain two dots are validated with token introspection.
+        """
+        if token.count(".") != 2:
+            return False
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError:
+            return False
+        return "alg" in header
+
+    def decode(self, token):
+        """
+        Verify the signature and expiry of `token`, and check that it carries
+        the required scopes and the courses claim. Return the token's claims
+        if the token is valid, otherwise return None.
+        """
+        try:
+            claims = jwt.decode(
+                token,
+                settings.AUTHORIZATION_SERVER_PUBLIC_KEY,
+                algorithms=settings.AUTHORIZATION_SERVER_TOKEN_ALGORITHMS,
+                audience=settings.AUTHORIZATION_SERVER_TOKEN_AUDIENCE,
+            )
+        except jwt.InvalidTokenError:
+            return None
+        if "exp" not in claims or not isinstance(claims.get("courses"), list):
+            return None
+        scopes = set(claims.get("scope", "").split(" "))
+        if not scopes.issuperset(settings.AUTHORIZATION_SERVER_REQUIRED_SCOPES):
+            return None
+        return claims
+
+    def authenticate(self, request):
+        """
+        Retrieve the access token from the Authorization header. If it is a
+        signed token, validate it locally and return a User object with the
+        token's claims if it is valid. Otherwise, fall back to introspection.
+        """
+        token = self.get_token(request)
+        if token is not None and self.is_signed(token):
+            claims = self.decode(token)
+            if claims is not None:
+                return User(**{**claims, "active": True})
+            return None
+        return super().authenticate(request)
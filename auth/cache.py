@@ -0,0 +1,250 @@
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Event, Lock
+from time import time
+
+from django.core.cache import caches
+
+
+class IntrospectionCache:
+    """
+    Thread-safe LRU cache for the results of token introspection requests.
+
+    Entries are keyed by a hash of the bearer token, so the tokens themselves
+    are never kept in memory or sent to a shared cache. Each entry expires at
+    the token's `exp` timestamp or after `max_ttl` seconds, whichever comes
+    first. When the cache holds more than `max_size` entries, the least
+    recently used entry is evicted.
+
+    If `alias` is set, entries are also stored in the Django cache with that
+    alias, so that results can be shared between worker processes.
+    """
+
+    key_prefix = "introspection"
+
+    def __init__(self, max_size=1024, max_ttl=300, alias=None):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def stats(self):
+        """
+        Return the number of cache hits and misses, and the current size.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    @property
+    def shared_cache(self):
+        """
+        Return the shared Django cache, if configured.
+        """
+        return caches[self.alias] if self.alias else None
+
+    def make_key(self, token):
+        """
+        Return the cache key for `token`.
+        """
+        return "%s:%s" % (self.key_prefix, sha256(token.encode()).hexdigest())
+
+    def get_timeout(self, data):
+        """
+        Return the number of seconds that the introspection result `data` may
+        be cached.
+        """
+        timeout = self.max_ttl
+        if data.get("exp") is not None:
+            timeout = min(timeout, data["exp"] - time())
+        return timeout
+
+    def get(self, token):
+        """
+        Return the cached introspection result for `token`, or None if the
+        token is not in the cache or its entry has expired.
+        """
+        key = self.make_key(token)
+        with self._lock:
+            expires, data = self._entries.get(key, (0, None))
+            if expires > time():
+                self._entries.move_to_end(key)
+            else:
+                self._entries.pop(key, None)
+                data = None
+
+        if data is None and self.shared_cache is not None:
+            data = self.shared_cache.get(key)
+            if data is not None:
+                self._store(key, data)
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, token, data):
+        """
+        Cache the introspection result `data` for `token`.
+        """
+        key = self.make_key(token)
+        timeout = self._store(key, data)
+        if timeout > 0 and self.shared_cache is not None:
+            self.shared_cache.set(key, data, timeout)
+
+    def clear(self):
+        """
+        Remove all entries from the local cache and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def _store(self, key, data):
+        """
+        Store `data` in the local cache and evict the least recently used
+        entries if the cache is full. Return the timeout of the entry.
+        """
+        timeout = self.get_timeout(data)
+        if timeout <= 0:
+            return timeout
+        with self._lock:
+            self._entries[key] = (time() + timeout, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return timeout
+
+
+class Throttle:
+    """
+    Thread-safe fixed-window counter of failed authentication attempts.
+
+    A key (e.g. a hashed token or an IP address) is throttled once `rate`
+    failures have been recorded for it within the current window of `window`
+    seconds. At most `max_size` keys are tracked; the least recently used
+    keys are forgotten first.
+    """
+
+    def __init__(self, rate=20, window=60, max_size=10000):
+        self.rate = rate
+        self.window = window
+        self.max_size = max_size
+        self.failures = 0
+        self.throttled = 0
+        self._windows = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def stats(self):
+        """
+        Return the number of recorded failures and throttled attempts, and
+        the number of tracked keys.
+        """
+        return {
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "size": len(self._windows),
+        }
+
+    def is_throttled(self, key):
+        """
+        Return whether `key` has reached the maximum number of failures in
+        the current window.
+        """
+        with self._lock:
+            start, count = self._windows.get(key, (0, 0))
+            throttled = start + self.window > time() and count >= self.rate
+            if throttled:
+                self.throttled += 1
+            return throttled
+
+    def record_failure(self, key):
+        """
+        Record a failed attempt for `key`.
+        """
+        now = time()
+        with self._lock:
+            start, count = self._windows.get(key, (now, 0))
+            if start + self.window <= now:
+                start, count = now, 0
+            self._windows[key] = (start, count + 1)
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.max_size:
+                self._windows.popitem(last=False)
+            self.failures += 1
+
+    def clear(self):
+        """
+        Forget all keys and reset the counters.
+        """
+        with self._lock:
+            self._windows.clear()
+            self.failures = self.throttled = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into a single call.
+
+    The first thread to call `do()` with a specific key executes the
+    function. Any other threads that call `do()` with the same key while the
+    first call is in flight wait for it to finish, and share its result or
+    exception.
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._lock = Lock()
+
+    @property
+    def stats(self):
+        """
+        Return the number of executed calls and the number of calls that
+        shared the result of another call.
+        """
+        return {"calls": self.calls, "shared": self.shared}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Execute `func` with the given arguments, unless a call with the same
+        `key` is already in flight, in which case wait for and return its
+        result.
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = self.Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
@@ -2,6 +2,8 @@ from django.contrib.auth import authenticate
 from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
 
+from coursera_dashboard.middleware import timing
+
 
 class OAuth2TokenMiddleware(MiddlewareMixin):
     """
@@ -31,7 +33,8 @@ class OAuth2TokenMiddleware(MiddlewareMixin):
         # do something only if request contains a Bearer token
         if request.META.get("HTTP_AUTHORIZATION", "").startswith("Bearer"):
             if not hasattr(request, "user") or request.user.is_anonymous:
-                user = authenticate(request=request)
+                with timing(request, "auth"):
+                    user = authenticate(request=request)
                 if user:
                     # request._user and request._cached_user are used by various internals
                     # of Django and Django REST Framework.
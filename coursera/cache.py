@@ -0,0 +1,285 @@
+import json
+import logging
+from datetime import datetime
+from hashlib import sha256
+from threading import Lock
+from time import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import quote_etag
+from django.utils.timezone import now, utc
+
+from coursera.filters import GenericFilterSet
+from coursera.models import CurrentBranch, DataVersion
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Cache for the serialized responses of the analytics endpoints.
+
+    Keys are stamped with the current data generation, which is incremented
+    by `manage.py refreshviews`, so all entries are invalidated at once when
+    the materialized views are refreshed. The generation is read from the
+    database at most once every `generation_ttl` seconds, along with the time
+    of the last refresh.
+
+    Entries are stored in the Django cache with alias `alias`, so any cache
+    backend can be used. The hit rate is logged every `stats_interval`
+    lookups.
+    """
+
+    key_prefix = "analytics"
+
+    def __init__(self, alias="analytics", generation_ttl=10, stats_interval=1000):
+        self.alias = alias
+        self.generation_ttl = generation_ttl
+        self.stats_interval = stats_interval
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._expires = 0
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        """
+        Return the Django cache in which the entries are stored.
+        """
+        return caches[self.alias]
+
+    @property
+    def stats(self):
+        """
+        Return the number of cache hits and misses, and the hit rate.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0,
+        }
+
+    @property
+    def version(self):
+        """
+        Return the current data generation and the time at which the data was
+        last refreshed.
+        """
+        with self._lock:
+            if self._expires <= time():
+                self._version = DataVersion.objects.get_version()
+                self._expires = time() + self.generation_ttl
+            return self._version
+
+    @property
+    def generation(self):
+        """
+        Return the current data generation.
+        """
+        return self.version[0]
+
+    @property
+    def last_modified(self):
+        """
+        Return the time at which the data was last refreshed.
+        """
+        return self.version[1]
+
+    def get_dates(self, request):
+        """
+        Return a dict with the normalized date filters of `request` that are
+        set.
+        """
+        form = GenericFilterSet(
+            request.GET, DataVersion.objects.none(), request=request
+        ).form
+        form.errors
+        return {
+            name: value.isoformat()
+            for name, value in form.cleaned_data.items()
+            if value is not None
+        }
+
+    def get_day(self, request, view):
+        """
+        Return the current day if the response of `view` to `request` depends
+        on the current time, otherwise return None.
+
+        Views with `depends_on_now` count e.g. the learners that are leaving
+        the course at the end of the timespan, which is the current time
+        unless `to_date` is set.
+        """
+        if view.depends_on_now and "to_date" not in self.get_dates(request):
+            return now().astimezone(utc).date()
+        return None
+
+    def get_last_modified(self, request, view):
+        """
+        Return the time at which the response of `view` to `request` last
+        changed: the last refresh of the data, or the start of the current
+        day if the response depends on the current time.
+        """
+        last_modified = self.last_modified
+        day = self.get_day(request, view)
+        if day is not None:
+            last_modified = max(
+                last_modified, datetime.combine(day, datetime.min.time(), tzinfo=utc)
+            )
+        return last_modified
+
+    def make_key(self, request, view):
+        """
+        Return the cache key for the response of `view` to `request`.
+
+        The key covers the endpoint, the lookup kwargs, the normalized date
+        filters and the courses that the user may see in the response. If
+        the response depends on the current time, the key also covers the
+        current day, so the cached response is recalculated every day.
+        """
+        dates = self.get_dates(request)
+
+        course_id = view.kwargs.get("course_id", view.kwargs.get("pk"))
+        courses = set(request.user.courses)
+        if course_id is not None:
+            courses &= {course_id}
+
+        data = json.dumps(
+            [
+                type(view).__name__,
+                view.action,
+                sorted(view.kwargs.items()),
+                sorted(dates.items()),
+                sorted(courses),
+                self.get_day(request, view),
+            ],
+            default=str,
+        )
+        return "%s:%d:%s" % (
+            self.key_prefix,
+            self.generation,
+            sha256(data.encode()).hexdigest(),
+        )
+
+    def make_etag(self, key):
+        """
+        Return the ETag for the response with cache key `key`.
+        """
+        return quote_etag(sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        """
+        Return the cached response data for `key`, or None if it is not in
+        the cache.
+        """
+        data = self.cache.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            log_stats = (self.hits + self.misses) % self.stats_interval == 0
+        if log_stats:
+            stats = self.stats
+            logger.info(
+                "alias=%s hits=%d misses=%d hit_rate=%.3f",
+                self.alias,
+                stats["hits"],
+                stats["misses"],
+                stats["hit_rate"],
+            )
+        return data
+
+    def set(self, key, data):
+        """
+        Cache the response data `data` for `key`.
+        """
+        self.cache.set(key, data)
+
+    def forget_version(self):
+        """
+        Forget the current data version, so it is read from the database on
+        next use.
+        """
+        with self._lock:
+            self._version = None
+            self._expires = 0
+
+    def clear(self):
+        """
+        Remove all entries from the cache, forget the current data version and
+        reset the counters.
+        """
+        self.cache.clear()
+        self.forget_version()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+response_cache = ResponseCache(
+    settings.ANALYTICS_CACHE_ALIAS,
+    settings.DATA_VERSION_CACHE_TTL,
+    settings.ANALYTICS_CACHE_STATS_INTERVAL,
+)
+
+
+class GenerationCache:
+    """
+    In-process cache of values for the current data generation. Values are
+    built on first use with `build`, which takes a list of keys and returns a
+    dict of values, and all entries are dropped when the materialized views
+    are refreshed.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.generation = None
+        self.entries = {}
+        self._lock = Lock()
+
+    def get_many(self, keys):
+        """
+        Return a dict with the value for each key in `keys`, building the
+        missing values at once.
+        """
+        generation = response_cache.generation
+        with self._lock:
+            if generation != self.generation:
+                self.generation = generation
+                self.entries = {}
+            entries = self.entries
+            missing = [key for key in set(keys) if key not in entries]
+        if missing:
+            built = self.build(missing)
+            with self._lock:
+                entries.update(built)
+        return {key: entries[key] for key in keys}
+
+    def get(self, key):
+        """
+        Return the value for `key`.
+        """
+        return self.get_many([key])[key]
+
+    def clear(self):
+        """
+        Remove all values from the cache.
+        """
+        with self._lock:
+            self.generation = None
+            self.entries = {}
+
+
+# The mapping from courses to their current branch, loaded in full on first
+# use in each data generation.
+current_branches = GenerationCache(CurrentBranch.objects.get_branch_ids)
+
+
+def get_current_branch_id(course_id):
+    """
+    Return the id of the current branch of `course_id`, or None if the
+    course has no branches.
+    """
+    return current_branches.get(course_id)
@@ -1,4 +1,7 @@
+from datetime import time
+
 import django_filters
+from django.utils.timezone import utc
 
 from coursera.models import ClickstreamEvent
 
@@ -29,3 +32,28 @@ class GenericFilterSet(django_filters.FilterSet):
 
     from_date = django_filters.DateTimeFilter(field_name="timestamp", lookup_expr="gte")
     to_date = django_filters.DateTimeFilter(field_name="timestamp", lookup_expr="lte")
+
+
+def get_day_window(data, request=None):
+    """
+    Return the date filters in `data` as a (from_day, to_day) tuple of dates
+    if they align to days, or None if they don't.
+
+    The filters align to days if each of them is either not set or at
+    midnight UTC. Invalid filters are ignored, as they are by the filtersets.
+    from_day is inclusive and to_day is exclusive, so events at exactly
+    midnight on to_day are left out.
+    """
+    form = GenericFilterSet(data, ClickstreamEvent.objects.none(), request=request).form
+    form.errors
+
+    window = []
+    for name in ["from_date", "to_date"]:
+        value = form.cleaned_data.get(name)
+        if value is not None:
+            value = value.astimezone(utc)
+            if value.time() != time(0):
+                return None
+            value = value.date()
+        window.append(value)
+    return tuple(window)
@@ -0,0 +1,171 @@
+from collections import defaultdict
+
+from django.db import connection
+from psycopg2 import sql
+
+__all__ = [
+    "BOOKKEEPING_TABLES",
+    "record_import",
+    "get_fingerprints",
+    "get_table_fingerprints",
+    "get_recorded_fingerprints",
+    "record_fingerprints",
+    "get_view_sources",
+]
+
+# Tables that record the state of the refreshes and imports, rather than
+# data that the materialized views select from.
+BOOKKEEPING_TABLES = [
+    "data_version",
+    "partition_checksums",
+    "partition_fingerprints",
+    "refresh_fingerprints",
+    "refresh_journal",
+    "refresh_runs",
+    "table_imports",
+]
+
+# The fingerprint of a table covers its file node, which TRUNCATE, VACUUM
+# FULL and a restore replace within their transaction, the number of
+# inserted, updated and deleted rows counted by the statistics collector,
+# and its last import by importexport. So any reload or change of its rows,
+# by whatever means, changes it. The counters are only updated some time
+# after a commit, which at worst refreshes the dependent views once more.
+# The partitions of a partitioned table are not fingerprinted separately.
+FINGERPRINTS_QUERY = """
+SELECT
+    pg_class.relname,
+    MD5(
+        concat_ws(
+            ':',
+            relfilenode,
+            COALESCE(n_tup_ins, 0),
+            COALESCE(n_tup_upd, 0),
+            COALESCE(n_tup_del, 0),
+            COALESCE(import_id, 0)
+        )
+    )
+FROM
+    pg_class
+    JOIN pg_namespace ON (pg_class.relnamespace = pg_namespace.oid)
+    LEFT JOIN pg_stat_user_tables ON (pg_class.oid = pg_stat_user_tables.relid)
+    LEFT JOIN table_imports ON (pg_class.oid = table_imports.relid)
+WHERE
+    {}
+"""
+
+VIEW_SOURCES_QUERY = """
+SELECT DISTINCT
+    view.relname,
+    source.relname
+FROM
+    pg_class view
+    JOIN pg_rewrite ON (view.oid = pg_rewrite.ev_class)
+    JOIN pg_depend ON (pg_rewrite.oid = pg_depend.objid)
+    JOIN pg_class source ON (pg_depend.refobjid = source.oid)
+WHERE
+    view.relkind = 'm'
+    AND source.relkind IN ('r', 'p', 'm')
+    AND source.oid != view.oid
+"""
+
+
+def record_import(schema, table):
+    """
+    Record an import into `table` in `schema`, which changes its
+    fingerprint once the current transaction commits.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO table_imports (relid, imported_ts)
+            VALUES (%s::regclass, clock_timestamp())
+            ON CONFLICT (relid) DO UPDATE
+            SET import_id = EXCLUDED.import_id,
+                imported_ts = EXCLUDED.imported_ts
+            """,
+            [
+                sql.SQL("{}.{}")
+                .format(sql.Identifier(schema), sql.Identifier(table))
+                .as_string(cursor.connection)
+            ],
+        )
+
+
+def get_fingerprints():
+    """
+    Return a dict with the current fingerprint of each table, except the
+    bookkeeping tables.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL(FINGERPRINTS_QUERY).format(
+                sql.SQL(
+                    """
+                    nspname = 'public'
+                    AND relkind IN ('r', 'p')
+                    AND NOT relispartition
+                    AND pg_class.relname != ALL(%s)
+                    """
+                )
+            ),
+            [BOOKKEEPING_TABLES],
+        )
+        return dict(cursor.fetchall())
+
+
+def get_table_fingerprints(tables):
+    """
+    Return a dict with the current fingerprint of each table in `tables`,
+    looked up in the search path.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL(FINGERPRINTS_QUERY).format(
+                sql.SQL("pg_class.oid = ANY(%s::regclass[])")
+            ),
+            [list(tables)],
+        )
+        return dict(cursor.fetchall())
+
+
+def get_recorded_fingerprints():
+    """
+    Return a dict with the fingerprint of each table at the last successful
+    refresh.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relation, fingerprint FROM refresh_fingerprints")
+        return dict(cursor.fetchall())
+
+
+def record_fingerprints(fingerprints):
+    """
+    Record the fingerprints in the dict `fingerprints` as those of the last
+    successful refresh.
+    """
+    with connection.cursor() as cursor:
+        for relation, fingerprint in fingerprints.items():
+            cursor.execute(
+                """
+                INSERT INTO refresh_fingerprints (relation, fingerprint, recorded_ts)
+                VALUES (%s, %s, clock_timestamp())
+                ON CONFLICT (relation) DO UPDATE
+                SET fingerprint = EXCLUDED.fingerprint,
+                    recorded_ts = EXCLUDED.recorded_ts
+                """,
+                [relation, fingerprint],
+            )
+
+
+def get_view_sources():
+    """
+    Return a dict with the set of tables and views that each materialized
+    view selects from directly.
+    """
+    sources = defaultdict(set)
+    with connection.cursor() as cursor:
+        cursor.execute(VIEW_SOURCES_QUERY)
+        for view, source in cursor.fetchall():
+            sources[view].add(source)
+    return sources
@@ -0,0 +1,154 @@
+from itertools import groupby
+
+from django.db import connection
+from psycopg2.extras import Json
+
+__all__ = [
+    "PENDING",
+    "RUNNING",
+    "SUCCEEDED",
+    "FAILED",
+    "start_run",
+    "finish_run",
+    "get_unfinished_run",
+    "get_pending_levels",
+    "record_run_fingerprints",
+    "start_view",
+    "finish_view",
+]
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def start_run(levels, refresh_partitions):
+    """
+    Record a new run that refreshes the views in `levels`, a list of (level,
+    views) tuples, and the clickstream partitions if `refresh_partitions` is
+    set. Return the id of the run.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO refresh_runs (start_ts, status, refresh_partitions)
+            VALUES (clock_timestamp(), %s, %s)
+            RETURNING id
+            """,
+            [RUNNING, refresh_partitions],
+        )
+        (run_id,) = cursor.fetchone()
+        for level, views in levels:
+            for view in views:
+                cursor.execute(
+                    """
+                    INSERT INTO refresh_journal (run_id, view, level, status)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    [run_id, view, level, PENDING],
+                )
+    return run_id
+
+
+def finish_run(run_id, status):
+    """
+    Record that the run `run_id` finished with `status`.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE refresh_runs SET status = %s, end_ts = clock_timestamp()
+            WHERE id = %s
+            """,
+            [status, run_id],
+        )
+
+
+def get_unfinished_run():
+    """
+    Return a (run_id, refresh_partitions, fingerprints) tuple for the last
+    run if it did not succeed, or None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id, status, refresh_partitions, fingerprints
+            FROM refresh_runs
+            ORDER BY id DESC
+            LIMIT 1
+            """
+        )
+        run = cursor.fetchone()
+    if run is None or run[1] == SUCCEEDED:
+        return None
+    run_id, _, refresh_partitions, fingerprints = run
+    return run_id, refresh_partitions, fingerprints
+
+
+def get_pending_levels(run_id):
+    """
+    Return a list of (level, views) tuples with the views of the run
+    `run_id` that have not been refreshed yet.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT level, view
+            FROM refresh_journal
+            WHERE run_id = %s AND status != %s
+            ORDER BY level, view
+            """,
+            [run_id, SUCCEEDED],
+        )
+        return [
+            (level, [view for _, view in rows])
+            for level, rows in groupby(cursor.fetchall(), key=lambda row: row[0])
+        ]
+
+
+def record_run_fingerprints(run_id, fingerprints):
+    """
+    Record that the run `run_id` has refreshed the clickstream partitions if
+    necessary, and the table fingerprints to record when the run succeeds.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE refresh_runs SET refresh_partitions = false, fingerprints = %s
+            WHERE id = %s
+            """,
+            [Json(fingerprints), run_id],
+        )
+
+
+def start_view(run_id, view):
+    """
+    Record that the run `run_id` started refreshing `view`.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE refresh_journal
+            SET status = %s, start_ts = clock_timestamp(), end_ts = NULL,
+                duration = NULL, error = NULL
+            WHERE run_id = %s AND view = %s
+            """,
+            [RUNNING, run_id, view],
+        )
+
+
+def finish_view(run_id, view, status, duration, error=None):
+    """
+    Record that the run `run_id` finished refreshing `view` with `status`
+    after `duration` seconds.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE refresh_journal
+            SET status = %s, end_ts = clock_timestamp(), duration = %s, error = %s
+            WHERE run_id = %s AND view = %s
+            """,
+            [status, duration, error, run_id, view],
+        )
@@ -0,0 +1,265 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from psycopg2 import sql
+
+from coursera.fingerprints import record_import
+
+
+class Command(BaseCommand):
+    help = "Import the CSV files of a Coursera research export."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directory", help="Directory of the export, with a CSV file per table."
+        )
+        parser.add_argument(
+            "--table",
+            action="append",
+            dest="tables",
+            help="Only import this table. Can be repeated.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help=(
+                "Number of groups of tables to import in parallel, each over a "
+                "separate connection."
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=8 * 1024 * 1024,
+            help="Number of bytes of a file to send to the database at once.",
+        )
+        parser.add_argument(
+            "--append",
+            action="store_true",
+            help="Append the rows to the tables instead of replacing their rows.",
+        )
+        parser.add_argument(
+            "--schema", default="public", help="Schema of the tables to import into."
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Refresh the materialized views after importing.",
+        )
+
+    def handle(
+        self,
+        *args,
+        directory,
+        tables=None,
+        workers,
+        chunk_size,
+        append=False,
+        schema="public",
+        refresh=False,
+        **kwargs
+    ):
+        """
+        Import each file `<table>.csv` in `directory` into the existing
+        table `<table>` in `schema`. The first line of each file names the
+        columns.
+
+        Each file is streamed to the database with COPY FROM STDIN in chunks
+        of `chunk_size` bytes, so files are never loaded into memory. Tables
+        that reference each other through foreign keys, directly or through
+        other imported tables, form a group that is imported in a single
+        transaction, in which the tables are truncated in one statement
+        unless `append` is set, and referenced tables are imported before
+        the tables that reference them. Queries see either the old or the
+        new rows of a group. Each import is recorded in the same transaction,
+        which changes the fingerprint of the table for `manage.py
+        refreshviews`. Groups are imported in parallel. With `refresh`,
+        refreshes the materialized views with `manage.py refreshviews`.
+        """
+        if not os.path.isdir(directory):
+            raise CommandError("Directory '%s' does not exist." % directory)
+        files = {
+            filename[: -len(".csv")]: os.path.join(directory, filename)
+            for filename in sorted(os.listdir(directory))
+            if filename.endswith(".csv")
+        }
+        if tables:
+            missing = set(tables) - set(files)
+            if missing:
+                raise CommandError("No CSV files for %s." % ", ".join(sorted(missing)))
+            files = {table: files[table] for table in tables}
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT relname
+                FROM pg_class LEFT JOIN pg_namespace ON (pg_class.relnamespace = pg_namespace.oid)
+                WHERE nspname = %s AND relkind IN ('r', 'p')
+                """,
+                [schema],
+            )
+            unknown = set(files) - {relation for (relation,) in cursor.fetchall()}
+        if unknown:
+            raise CommandError("Unknown tables %s." % ", ".join(sorted(unknown)))
+
+        _t0 = time()
+        rows = 0
+        groups = self.get_groups(schema, files)
+        self.stdout.write(
+            "Importing %d tables in %d groups..." % (len(files), len(groups))
+        )
+        if workers == 1:
+            for group in groups:
+                rows += self.import_group(schema, group, files, chunk_size, append)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        self.import_group_in_thread,
+                        schema,
+                        group,
+                        files,
+                        chunk_size,
+                        append,
+                    )
+                    for group in groups
+                ]
+                for future in as_completed(futures):
+                    rows += future.result()
+        _t1 = time()
+        self.stdout.write(
+            "Imported %d rows into %d tables in %.2f seconds (%d rows/s)"
+            % (rows, len(files), _t1 - _t0, rows / max(_t1 - _t0, 0.001))
+        )
+
+        if refresh:
+            call_command("refreshviews", stdout=self.stdout, stderr=self.stderr)
+
+    def get_groups(self, schema, files):
+        """
+        Return a list of groups of the tables in `schema` to import, where
+        the tables of different groups do not reference each other through
+        foreign keys. The tables of each group are sorted so that they only
+        reference tables before them.
+        """
+        references = {table: set() for table in files}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname, parent.relname
+                FROM
+                    pg_constraint
+                    JOIN pg_class child ON (pg_constraint.conrelid = child.oid)
+                    JOIN pg_class parent ON (pg_constraint.confrelid = parent.oid)
+                WHERE
+                    contype = 'f' AND conrelid != confrelid
+                    AND child.relnamespace = %s::regnamespace
+                    AND parent.relnamespace = %s::regnamespace
+                """,
+                [schema, schema],
+            )
+            for table, referenced in cursor.fetchall():
+                if table in references and referenced in references:
+                    references[table].add(referenced)
+
+        # Merge the groups of each table and the tables it references.
+        groups = {table: {table} for table in files}
+        for table, referenced in references.items():
+            for other in referenced:
+                if groups[other] is not groups[table]:
+                    merged = groups[table] | groups[other]
+                    for member in merged:
+                        groups[member] = merged
+
+        ordered_groups = []
+        for group in sorted(set(map(frozenset, groups.values())), key=min):
+            ordered = []
+            while len(ordered) < len(group):
+                level = sorted(
+                    table
+                    for table in group - set(ordered)
+                    if references[table] <= set(ordered)
+                )
+                if not level:
+                    raise CommandError(
+                        "Circular foreign keys between %s."
+                        % ", ".join(sorted(group - set(ordered)))
+                    )
+                ordered.extend(level)
+            ordered_groups.append(ordered)
+        return ordered_groups
+
+    def import_group_in_thread(self, schema, group, files, chunk_size, append):
+        """
+        Import the tables in `group` over this thread's database connection,
+        and return the number of imported rows.
+        """
+        try:
+            return self.import_group(schema, group, files, chunk_size, append)
+        finally:
+            connection.close()
+
+    def import_group(self, schema, group, files, chunk_size, append):
+        """
+        Import the CSV files of the tables in `group` in `schema` in a single
+        transaction, truncating all tables first unless `append` is set, and
+        return the number of imported rows.
+        """
+        rows = 0
+        with transaction.atomic():
+            if not append:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        sql.SQL("TRUNCATE {}").format(
+                            sql.SQL(", ").join(
+                                sql.SQL("{}.{}").format(
+                                    sql.Identifier(schema), sql.Identifier(table)
+                                )
+                                for table in group
+                            )
+                        )
+                    )
+            for table in group:
+                rows += self.import_table(schema, table, files[table], chunk_size)
+        return rows
+
+    def import_table(self, schema, table, path, chunk_size):
+        """
+        Import the CSV file at `path` into `table` in `schema`, and return
+        the number of imported rows. Must run in the transaction of its
+        group.
+        """
+        relation = sql.SQL("{}.{}").format(
+            sql.Identifier(schema), sql.Identifier(table)
+        )
+        self.stdout.write(
+            "Importing table '%s' (%d bytes)..." % (table, os.path.getsize(path))
+        )
+        _t0 = time()
+        with open(path, "rb") as f:
+            # The header is read separately, so the columns of the file
+            # can be in any order.
+            header = f.readline().decode("utf-8-sig")
+            columns = next(csv.reader([header]))
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)")
+                    .format(relation, sql.SQL(", ").join(map(sql.Identifier, columns)))
+                    .as_string(cursor.connection),
+                    f,
+                    size=chunk_size,
+                )
+                rows = cursor.rowcount
+                record_import(schema, table)
+        _t1 = time()
+        self.stdout.write(
+            "Imported %d rows into '%s' in %.2f seconds (%d rows/s)"
+            % (rows, table, _t1 - _t0, rows / max(_t1 - _t0, 0.001))
+        )
+        return rows
@@ -0,0 +1,216 @@
+from datetime import datetime
+from time import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.timezone import now
+
+from coursera.partitions import (
+    PARTITIONED_RELATIONS,
+    create_partition,
+    detach_partition,
+    drop_partition,
+    get_partitions,
+    get_recorded_partition_fingerprints,
+    get_source_fingerprints,
+    get_stale_months,
+    month_start,
+    months_between,
+    next_month,
+    previous_month,
+    record_partition_fingerprint,
+    refresh_partition,
+)
+
+
+def parse_month(value):
+    """
+    Parse a month in the format YYYY-MM, and return its first day.
+    """
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError("Invalid month '%s', expected YYYY-MM." % value)
+
+
+class Command(BaseCommand):
+    help = "Manage the monthly partitions of the clickstream relations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            choices=["list", "create", "refresh", "detach", "drop"],
+            help=(
+                "list the partitions, create or refresh the "
+                "partitions from --from to --to, or detach or drop the "
+                "partitions before --before."
+            ),
+        )
+        parser.add_argument(
+            "--relation",
+            action="append",
+            dest="relations",
+            choices=[relation.name for relation in PARTITIONED_RELATIONS],
+            help="Only manage the partitions of this relation. Can be repeated.",
+        )
+        parser.add_argument(
+            "--from",
+            dest="from_month",
+            type=parse_month,
+            help=(
+                "First month to create or refresh, as YYYY-MM. By default, "
+                "creates the partitions of the last CLICKSTREAM_REFRESH_MONTHS "
+                "months, and refreshes the partitions whose source rows changed."
+            ),
+        )
+        parser.add_argument(
+            "--to",
+            dest="to_month",
+            type=parse_month,
+            help="Last month to create or refresh, as YYYY-MM. Defaults to this month.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="all_months",
+            help="Create or refresh all months with clickstream events.",
+        )
+        parser.add_argument(
+            "--before",
+            type=parse_month,
+            help="Detach or drop the partitions of the months before YYYY-MM.",
+        )
+        parser.add_argument(
+            "--lock-timeout",
+            type=int,
+            default=5,
+            help=(
+                "Number of seconds to wait for each lock while swapping a "
+                "refreshed partition in, before giving up."
+            ),
+        )
+
+    def handle(
+        self,
+        *args,
+        action,
+        relations=None,
+        from_month=None,
+        to_month=None,
+        all_months=False,
+        before=None,
+        lock_timeout=5,
+        **kwargs
+    ):
+        """
+        Run `action` for the partitions of the selected relations.
+
+        Relations are refreshed in dependency order, so the heartbeat and
+        video events of a month are derived from the refreshed clickstream
+        events of that month. Each partition is rebuilt in a new table and
+        swapped in, so queries are only blocked during the swap.
+
+        Without a range of months, only the partitions whose fingerprint of
+        their source rows changed since their last refresh are refreshed:
+        the months in which clickstream events changed, and all months of
+        the relations that select from another changed source, like the
+        heartbeat events, which take their item and module ids from the
+        current course branches. The checksums of the events of each month
+        are only calculated again once the events table changed.
+        """
+        relations = [
+            relation
+            for relation in PARTITIONED_RELATIONS
+            if not relations or relation.name in relations
+        ]
+
+        if action == "list":
+            for relation in relations:
+                for month, name, attached in get_partitions(relation):
+                    self.stdout.write(
+                        "%s %s%s"
+                        % (
+                            name,
+                            month.strftime("%Y-%m"),
+                            "" if attached else " (detached)",
+                        )
+                    )
+            return
+
+        if action in ["detach", "drop"]:
+            if before is None:
+                raise CommandError("--before is required to %s partitions." % action)
+            for relation in reversed(relations):
+                for month, name, attached in get_partitions(relation):
+                    if month >= before or (action == "detach" and not attached):
+                        continue
+                    self.stdout.write("%s partition '%s'" % (action.title(), name))
+                    if action == "detach":
+                        detach_partition(relation, month)
+                    else:
+                        drop_partition(relation, month)
+            return
+
+        if action == "create":
+            months = self.get_months(from_month, to_month, all_months)
+            for relation in relations:
+                for month in months:
+                    name = create_partition(relation, month)
+                    self.stdout.write("Created partition '%s'" % name)
+            return
+
+        changed_only = not (from_month or to_month or all_months)
+        if changed_only:
+            fingerprints = get_source_fingerprints()
+            recorded = get_recorded_partition_fingerprints()
+        else:
+            months = self.get_months(from_month, to_month, all_months)
+            if not months:
+                return
+            if all_months:
+                fingerprints = get_source_fingerprints()
+            else:
+                fingerprints = get_source_fingerprints(
+                    months[0], next_month(months[-1])
+                )
+        for relation in relations:
+            if changed_only:
+                months = get_stale_months(relation, fingerprints, recorded)
+                if not months:
+                    self.stdout.write(
+                        "Partitions of '%s' are up to date" % relation.name
+                    )
+            for month in months:
+                _t0 = time()
+                name = refresh_partition(relation, month, lock_timeout)
+                record_partition_fingerprint(
+                    relation, month, fingerprints.get((relation.name, month))
+                )
+                _t1 = time()
+                self.stdout.write(
+                    "Refreshed partition '%s' in %.2f seconds" % (name, _t1 - _t0)
+                )
+
+    def get_months(self, from_month, to_month, all_months):
+        """
+        Return the months to create or refresh.
+        """
+        if all_months:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT MIN(server_timestamp)::date, MAX(server_timestamp)::date
+                    FROM clickstream_events
+                    """
+                )
+                from_month, to_month = cursor.fetchone()
+            if from_month is None:
+                return []
+        if to_month is None:
+            to_month = now().date()
+        if from_month is None:
+            from_month = month_start(to_month)
+            for _ in range(settings.CLICKSTREAM_REFRESH_MONTHS - 1):
+                from_month = previous_month(from_month)
+        return months_between(from_month, to_month)
@@ -1,10 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import groupby
 from time import time
 
-from django.core.management.base import BaseCommand
-from django.db import connection, transaction
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from psycopg2 import sql
 from psycopg2.extensions import quote_ident
 
+from coursera.fingerprints import (
+    get_fingerprints,
+    get_recorded_fingerprints,
+    get_view_sources,
+    record_fingerprints,
+)
+from coursera.journal import (
+    FAILED,
+    SUCCEEDED,
+    finish_run,
+    finish_view,
+    get_pending_levels,
+    get_unfinished_run,
+    record_run_fingerprints,
+    start_run,
+    start_view,
+)
+from coursera.models import DataVersion
+from coursera.partitions import (
+    PARTITION_NAME_PATTERN,
+    PARTITION_SOURCES,
+    PARTITIONED_RELATIONS,
+)
+
 RECURSIVE_VIEWS_QUERY = """
 WITH RECURSIVE matview_dependencies AS (
     SELECT
@@ -25,7 +53,8 @@ WITH RECURSIVE matview_dependencies AS (
 )
 
 SELECT
-    matviewname
+    matviewname,
+    MAX(level) as "level"
 FROM
     matview_dependencies
 GROUP BY
@@ -34,55 +63,208 @@ ORDER BY
     MAX(level), matviewname
 """
 
+# The fraction of dead tuples estimates the bloat of each table. The
+# partitions of the clickstream relations are only rewritten when their month
+# is refreshed, so they are skipped.
+BLOAT_QUERY = """
+SELECT
+    pg_class.oid,
+    pg_class.relname,
+    COALESCE(n_dead_tup::float / NULLIF(n_live_tup + n_dead_tup, 0), 0) as "dead_fraction"
+FROM
+    pg_class
+    JOIN pg_namespace ON (pg_class.relnamespace = pg_namespace.oid)
+    LEFT JOIN pg_stat_user_tables ON (pg_class.oid = pg_stat_user_tables.relid)
+WHERE
+    nspname = 'public' AND relkind = 'r' AND pg_class.relname !~ %s
+ORDER BY
+    pg_class.relname
+"""
+
 
 class Command(BaseCommand):
     help = "Refresh all materialized views."
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--warm",
+            action="store_true",
+            help="Precompute the analytics of every course after refreshing.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.REFRESH_VIEWS_WORKERS,
+            help=(
+                "Number of materialized views of the same dependency level to "
+                "refresh in parallel, each over a separate connection."
+            ),
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Refresh all materialized views, even if their tables did not change.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the materialized views that would be refreshed, and exit.",
+        )
+        parser.add_argument(
+            "--bloat-threshold",
+            type=float,
+            default=settings.VACUUM_FULL_BLOAT_THRESHOLD,
+            help=(
+                "Fraction of dead tuples above which a table is rewritten with "
+                "VACUUM FULL instead of a plain VACUUM."
+            ),
+        )
+        compaction = parser.add_mutually_exclusive_group()
+        compaction.add_argument(
+            "--compact-only",
+            action="store_true",
+            help="Only compact the tables, without refreshing any views.",
+        )
+        compaction.add_argument(
+            "--skip-compaction",
+            action="store_true",
+            help="Refresh the views without compacting the tables first.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last run from the first view it did not refresh.",
+        )
+
+    def handle(
+        self,
+        *args,
+        warm=False,
+        workers,
+        force=False,
+        dry_run=False,
+        bloat_threshold,
+        compact_only=False,
+        skip_compaction=False,
+        resume=False,
+        **kwargs
+    ):
         """
-        Query the database for all materialized views, sorted topologically
-        based on the dependencies between views. Refreshes each view in order,
-        then performs a VACUUM ANALYZE to update the database statistics.
+        Compare the fingerprint of each table with its fingerprint at the
+        last run to find the tables that changed, and plan to refresh only
+        the materialized views that depend on those tables, directly or
+        through another refreshed view. With `--dry-run`, only prints this
+        plan.
+
+        Compact each table with VACUUM FULL if its fraction of dead tuples
+        exceeds the bloat threshold, or a plain VACUUM otherwise. With
+        `--compact-only`, only compacts the tables.
+
+        Each run and the refresh of each view is recorded in a journal. With
+        `--resume`, continues the last run if it did not succeed, refreshing
+        only the views that it did not refresh.
+
+        Refresh the partitions of the clickstream relations for the months
+        whose source rows changed, if their sources changed. Then
+        query the database for all materialized views, sorted topologically
+        based on the dependencies between views. Refreshes the planned views
+        of each dependency level in parallel, waiting for a level to finish
+        before starting the next, and increments the data generation, then
+        performs a VACUUM ANALYZE to update the database statistics. With
+        `--warm`, precomputes the analytics of the new generation with
+        `manage.py warmanalytics`.
         """
 
         with connection.cursor() as cursor:
-            cursor.execute(
-                sql.SQL(
-                    """
-                    SELECT relname as "relation"
-                    FROM pg_class LEFT JOIN pg_namespace ON (pg_class.relnamespace = pg_namespace.oid)
-                    WHERE nspname = 'public' AND relkind = 'r'
-                    """
-                )
-            )
+            if compact_only:
+                self.compact_tables(cursor, bloat_threshold, dry_run)
+                return
 
-            # VACUUM FULL aggressively reclaims disk space by rewriting the heap
-            # and removing deleted tuples. Requires an exclusive table lock, so only
-            # do this on tables that are not direclty used by the application.
-            # This is necessary to reduce disk usage when tables are frequently
-            # truncated and reimported.
-            for (relation,) in cursor.fetchall():
-                self.stdout.write("Cleaning table '%s'" % relation)
-                _t0 = time()
-                cursor.execute(
-                    sql.SQL("VACUUM FULL {}").format(sql.Identifier(relation))
-                )
-                _t1 = time()
-                self.stdout.write("Finished cleaning in %.2f seconds" % (_t1 - _t0))
+            if resume:
+                run = get_unfinished_run()
+                if run is None:
+                    raise CommandError("There is no unfinished run to resume.")
+                run_id, refresh_partitions, fingerprints = run
+                levels = get_pending_levels(run_id)
+                if dry_run:
+                    self.stdout.write("Would resume run %d" % run_id)
+                    self.print_plan(levels, refresh_partitions)
+                    return
+                self.stdout.write("Resuming run %d..." % run_id)
+            else:
+                recorded = get_recorded_fingerprints()
+                changed = {
+                    relation
+                    for relation, fingerprint in get_fingerprints().items()
+                    if force or recorded.get(relation) != fingerprint
+                }
+                refresh_partitions = force or bool(changed & set(PARTITION_SOURCES))
+                if refresh_partitions:
+                    changed |= {relation.name for relation in PARTITIONED_RELATIONS}
 
-            with transaction.atomic():
                 cursor.execute(RECURSIVE_VIEWS_QUERY)
+                views = cursor.fetchall()
+                levels = self.get_stale_levels(views, changed, force)
 
-                for (view,) in cursor.fetchall():
-                    self.stdout.write("Refreshing materialized view '%s'..." % view)
-                    _t0 = time()
-                    cursor.execute(
-                        sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(
-                            sql.Identifier(view)
+                if dry_run:
+                    if not skip_compaction:
+                        self.compact_tables(cursor, bloat_threshold, dry_run)
+                    self.stdout.write(
+                        "Changed tables: %s" % (", ".join(sorted(changed)) or "none")
+                    )
+                    self.print_plan(levels, refresh_partitions)
+                    self.stdout.write(
+                        "Would skip %d unchanged materialized views"
+                        % (
+                            len(views)
+                            - sum(len(stale_views) for _, stale_views in levels)
                         )
                     )
-                    _t1 = time()
-                    self.stdout.write("Refreshed view in %.2f seconds" % (_t1 - _t0))
+                    return
+
+                if not skip_compaction:
+                    self.compact_tables(cursor, bloat_threshold)
+
+                run_id = start_run(levels, refresh_partitions)
+                fingerprints = None
+
+            if fingerprints is None:
+                if refresh_partitions:
+                    call_command(
+                        "partitions", "refresh", stdout=self.stdout, stderr=self.stderr
+                    )
+                # The tables do not change while the views are refreshed, so
+                # their fingerprints are those of the data in the new views.
+                fingerprints = get_fingerprints()
+                record_run_fingerprints(run_id, fingerprints)
+
+            _t0 = time()
+            try:
+                critical_path = self.refresh_levels(run_id, levels, workers)
+            except BaseException:
+                finish_run(run_id, FAILED)
+                raise
+            _t1 = time()
+            if critical_path:
+                self.stdout.write("Refreshed all views in %.2f seconds" % (_t1 - _t0))
+                self.stdout.write(
+                    "Critical path: %s (%.2f seconds)"
+                    % (
+                        " -> ".join(view for view, _ in critical_path),
+                        sum(duration for _, duration in critical_path),
+                    )
+                )
+            elif not resume:
+                self.stdout.write("All materialized views are up to date")
+
+            # Invalidate the cached analytics, which were calculated from
+            # the previous generation of the materialized views. A resumed
+            # run refreshed views before it was interrupted.
+            if critical_path or resume:
+                DataVersion.objects.bump()
+            record_fingerprints(fingerprints)
+            finish_run(run_id, SUCCEEDED)
+
             self.stdout.write("Updating database statistics...")
             _t0 = time()
             # VACUUM ANALYZE updates PostgreSQL's internal statistics about the database.
@@ -93,3 +275,149 @@ class Command(BaseCommand):
             self.stdout.write(
                 "Updated database statistics in %.2f seconds" % (_t1 - _t0)
             )
+
+        if warm:
+            call_command("warmanalytics", stdout=self.stdout, stderr=self.stderr)
+
+    def compact_tables(self, cursor, bloat_threshold, dry_run=False):
+        """
+        Compact each table in the public schema, and report the bytes
+        reclaimed and the time spent. With `dry_run`, only prints how each
+        table would be compacted.
+        """
+        cursor.execute(BLOAT_QUERY, [PARTITION_NAME_PATTERN])
+
+        # VACUUM FULL aggressively reclaims disk space by rewriting the heap
+        # and removing deleted tuples. Requires an exclusive table lock, so only
+        # do this on tables that are not direclty used by the application, and
+        # only when a large part of the table is dead. Tables that are
+        # truncated and reimported get a new heap without dead tuples, so a
+        # plain VACUUM suffices for them.
+        reclaimed = 0
+        _t0 = time()
+        for oid, relation, dead_fraction in cursor.fetchall():
+            command = "VACUUM FULL" if dead_fraction > bloat_threshold else "VACUUM"
+            if dry_run:
+                self.stdout.write(
+                    "Would %s table '%s' (%.0f%% dead tuples)"
+                    % (command, relation, dead_fraction * 100)
+                )
+                continue
+
+            self.stdout.write(
+                "Cleaning table '%s' with %s (%.0f%% dead tuples)"
+                % (relation, command, dead_fraction * 100)
+            )
+            _t1 = time()
+            cursor.execute("SELECT pg_total_relation_size(%s)", [oid])
+            (size,) = cursor.fetchone()
+            cursor.execute(sql.SQL(command + " {}").format(sql.Identifier(relation)))
+            cursor.execute("SELECT pg_total_relation_size(%s)", [oid])
+            (new_size,) = cursor.fetchone()
+            reclaimed += size - new_size
+            _t2 = time()
+            self.stdout.write(
+                "Finished cleaning in %.2f seconds, reclaimed %d bytes"
+                % (_t2 - _t1, size - new_size)
+            )
+        if not dry_run:
+            self.stdout.write(
+                "Reclaimed %d bytes in %.2f seconds" % (reclaimed, time() - _t0)
+            )
+
+    def get_stale_levels(self, views, changed, force):
+        """
+        Return a list of (level, views) tuples with the materialized views
+        of each dependency level that select from a table in `changed` or
+        from a view that is refreshed before them, or all views if `force`
+        is set. `views` is a list of (view, level) tuples, ordered by level.
+        """
+        sources = get_view_sources()
+        stale = set()
+        levels = []
+        for level, rows in groupby(views, key=lambda row: row[1]):
+            stale_views = [
+                view for view, _ in rows if force or sources[view] & (changed | stale)
+            ]
+            stale.update(stale_views)
+            if stale_views:
+                levels.append((level, stale_views))
+        return levels
+
+    def print_plan(self, levels, refresh_partitions):
+        """
+        Print the materialized views in `levels` that would be refreshed,
+        and whether the clickstream partitions would be refreshed.
+        """
+        if refresh_partitions:
+            self.stdout.write("Would refresh the clickstream partitions")
+        for level, views in levels:
+            self.stdout.write("Would refresh level %d: %s" % (level, ", ".join(views)))
+
+    def refresh_levels(self, run_id, levels, workers):
+        """
+        Refresh the materialized views in `levels` for the run `run_id`, and
+        return the critical path as a list of (view, duration) tuples.
+
+        Views only depend on views of a lower level, so all views of a level
+        can be refreshed at the same time. With barriers between levels, the
+        total time is the sum of the slowest view of each level, which is
+        the critical path.
+        """
+        critical_path = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for level, views in levels:
+                self.stdout.write(
+                    "Refreshing %d materialized views of level %d..."
+                    % (len(views), level)
+                )
+                futures = {
+                    executor.submit(self.refresh_view, run_id, view): view
+                    for view in views
+                }
+                durations = {}
+                failed = []
+                for future in as_completed(futures):
+                    view = futures[future]
+                    try:
+                        durations[view] = future.result()
+                    except Exception as e:
+                        failed.append(view)
+                        self.stderr.write("Failed to refresh view '%s': %s" % (view, e))
+                    else:
+                        self.stdout.write(
+                            "Refreshed view '%s' in %.2f seconds"
+                            % (view, durations[view])
+                        )
+                if failed:
+                    raise CommandError(
+                        "Failed to refresh %s. Continue with --resume."
+                        % ", ".join(sorted(failed))
+                    )
+                critical_path.append(max(durations.items(), key=lambda d: d[1]))
+        return critical_path
+
+    def refresh_view(self, run_id, view):
+        """
+        Refresh the materialized view `view` in its own transaction over
+        this thread's database connection, record the refresh in the journal
+        of the run `run_id`, and return the time it took in seconds.
+        """
+        try:
+            start_view(run_id, view)
+            _t0 = time()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(
+                            sql.Identifier(view)
+                        )
+                    )
+            except Exception as e:
+                finish_view(run_id, view, FAILED, time() - _t0, str(e))
+                raise
+            duration = time() - _t0
+            finish_view(run_id, view, SUCCEEDED, duration)
+            return duration
+        finally:
+            connection.close()
@@ -0,0 +1,177 @@
+import os
+from time import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from coursera.fingerprints import get_fingerprints, record_fingerprints
+from coursera.models import DataVersion
+from coursera.partitions import PARTITION_BOOKKEEPING_TABLES
+from coursera.snapshots import (
+    PREVIOUS_SCHEMA,
+    SHADOW_SCHEMA,
+    analyze_schema,
+    create_shadow_partitioned_relations,
+    create_shadow_schema,
+    create_shadow_tables,
+    create_shadow_view,
+    drop_schema,
+    get_view_definitions,
+    rollback_snapshot,
+    schema_exists,
+    swap_schema,
+    use_schema,
+)
+
+
+class Command(BaseCommand):
+    help = "Build a new snapshot of the data in a shadow schema, and swap it in."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            choices=["build", "swap", "rollback", "discard"],
+            help=(
+                "build a new snapshot from an export directory in the shadow "
+                "schema, swap the shadow snapshot in, roll back to the "
+                "previous snapshot, or discard the previous snapshot."
+            ),
+        )
+        parser.add_argument(
+            "directory",
+            nargs="?",
+            help="Directory of the export to build the snapshot from.",
+        )
+        parser.add_argument(
+            "--swap",
+            action="store_true",
+            help="Swap the new snapshot in after building it.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help=(
+                "Number of groups of tables to import in parallel, each over a "
+                "separate connection."
+            ),
+        )
+        parser.add_argument(
+            "--lock-timeout",
+            type=int,
+            default=5,
+            help=(
+                "Number of seconds to wait for each lock while swapping, "
+                "before giving up."
+            ),
+        )
+
+    def handle(
+        self, *args, action, directory=None, swap=False, workers, lock_timeout, **kwargs
+    ):
+        """
+        Build a complete snapshot of the data in the shadow schema, while the
+        application keeps reading the current snapshot in the public schema:
+        import the export in `directory` into copies of its tables, rebuild
+        the partitioned clickstream relations and all materialized views with
+        their indexes from the new tables, and update their statistics. The
+        fingerprints of the new partitions are recorded in copies of the
+        partition bookkeeping tables in the shadow schema.
+
+        Swapping moves the replaced relations to the previous schema and the
+        relations of the shadow schema to the public schema in one short
+        transaction, so the application sees either snapshot in full, and
+        the partition bookkeeping always describes the partitions in the
+        public schema. A rollback swaps the previous snapshot back in the
+        same way.
+        """
+        if action == "build":
+            if directory is None:
+                raise CommandError("A directory is required to build a snapshot.")
+            self.build(directory, workers)
+            if swap:
+                self.swap(SHADOW_SCHEMA, lock_timeout)
+        elif action == "swap":
+            self.swap(SHADOW_SCHEMA, lock_timeout)
+        elif action == "rollback":
+            self.swap(PREVIOUS_SCHEMA, lock_timeout)
+        else:
+            drop_schema(PREVIOUS_SCHEMA)
+            self.stdout.write("Discarded the previous snapshot")
+
+    def build(self, directory, workers):
+        """
+        Build a new snapshot from the export in `directory` in the shadow
+        schema.
+        """
+        if not os.path.isdir(directory):
+            raise CommandError("Directory '%s' does not exist." % directory)
+        tables = sorted(
+            filename[: -len(".csv")]
+            for filename in os.listdir(directory)
+            if filename.endswith(".csv")
+        )
+        definitions = get_view_definitions()
+
+        _t0 = time()
+        create_shadow_schema()
+        # The shadow schema gets its own partition bookkeeping, which is
+        # swapped in along with the partitions it describes.
+        create_shadow_tables(tables + PARTITION_BOOKKEEPING_TABLES)
+        call_command(
+            "importexport",
+            directory,
+            schema=SHADOW_SCHEMA,
+            workers=workers,
+            stdout=self.stdout,
+            stderr=self.stderr,
+        )
+
+        create_shadow_partitioned_relations()
+        with use_schema(SHADOW_SCHEMA):
+            call_command(
+                "partitions",
+                "refresh",
+                all_months=True,
+                stdout=self.stdout,
+                stderr=self.stderr,
+            )
+            for view, definition, indexes in definitions:
+                self.stdout.write("Creating materialized view '%s'..." % view)
+                _t1 = time()
+                create_shadow_view(view, definition, indexes)
+                _t2 = time()
+                self.stdout.write("Created view in %.2f seconds" % (_t2 - _t1))
+
+        self.stdout.write("Updating statistics of the new snapshot...")
+        analyze_schema(SHADOW_SCHEMA)
+        _t3 = time()
+        self.stdout.write("Built the new snapshot in %.2f seconds" % (_t3 - _t0))
+
+    def swap(self, schema, lock_timeout):
+        """
+        Swap the snapshot in `schema` into the public schema.
+        """
+        if not schema_exists(schema):
+            raise CommandError("There is no snapshot in '%s' to swap in." % schema)
+
+        _t0 = time()
+        if schema == PREVIOUS_SCHEMA:
+            relations = rollback_snapshot(lock_timeout)
+        else:
+            with transaction.atomic():
+                drop_schema(PREVIOUS_SCHEMA)
+                relations = swap_schema(schema, PREVIOUS_SCHEMA, lock_timeout)
+                drop_schema(schema)
+        _t1 = time()
+        self.stdout.write(
+            "Swapped %d relations from '%s' in %.2f seconds"
+            % (len(relations), schema, _t1 - _t0)
+        )
+
+        # Invalidate the cached analytics, which were calculated from the
+        # replaced snapshot, and record that the views match the tables of
+        # the new snapshot.
+        DataVersion.objects.bump()
+        record_fingerprints(get_fingerprints())
@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, reverse
+
+from auth.users import User
+from coursera.cache import response_cache
+from coursera.models import Course
+
+
+class Command(BaseCommand):
+    help = "Precompute the analytics of every course into the response cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course",
+            action="append",
+            dest="courses",
+            help="Only precompute the analytics of this course. Can be repeated.",
+        )
+        parser.add_argument(
+            "--window",
+            action="append",
+            dest="windows",
+            default=[],
+            help=(
+                "Also precompute the analytics for the date window FROM,TO. "
+                "Either date may be empty. Can be repeated."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of courses to precompute in parallel.",
+        )
+        parser.add_argument(
+            "--time-budget",
+            type=float,
+            default=None,
+            help="Stop precomputing analytics after this number of seconds.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help=(
+                "Precompute the analytics even if the analytics cache is local "
+                "to this process."
+            ),
+        )
+
+    def handle(
+        self, *args, courses=None, windows, workers, time_budget, force=False, **kwargs
+    ):
+        """
+        Request the course detail, and the video, quiz and assignment list and
+        detail endpoints of each course, for the default date window and each
+        extra date window. The responses are stored in the response cache
+        under the current data generation, so the first teacher to open a
+        course after a refresh is served from the cache.
+
+        Each course is requested on behalf of a user that can only see that
+        course, which gives the same cache keys as any teacher's request for
+        that course.
+
+        Refuses to run if the analytics cache is local to this process, as
+        the web server would never see the precomputed analytics, unless
+        `force` is set.
+        """
+        if isinstance(response_cache.cache, LocMemCache) and not force:
+            raise CommandError(
+                "The analytics cache is local to this process. Set "
+                "ANALYTICS_CACHE_REDIS_URL to share the cache with the web "
+                "server, or use --force."
+            )
+
+        # The data may have been refreshed by this process, e.g. when chained
+        # from `manage.py refreshviews`.
+        response_cache.forget_version()
+
+        params = [{}]
+        for window in windows:
+            try:
+                from_date, to_date = window.split(",")
+            except ValueError:
+                raise CommandError("Invalid window '%s', expected FROM,TO." % window)
+            params.append(
+                {
+                    name: value
+                    for name, value in [("from_date", from_date), ("to_date", to_date)]
+                    if value
+                }
+            )
+
+        if not courses:
+            courses = Course.objects.filter_current_branch().values_list(
+                "pk", flat=True
+            )
+        courses = sorted(set(courses))
+
+        deadline = time() + time_budget if time_budget is not None else None
+        self.stdout.write(
+            "Precomputing analytics for %d courses and %d date windows "
+            "(generation %d)..."
+            % (len(courses), len(params), response_cache.generation)
+        )
+        _t0 = time()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    lambda course_id: self.warm_course(course_id, params, deadline),
+                    courses,
+                )
+            )
+        _t1 = time()
+
+        self.stdout.write(
+            "Precomputed %d responses in %.2f seconds, %d failed, %d skipped"
+            % (
+                sum(result[0] for result in results),
+                _t1 - _t0,
+                sum(result[1] for result in results),
+                sum(result[2] for result in results),
+            )
+        )
+
+    def make_request(self, path, query, user):
+        """
+        Return a GET request for `path` with the parameters in `query`, on
+        behalf of `user`.
+        """
+        request = HttpRequest()
+        request.method = "GET"
+        request.path = request.path_info = path
+        request.GET = QueryDict(urlencode(query))
+        request.user = request._user = user
+        return request
+
+    def warm_course(self, course_id, params, deadline):
+        """
+        Request all analytics endpoints of `course_id` for each set of query
+        `params`, until `deadline`. Return the number of successful, failed
+        and skipped requests.
+        """
+        user = User(
+            username="warmanalytics",
+            active=True,
+            scope=" ".join(settings.AUTHORIZATION_SERVER_REQUIRED_SCOPES),
+            role="teacher",
+            courses=[course_id],
+        )
+        counts = [0, 0, 0]
+
+        def get(path, query):
+            """
+            Request `path` with `query`, and return the response data, or
+            None if the request failed or was skipped.
+            """
+            if deadline is not None and time() > deadline:
+                counts[2] += 1
+                return None
+            request = self.make_request(path, query, user)
+            match = resolve(path)
+            response = match.func(request, *match.args, **match.kwargs)
+            if response.status_code != 200:
+                self.stderr.write(
+                    "Request for '%s' failed with status %d"
+                    % (path, response.status_code)
+                )
+                counts[1] += 1
+                return None
+            counts[0] += 1
+            return response.data
+
+        _t0 = time()
+        try:
+            for query in params:
+                get(
+                    reverse("coursera-api:course-detail", kwargs={"pk": course_id}),
+                    query,
+                )
+                for name, lookups in [
+                    ("video", ["item_id"]),
+                    ("quiz", ["base_id", "version"]),
+                    ("assignment", ["item_id"]),
+                ]:
+                    items = get(
+                        reverse(
+                            "coursera-api:%s-list" % name,
+                            kwargs={"course_id": course_id},
+                        ),
+                        query,
+                    )
+                    for item in items or []:
+                        kwargs = {lookup: item[lookup] for lookup in lookups}
+                        get(
+                            reverse(
+                                "coursera-api:%s-detail" % name,
+                                kwargs={"course_id": course_id, **kwargs},
+                            ),
+                            query,
+                        )
+        finally:
+            connections.close_all()
+        _t1 = time()
+
+        self.stdout.write(
+            "Precomputed %d responses for course '%s' in %.2f seconds"
+            % (counts[0], course_id, _t1 - _t0)
+        )
+        return counts
@@ -0,0 +1,42 @@
+# Generated by Django 2.1.2 on 2018-11-05 10:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0043_create_indexes")]
+
+    operations = [
+        migrations.RunSQL(
+            # For each course, select the most recently created branch.
+            #
+            # Used to filter the course structure on the current branch with
+            # a join or equality filter instead of a correlated subquery.
+            [
+                """
+                CREATE MATERIALIZED VIEW
+                    course_current_branch_view
+                AS
+                SELECT DISTINCT ON (course_id)
+                    course_id,
+                    course_branch_id
+                FROM
+                    course_branches_view
+                WHERE
+                    course_id IS NOT NULL
+                ORDER BY
+                    course_id,
+                    authoring_course_branch_created_ts DESC NULLS LAST,
+                    course_branch_id
+                """,
+                """
+                CREATE UNIQUE INDEX ON course_current_branch_view (course_id)
+                """,
+                """
+                CREATE UNIQUE INDEX ON course_current_branch_view (course_branch_id)
+                """,
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS course_current_branch_view",
+        )
+    ]
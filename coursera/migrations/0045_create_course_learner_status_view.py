@@ -0,0 +1,84 @@
+# Generated by Django 2.1.2 on 2018-11-05 14:37
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0044_create_course_current_branch_view")]
+
+    operations = [
+        migrations.RunSQL(
+            # For each course and learner, select when the learner first
+            # enrolled as a LEARNER or PRE_ENROLLED_LEARNER, when the learner
+            # first passed the course, and the timestamp and module of the
+            # learner's last activity in the course.
+            #
+            # Used to count leaving learners at any date with a range scan
+            # instead of set differences over the memberships, grades and
+            # last activities.
+            #
+            # course-analytics/
+            # - leaving_learners
+            # - leaving_learners_per_module
+            [
+                """
+                CREATE MATERIALIZED VIEW
+                    course_learner_status_view
+                AS
+                SELECT
+                    MD5(MD5(course_id) || eitdigital_user_id)::varchar(50) AS id,
+                    course_id,
+                    eitdigital_user_id,
+                    memberships.enrollment_ts,
+                    grades.pass_ts,
+                    last_activity_view.course_progress_ts AS last_activity_ts,
+                    course_branch_lessons_view.module_id AS last_module_id
+                FROM
+                    (
+                        SELECT
+                            course_id,
+                            eitdigital_user_id,
+                            MIN(course_membership_ts) AS enrollment_ts
+                        FROM
+                            course_memberships_view
+                        WHERE
+                            course_membership_role IN ('LEARNER', 'PRE_ENROLLED_LEARNER')
+                        GROUP BY
+                            course_id,
+                            eitdigital_user_id
+                    ) memberships
+                    LEFT JOIN (
+                        SELECT
+                            course_id,
+                            eitdigital_user_id,
+                            MIN(course_grade_ts) AS pass_ts
+                        FROM
+                            course_grades_view
+                        WHERE
+                            course_passing_state_desc IN ('passed', 'verified passed')
+                        GROUP BY
+                            course_id,
+                            eitdigital_user_id
+                    ) grades USING (course_id, eitdigital_user_id)
+                    LEFT JOIN last_activity_view USING (course_id, eitdigital_user_id)
+                    LEFT JOIN course_branch_items_view ON (
+                        course_branch_items_view.item_id = last_activity_view.item_id
+                    )
+                    LEFT JOIN course_branch_lessons_view ON (
+                        course_branch_lessons_view.lesson_id = course_branch_items_view.lesson_id
+                    )
+                """,
+                """
+                CREATE UNIQUE INDEX ON course_learner_status_view (id)
+                """,
+                """
+                CREATE INDEX ON course_learner_status_view (course_id, enrollment_ts, pass_ts, last_activity_ts)
+                """,
+                """
+                CREATE INDEX ON course_learner_status_view (last_module_id, last_activity_ts) WHERE pass_ts IS NULL
+                """,
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS course_learner_status_view",
+        )
+    ]
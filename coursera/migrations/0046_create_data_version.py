@@ -0,0 +1,32 @@
+# Generated by Django 2.1.2 on 2018-11-07 09:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0045_create_course_learner_status_view")]
+
+    operations = [
+        migrations.RunSQL(
+            # Single-row table with the generation of the data in the
+            # materialized views. The generation is incremented by
+            # refreshviews after all views have been refreshed.
+            #
+            # Used to invalidate cached analytics.
+            [
+                """
+                CREATE TABLE
+                    data_version
+                (
+                    id integer PRIMARY KEY CHECK (id = 1),
+                    generation integer NOT NULL
+                )
+                """,
+                """
+                INSERT INTO data_version (id, generation) VALUES (1, 1)
+                """,
+            ],
+            reverse_sql="DROP TABLE IF EXISTS data_version",
+        )
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.2 on 2018-11-07 13:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0046_create_data_version")]
+
+    operations = [
+        migrations.RunSQL(
+            # The time at which the materialized views were last refreshed.
+            #
+            # Used for the Last-Modified header of the analytics endpoints.
+            """
+            ALTER TABLE
+                data_version
+            ADD COLUMN
+                refreshed_ts timestamp with time zone NOT NULL DEFAULT now()
+            """,
+            reverse_sql="ALTER TABLE data_version DROP COLUMN refreshed_ts",
+        )
+    ]
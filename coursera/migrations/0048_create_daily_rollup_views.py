@@ -0,0 +1,177 @@
+# Generated by Django 2.1.2 on 2018-11-08 10:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0047_add_data_version_refreshed_ts")]
+
+    operations = [
+        migrations.RunSQL(
+            # For each course and UTC day, count the learner enrollments and
+            # the passing grades. Rows with a NULL day hold the events
+            # without a timestamp.
+            #
+            # Used to count enrolled and finished learners for date windows
+            # that align to days, scanning one row per day instead of the
+            # raw memberships and grades.
+            #
+            # course-analytics/
+            # - enrolled_learners
+            # - finished_learners
+            [
+                """
+                CREATE MATERIALIZED VIEW
+                    course_daily_activity_view
+                AS
+                SELECT
+                    MD5(course_id || ':' || COALESCE(day::text, ''))::varchar(50) AS id,
+                    course_id,
+                    day,
+                    SUM(enrollments)::integer AS enrollments,
+                    SUM(passes)::integer AS passes
+                FROM
+                    (
+                        SELECT
+                            course_id,
+                            (course_membership_ts AT TIME ZONE 'UTC')::date AS day,
+                            COUNT(*) AS enrollments,
+                            0 AS passes
+                        FROM
+                            course_memberships_view
+                        WHERE
+                            course_membership_role IN ('LEARNER', 'PRE_ENROLLED_LEARNER')
+                        GROUP BY
+                            1, 2
+                        UNION ALL
+                        SELECT
+                            course_id,
+                            (course_grade_ts AT TIME ZONE 'UTC')::date AS day,
+                            0 AS enrollments,
+                            COUNT(*) AS passes
+                        FROM
+                            course_grades_view
+                        WHERE
+                            course_passing_state_desc IN ('passed', 'verified passed')
+                        GROUP BY
+                            1, 2
+                    ) activity
+                WHERE
+                    course_id IS NOT NULL
+                GROUP BY
+                    course_id,
+                    day
+                """,
+                """
+                CREATE UNIQUE INDEX ON course_daily_activity_view (id)
+                """,
+                """
+                CREATE INDEX ON course_daily_activity_view (course_id, day, enrollments, passes)
+                """,
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS course_daily_activity_view",
+        ),
+        migrations.RunSQL(
+            # For each item and UTC day, count the discussion questions and
+            # the likes and dislikes.
+            #
+            # video-analytics/
+            # - video_comments
+            # - video_likes
+            # - video_dislikes
+            [
+                """
+                CREATE MATERIALIZED VIEW
+                    item_daily_activity_view
+                AS
+                SELECT
+                    MD5(item_id || ':' || COALESCE(day::text, ''))::varchar(50) AS id,
+                    item_id,
+                    day,
+                    SUM(comments)::integer AS comments,
+                    SUM(likes)::integer AS likes,
+                    SUM(dislikes)::integer AS dislikes
+                FROM
+                    (
+                        SELECT
+                            item_id,
+                            (discussion_question_created_ts AT TIME ZONE 'UTC')::date AS day,
+                            COUNT(*) AS comments,
+                            0 AS likes,
+                            0 AS dislikes
+                        FROM
+                            discussion_questions_view
+                        GROUP BY
+                            1, 2
+                        UNION ALL
+                        SELECT
+                            item_id,
+                            (feedback_ts AT TIME ZONE 'UTC')::date AS day,
+                            0 AS comments,
+                            COUNT(*) FILTER (WHERE feedback_rating = 1) AS likes,
+                            COUNT(*) FILTER (WHERE feedback_rating = 0) AS dislikes
+                        FROM
+                            feedback_item_ratings_view
+                        WHERE
+                            feedback_system = 'LIKE_OR_DISLIKE'
+                        GROUP BY
+                            1, 2
+                    ) activity
+                WHERE
+                    item_id IS NOT NULL
+                GROUP BY
+                    item_id,
+                    day
+                """,
+                """
+                CREATE UNIQUE INDEX ON item_daily_activity_view (id)
+                """,
+                """
+                CREATE INDEX ON item_daily_activity_view (item_id, day, comments, likes, dislikes)
+                """,
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS item_daily_activity_view",
+        ),
+        migrations.RunSQL(
+            # For each item, UTC day and 5-second timecode, count the
+            # heartbeats.
+            #
+            # video-analytics/
+            # - views_over_runtime
+            [
+                """
+                CREATE MATERIALIZED VIEW
+                    heartbeat_daily_counts_view
+                AS
+                SELECT
+                    MD5(item_id || ':' || COALESCE(day::text, '') || ':' || timecode)::varchar(50) AS id,
+                    item_id,
+                    day,
+                    timecode,
+                    count
+                FROM
+                    (
+                        SELECT
+                            item_id,
+                            (server_timestamp AT TIME ZONE 'UTC')::date AS day,
+                            timecode,
+                            COUNT(*)::integer AS count
+                        FROM
+                            heartbeat_events_view
+                        WHERE
+                            item_id IS NOT NULL
+                        GROUP BY
+                            1, 2, 3
+                    ) heartbeats
+                """,
+                """
+                CREATE UNIQUE INDEX ON heartbeat_daily_counts_view (id)
+                """,
+                """
+                CREATE INDEX ON heartbeat_daily_counts_view (item_id, day, timecode, count)
+                """,
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS heartbeat_daily_counts_view",
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.1.2 on 2018-11-09 13:26
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0048_create_daily_rollup_views")]
+
+    operations = [
+        migrations.RunSQL(
+            # Select the clickstream events that start or end a video, with
+            # the item id extracted from the JSON value.
+            #
+            # Used to count the learners that started and finished a video
+            # with an index-only scan, instead of extracting the item id from
+            # every clickstream event of the course.
+            #
+            # video-analytics/
+            # - watched_video
+            # - finished_video
+            [
+                """
+                CREATE MATERIALIZED VIEW
+                    clickstream_video_events_view
+                AS
+                SELECT
+                    id,
+                    course_id,
+                    (value->>'item_id')::varchar(50) AS item_id,
+                    key,
+                    server_timestamp,
+                    hashed_user_id AS eitdigital_user_id
+                FROM
+                    clickstream_events_view
+                WHERE
+                    key IN ('start', 'end')
+                    AND value ? 'item_id'
+                """,
+                """
+                CREATE UNIQUE INDEX ON clickstream_video_events_view (id)
+                """,
+                """
+                CREATE INDEX ON clickstream_video_events_view (course_id, item_id, key, server_timestamp, eitdigital_user_id)
+                """,
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS clickstream_video_events_view",
+        )
+    ]
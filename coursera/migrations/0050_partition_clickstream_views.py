@@ -0,0 +1,309 @@
+# Generated by Django 2.1.2 on 2018-11-12 09:41
+
+from django.db import migrations
+from psycopg2 import sql
+
+UNPARTITIONED = "%s_unpartitioned"
+
+
+def copy_into_partitions(apps, schema_editor):
+    """
+    Create a partition for each month with events, and copy the events of
+    the unpartitioned views into the partitioned tables.
+    """
+    from coursera.partitions import PARTITIONED_RELATIONS, create_partition
+
+    with schema_editor.connection.cursor() as cursor:
+        for relation in PARTITIONED_RELATIONS:
+            source = sql.Identifier(UNPARTITIONED % relation.name)
+            cursor.execute(
+                sql.SQL(
+                    """
+                    SELECT DISTINCT date_trunc('month', server_timestamp)::date
+                    FROM {}
+                    WHERE server_timestamp IS NOT NULL
+                    """
+                ).format(source)
+            )
+            for (month,) in cursor.fetchall():
+                create_partition(relation, month)
+
+            columns = sql.SQL(", ").join(map(sql.Identifier, relation.columns))
+            cursor.execute(
+                sql.SQL(
+                    """
+                    INSERT INTO {} ({})
+                    SELECT {} FROM {} WHERE server_timestamp IS NOT NULL
+                    """
+                ).format(sql.Identifier(relation.name), columns, columns, source)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0049_create_clickstream_video_events_view")]
+
+    operations = [
+        migrations.RunSQL(
+            # Replace the clickstream, heartbeat and video event views with
+            # tables that are partitioned by month on server_timestamp. The
+            # partitions are refreshed one month at a time by
+            # `manage.py partitions`, and queries with a date range only scan
+            # the partitions within that range.
+            #
+            # Events without a server_timestamp cannot be stored in a range
+            # partition, and are left out.
+            [
+                """
+                DROP MATERIALIZED VIEW heartbeat_daily_counts_view
+                """,
+                """
+                ALTER MATERIALIZED VIEW clickstream_events_view RENAME TO clickstream_events_view_unpartitioned
+                """,
+                """
+                ALTER MATERIALIZED VIEW heartbeat_events_view RENAME TO heartbeat_events_view_unpartitioned
+                """,
+                """
+                ALTER MATERIALIZED VIEW clickstream_video_events_view RENAME TO clickstream_video_events_view_unpartitioned
+                """,
+                """
+                CREATE TABLE clickstream_events_view (LIKE clickstream_events_view_unpartitioned)
+                PARTITION BY RANGE (server_timestamp)
+                """,
+                """
+                CREATE TABLE heartbeat_events_view (LIKE heartbeat_events_view_unpartitioned)
+                PARTITION BY RANGE (server_timestamp)
+                """,
+                """
+                CREATE TABLE clickstream_video_events_view (LIKE clickstream_video_events_view_unpartitioned)
+                PARTITION BY RANGE (server_timestamp)
+                """,
+            ],
+            # Drop the partitioned tables with their partitions, and recreate
+            # the views from 0015_create_clickstream_views and
+            # 0049_create_clickstream_video_events_view with the indexes they
+            # had before this migration, and heartbeat_daily_counts_view from
+            # 0048_create_daily_rollup_views on top of them. The views are
+            # populated from the clickstream events, so the later operations
+            # have nothing to reverse. Partitions that were detached by
+            # `manage.py partitions` are kept.
+            reverse_sql=[
+                """
+                DROP TABLE IF EXISTS clickstream_video_events_view
+                """,
+                """
+                DROP TABLE IF EXISTS heartbeat_events_view
+                """,
+                """
+                DROP TABLE IF EXISTS clickstream_events_view
+                """,
+                """
+                CREATE MATERIALIZED VIEW
+                    clickstream_events_view
+                AS
+                SELECT DISTINCT ON (id)
+                    MD5(COALESCE(hashed_user_id, '') || COALESCE(hashed_session_cookie_id, '') || COALESCE(server_timestamp::text, '')
+                        || COALESCE(hashed_ip, '') || COALESCE(user_agent, '') || COALESCE(url, '') || COALESCE(initial_referrer_url, '')
+                        || COALESCE(browser_language, '') || COALESCE(course_id, '') || COALESCE(country_cd, '')
+                        || COALESCE(region_cd, '') || COALESCE(timezone, '') || COALESCE(os, '') || COALESCE(browser, '')
+                        || COALESCE(key, '') || COALESCE(value, ''))::varchar(50) as id,
+                    hashed_user_id,
+                    hashed_session_cookie_id,
+                    server_timestamp,
+                    hashed_ip,
+                    user_agent,
+                    url,
+                    initial_referrer_url,
+                    browser_language,
+                    course_id,
+                    country_cd,
+                    region_cd,
+                    timezone,
+                    os,
+                    browser,
+                    key,
+                    value::jsonb
+                FROM
+                    clickstream_events
+                """,
+                """
+                CREATE UNIQUE INDEX ON clickstream_events_view (id)
+                """,
+                """
+                CREATE INDEX ON clickstream_events_view (course_id)
+                """,
+                """
+                CREATE INDEX ON clickstream_events_view (key)
+                """,
+                """
+                CREATE INDEX ON clickstream_events_view (course_id, key, server_timestamp)
+                """,
+                """
+                CREATE INDEX ON clickstream_events_view (course_id, key, ((value)::jsonb -> 'item_id'), server_timestamp)
+                """,
+                """
+                CREATE MATERIALIZED VIEW
+                    heartbeat_events_view
+                AS
+                WITH latest_branches AS (
+                    SELECT DISTINCT ON (course_id)
+                        course_id, course_branch_id
+                    FROM
+                        course_branches
+                    ORDER BY
+                        course_id, authoring_course_branch_created_ts DESC NULLS LAST
+                )
+                SELECT
+                    id,
+                    course_id,
+                    hashed_user_id as eitdigital_user_id,
+                    hashed_session_cookie_id,
+                    server_timestamp,
+                    hashed_ip,
+                    user_agent,
+                    url,
+                    initial_referrer_url,
+                    browser_language,
+                    country_cd,
+                    region_cd,
+                    timezone,
+                    os,
+                    browser,
+                    MD5(MD5(course_branch_id) || (value->>'module_id'))::varchar(50) as module_id,
+                    MD5(MD5(course_branch_id) || (value->>'item_id'))::varchar(50) as item_id,
+                    (div(((value->>'timecode')::real)::int, 5) * 5)::int as timecode
+                FROM
+                    clickstream_events_view
+                    JOIN latest_branches USING (course_id)
+                WHERE
+                    key = 'heartbeat'
+                """,
+                """
+                CREATE UNIQUE INDEX ON heartbeat_events_view (id)
+                """,
+                """
+                CREATE INDEX ON heartbeat_events_view (course_id)
+                """,
+                """
+                CREATE INDEX ON heartbeat_events_view (module_id)
+                """,
+                """
+                CREATE INDEX ON heartbeat_events_view (eitdigital_user_id)
+                """,
+                """
+                CREATE INDEX ON heartbeat_events_view (item_id, server_timestamp)
+                """,
+                """
+                CREATE INDEX ON heartbeat_events_view (item_id, timecode)
+                """,
+                """
+                CREATE MATERIALIZED VIEW
+                    clickstream_video_events_view
+                AS
+                SELECT
+                    id,
+                    course_id,
+                    (value->>'item_id')::varchar(50) AS item_id,
+                    key,
+                    server_timestamp,
+                    hashed_user_id AS eitdigital_user_id
+                FROM
+                    clickstream_events_view
+                WHERE
+                    key IN ('start', 'end')
+                    AND value ? 'item_id'
+                """,
+                """
+                CREATE UNIQUE INDEX ON clickstream_video_events_view (id)
+                """,
+                """
+                CREATE INDEX ON clickstream_video_events_view (course_id, item_id, key, server_timestamp, eitdigital_user_id)
+                """,
+                """
+                CREATE MATERIALIZED VIEW
+                    heartbeat_daily_counts_view
+                AS
+                SELECT
+                    MD5(item_id || ':' || COALESCE(day::text, '') || ':' || timecode)::varchar(50) AS id,
+                    item_id,
+                    day,
+                    timecode,
+                    count
+                FROM
+                    (
+                        SELECT
+                            item_id,
+                            (server_timestamp AT TIME ZONE 'UTC')::date AS day,
+                            timecode,
+                            COUNT(*)::integer AS count
+                        FROM
+                            heartbeat_events_view
+                        WHERE
+                            item_id IS NOT NULL
+                        GROUP BY
+                            1, 2, 3
+                    ) heartbeats
+                """,
+                """
+                CREATE UNIQUE INDEX ON heartbeat_daily_counts_view (id)
+                """,
+                """
+                CREATE INDEX ON heartbeat_daily_counts_view (item_id, day, timecode, count)
+                """,
+            ],
+        ),
+        migrations.RunPython(copy_into_partitions, migrations.RunPython.noop),
+        migrations.RunSQL(
+            [
+                """
+                DROP MATERIALIZED VIEW clickstream_video_events_view_unpartitioned
+                """,
+                """
+                DROP MATERIALIZED VIEW heartbeat_events_view_unpartitioned
+                """,
+                """
+                DROP MATERIALIZED VIEW clickstream_events_view_unpartitioned
+                """,
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            # Recreate heartbeat_daily_counts_view from
+            # 0048_create_daily_rollup_views on top of the partitioned
+            # heartbeat events.
+            [
+                """
+                CREATE MATERIALIZED VIEW
+                    heartbeat_daily_counts_view
+                AS
+                SELECT
+                    MD5(item_id || ':' || COALESCE(day::text, '') || ':' || timecode)::varchar(50) AS id,
+                    item_id,
+                    day,
+                    timecode,
+                    count
+                FROM
+                    (
+                        SELECT
+                            item_id,
+                            (server_timestamp AT TIME ZONE 'UTC')::date AS day,
+                            timecode,
+                            COUNT(*)::integer AS count
+                        FROM
+                            heartbeat_events_view
+                        WHERE
+                            item_id IS NOT NULL
+                        GROUP BY
+                            1, 2, 3
+                    ) heartbeats
+                """,
+                """
+                CREATE UNIQUE INDEX ON heartbeat_daily_counts_view (id)
+                """,
+                """
+                CREATE INDEX ON heartbeat_daily_counts_view (item_id, day, timecode, count)
+                """,
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS heartbeat_daily_counts_view",
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.2 on 2018-11-13 10:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0050_partition_clickstream_views")]
+
+    operations = [
+        migrations.RunSQL(
+            # Fingerprint of the changes to each table at the last successful
+            # run of refreshviews. Only the materialized views that depend on
+            # a table whose fingerprint changed since are refreshed.
+            [
+                """
+                CREATE TABLE
+                    refresh_fingerprints
+                (
+                    relation varchar(63) PRIMARY KEY,
+                    fingerprint varchar(32) NOT NULL,
+                    recorded_ts timestamp with time zone NOT NULL
+                )
+                """
+            ],
+            reverse_sql="DROP TABLE IF EXISTS refresh_fingerprints",
+        )
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.1.2 on 2018-11-14 08:37
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0051_create_refresh_fingerprints")]
+
+    operations = [
+        migrations.RunSQL(
+            # One row per run of refreshviews. refresh_partitions is cleared
+            # once the clickstream partitions have been refreshed, and
+            # fingerprints holds the table fingerprints to record when the
+            # run succeeds.
+            #
+            # Used to resume an unfinished run.
+            [
+                """
+                CREATE TABLE
+                    refresh_runs
+                (
+                    id serial PRIMARY KEY,
+                    start_ts timestamp with time zone NOT NULL,
+                    end_ts timestamp with time zone,
+                    status varchar(20) NOT NULL,
+                    refresh_partitions boolean NOT NULL,
+                    fingerprints jsonb
+                )
+                """,
+                # One row per materialized view planned in a run, with the
+                # status, timestamps and duration in seconds of its refresh.
+                #
+                # Used to resume an unfinished run, and as a history of the
+                # refresh times of each view.
+                """
+                CREATE TABLE
+                    refresh_journal
+                (
+                    id serial PRIMARY KEY,
+                    run_id integer NOT NULL REFERENCES refresh_runs ON DELETE CASCADE,
+                    view varchar(63) NOT NULL,
+                    level integer NOT NULL,
+                    status varchar(20) NOT NULL,
+                    start_ts timestamp with time zone,
+                    end_ts timestamp with time zone,
+                    duration double precision,
+                    error text,
+                    UNIQUE (run_id, view)
+                )
+                """,
+                """
+                CREATE INDEX ON refresh_journal (view, start_ts)
+                """,
+            ],
+            reverse_sql=[
+                "DROP TABLE IF EXISTS refresh_journal",
+                "DROP TABLE IF EXISTS refresh_runs",
+            ],
+        )
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.1.2 on 2018-11-20 09:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0052_create_refresh_journal")]
+
+    operations = [
+        migrations.RunSQL(
+            # Fingerprint of the source rows of each partition of the
+            # clickstream relations at its last refresh. Only the partitions
+            # whose fingerprint changed since are refreshed.
+            [
+                """
+                CREATE TABLE
+                    partition_fingerprints
+                (
+                    relation varchar(63) NOT NULL,
+                    month date NOT NULL,
+                    fingerprint varchar(32) NOT NULL,
+                    recorded_ts timestamp with time zone NOT NULL,
+                    PRIMARY KEY (relation, month)
+                )
+                """
+            ],
+            reverse_sql="DROP TABLE IF EXISTS partition_fingerprints",
+        )
+    ]
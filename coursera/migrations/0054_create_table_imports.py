@@ -0,0 +1,31 @@
+# Generated by Django 2.1.2 on 2018-11-21 14:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0053_create_partition_fingerprints")]
+
+    operations = [
+        migrations.RunSQL(
+            # The last import of each table by importexport, written in the
+            # transaction of the import. Tables are identified by oid, so the
+            # row follows a table that is moved to another schema, and
+            # import_id is unique over all imports.
+            #
+            # Used in the fingerprints of the tables for refreshviews.
+            [
+                """
+                CREATE TABLE
+                    table_imports
+                (
+                    relid oid PRIMARY KEY,
+                    import_id bigserial NOT NULL,
+                    imported_ts timestamp with time zone NOT NULL
+                )
+                """
+            ],
+            reverse_sql="DROP TABLE IF EXISTS table_imports",
+        )
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.1.2 on 2018-11-22 10:17
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("coursera", "0054_create_table_imports")]
+
+    operations = [
+        migrations.RunSQL(
+            # Checksum of the clickstream events of each month, with the
+            # fingerprint of clickstream_events when they were calculated.
+            # The checksums are only recalculated once the fingerprint of
+            # the table changed.
+            [
+                """
+                CREATE TABLE
+                    partition_checksums
+                (
+                    month date PRIMARY KEY,
+                    checksum text NOT NULL,
+                    source_fingerprint varchar(32) NOT NULL
+                )
+                """
+            ],
+            reverse_sql="DROP TABLE IF EXISTS partition_checksums",
+        )
+    ]
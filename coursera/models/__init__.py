@@ -7,6 +7,8 @@ from .courses import *
 from .discussion import *
 from .feedback import *
 from .grades import *
+from .rollups import *
 from .sessions import *
 from .specializations import *
 from .users import *
+from .versions import *
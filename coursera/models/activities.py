@@ -1,7 +1,11 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models import Count, Q
 
 __all__ = [
     "CourseDuration",
+    "CourseLearnerStatus",
     "CourseProgress",
     "LastActivity",
     "LastActivityPerModule",
@@ -196,3 +200,80 @@ class ModuleFirstActivity(models.Model):
     class Meta:
         managed = False
         db_table = "module_first_activity_view"
+
+
+class CourseLearnerStatusQuerySet(models.QuerySet):
+    def count_leaving_learners(self, to_date, from_date=None):
+        """
+        Return a dict with the number of leaving learners at `to_date` for
+        each course. If `from_date` is set, return the difference in leaving
+        learners between `to_date` and `from_date` instead.
+        """
+        counts = self.filter(enrollment_timestamp__lte=to_date).values_list("course_id")
+        if from_date:
+            counts = counts.annotate(
+                leaving_learners=Count(
+                    "id", filter=CourseLearnerStatus.leaving(to_date)
+                )
+                - Count("id", filter=CourseLearnerStatus.leaving(from_date))
+            )
+        else:
+            counts = counts.annotate(
+                leaving_learners=Count(
+                    "id", filter=CourseLearnerStatus.leaving(to_date)
+                )
+            )
+        return dict(counts.order_by())
+
+
+class CourseLearnerStatus(models.Model):
+    id = models.CharField(max_length=50, primary_key=True)
+    course = models.ForeignKey(
+        "Course",
+        related_name="learner_statuses",
+        on_delete=models.DO_NOTHING,
+        db_column="course_id",
+    )
+    eitdigital_user = models.ForeignKey(
+        "EITDigitalUser",
+        related_name="learner_statuses",
+        on_delete=models.DO_NOTHING,
+        db_column="eitdigital_user_id",
+    )
+    enrollment_timestamp = models.DateTimeField(
+        db_column="enrollment_ts", blank=True, null=True
+    )
+    pass_timestamp = models.DateTimeField(db_column="pass_ts", blank=True, null=True)
+    last_activity_timestamp = models.DateTimeField(
+        db_column="last_activity_ts", blank=True, null=True
+    )
+    last_module = models.ForeignKey(
+        "Module",
+        related_name="learner_statuses",
+        on_delete=models.DO_NOTHING,
+        db_column="last_module_id",
+        blank=True,
+        null=True,
+    )
+
+    objects = CourseLearnerStatusQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = "course_learner_status_view"
+
+    @staticmethod
+    def leaving(date):
+        """
+        Return a Q object that matches learners that had enrolled before
+        `date`, had not passed the course at `date` and had their last
+        activity more than 6 weeks before `date`.
+        """
+        return (
+            Q(enrollment_timestamp__lte=date)
+            & (Q(pass_timestamp__isnull=True) | Q(pass_timestamp__gt=date))
+            & (
+                Q(last_activity_timestamp__isnull=True)
+                | Q(last_activity_timestamp__lte=date - timedelta(weeks=6))
+            )
+        )
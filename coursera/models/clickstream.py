@@ -1,7 +1,7 @@
 from django.contrib.postgres.fields import JSONField
 from django.db import models
 
-__all__ = ["ClickstreamEvent", "Heartbeat"]
+__all__ = ["ClickstreamEvent", "ClickstreamVideoEvent", "Heartbeat"]
 
 
 class ClickstreamEvent(models.Model):
@@ -28,6 +28,19 @@ class ClickstreamEvent(models.Model):
         db_table = "clickstream_events_view"
 
 
+class ClickstreamVideoEvent(models.Model):
+    id = models.CharField(max_length=50, primary_key=True)
+    course_id = models.CharField(max_length=100, blank=True, null=True)
+    item_id = models.CharField(max_length=50)
+    key = models.CharField(max_length=100)
+    server_timestamp = models.DateTimeField(blank=True, null=True)
+    eitdigital_user_id = models.CharField(max_length=100)
+
+    class Meta:
+        managed = False
+        db_table = "clickstream_video_events_view"
+
+
 class Heartbeat(models.Model):
     id = models.CharField(max_length=50, primary_key=True)
     course = models.ForeignKey(
@@ -1,35 +1,47 @@
 from datetime import timedelta
 
 from django.db import models
-from django.db.models import Avg, Count, F, Max, Min, OuterRef, Q, Subquery, Window
+from django.db.models import Avg, Count, Max, Min, OuterRef, Q, Window
 from django.db.models.functions import Coalesce, TruncMonth
 from django.utils.timezone import now
 
-from coursera.utils import AvgSubquery, CountSubquery
+from coursera.utils import AvgSubquery, CountSubquery, SumSubquery
 
-from .activities import CourseDuration, CourseProgress
+from .activities import CourseDuration, CourseLearnerStatus
 from .assessments import ItemQuiz
 from .assignments import ItemPeerAssignment, ItemProgrammingAssignment
 from .course_structure import Item, ItemType, Module
 from .feedback import CourseRating
 from .grades import Grade
+from .rollups import CourseDailyActivity
 from .sessions import OnDemandSession
 from .users import CertificatePayment, CourseMembership
 
-__all__ = ["Course", "Branch"]
+__all__ = ["Course", "Branch", "CurrentBranch"]
 
 
 class CourseQuerySet(models.QuerySet):
     def filter_current_branch(self):
-        return self.filter(
-            branches=Subquery(
-                Branch.objects.filter(course_id=OuterRef("id"))
-                .order_by(F("authoring_course_branch_created_ts").desc(nulls_last=True))
-                .values("pk")[:1]
-            )
+        return self.filter(branches__current__isnull=False)
+
+    def with_daily_activity(self, name, column, window):
+        return self.annotate(
+            **{
+                name: Coalesce(
+                    SumSubquery(
+                        CourseDailyActivity.objects.filter(course_id=OuterRef("pk"))
+                        .within(window)
+                        .values(column),
+                        db_column=column,
+                    ),
+                    0,
+                )
+            }
         )
 
-    def with_enrolled_learners(self, filter):
+    def with_enrolled_learners(self, filter, window=None):
+        if window is not None:
+            return self.with_daily_activity("enrolled_learners", "enrollments", window)
         return self.annotate(
             enrolled_learners=CountSubquery(
                 filter(
@@ -46,28 +58,15 @@ class CourseQuerySet(models.QuerySet):
     def with_leaving_learners(self):  # pragma: no cover
         return self.annotate(
             leaving_learners=CountSubquery(
-                CourseMembership.objects.filter(course_id=OuterRef("pk"))
-                .filter(
-                    role__in=[
-                        CourseMembership.LEARNER,
-                        CourseMembership.PRE_ENROLLED_LEARNER,
-                    ]
-                )
-                .values("eitdigital_user_id")
-                .difference(
-                    Grade.objects.filter(course_id=OuterRef("pk"))
-                    .filter(passing_state__in=[Grade.PASSED, Grade.VERIFIED_PASSED])
-                    .values("eitdigital_user_id")
-                )
-                .difference(
-                    CourseProgress.objects.filter(course_id=OuterRef("pk"))
-                    .filter(timestamp__gt=now() - timedelta(weeks=6))
-                    .values("eitdigital_user_id")
+                CourseLearnerStatus.objects.filter(course_id=OuterRef("pk")).filter(
+                    CourseLearnerStatus.leaving(now())
                 )
             )
         )
 
-    def with_finished_learners(self, filter):
+    def with_finished_learners(self, filter, window=None):
+        if window is not None:
+            return self.with_daily_activity("finished_learners", "passes", window)
         return self.annotate(
             finished_learners=CountSubquery(
                 filter(
@@ -247,3 +246,40 @@ class Branch(models.Model):
     class Meta:
         managed = False
         db_table = "course_branches_view"
+
+
+class CurrentBranchManager(models.Manager):
+    def get_branch_ids(self, course_ids):
+        """
+        Return a dict that maps each course to the id of its current branch,
+        including all courses in `course_ids`, which are mapped to None if
+        they have no branches.
+
+        The whole mapping is returned, so it can be cached in full by
+        `coursera.cache.current_branches`.
+        """
+        branches = dict.fromkeys(course_ids)
+        branches.update(self.values_list("course_id", "branch_id"))
+        return branches
+
+
+class CurrentBranch(models.Model):
+    course = models.OneToOneField(
+        "Course",
+        related_name="current_branch",
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="course_id",
+    )
+    branch = models.OneToOneField(
+        "Branch",
+        related_name="current",
+        on_delete=models.DO_NOTHING,
+        db_column="course_branch_id",
+    )
+
+    objects = CurrentBranchManager()
+
+    class Meta:
+        managed = False
+        db_table = "course_current_branch_view"
@@ -0,0 +1,80 @@
+from django.db import models
+
+__all__ = ["CourseDailyActivity", "HeartbeatDailyCount", "ItemDailyActivity"]
+
+
+class DailyQuerySet(models.QuerySet):
+    def within(self, window):
+        """
+        Filter the daily rows to the days in `window`, a (from_day, to_day)
+        tuple as returned by `coursera.filters.get_day_window()`.
+
+        from_day is inclusive and to_day is exclusive. If neither is set, the
+        rows without a day are included as well, matching an unfiltered
+        query over the raw events.
+        """
+        from_day, to_day = window
+        queryset = self
+        if from_day is not None:
+            queryset = queryset.filter(day__gte=from_day)
+        if to_day is not None:
+            queryset = queryset.filter(day__lt=to_day)
+        return queryset
+
+
+class CourseDailyActivity(models.Model):
+    id = models.CharField(max_length=50, primary_key=True)
+    course = models.ForeignKey(
+        "Course",
+        related_name="daily_activity",
+        on_delete=models.DO_NOTHING,
+        db_column="course_id",
+    )
+    day = models.DateField(blank=True, null=True)
+    enrollments = models.IntegerField()
+    passes = models.IntegerField()
+
+    objects = DailyQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = "course_daily_activity_view"
+
+
+class ItemDailyActivity(models.Model):
+    id = models.CharField(max_length=50, primary_key=True)
+    item = models.ForeignKey(
+        "Item",
+        related_name="daily_activity",
+        on_delete=models.DO_NOTHING,
+        db_column="item_id",
+    )
+    day = models.DateField(blank=True, null=True)
+    comments = models.IntegerField()
+    likes = models.IntegerField()
+    dislikes = models.IntegerField()
+
+    objects = DailyQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = "item_daily_activity_view"
+
+
+class HeartbeatDailyCount(models.Model):
+    id = models.CharField(max_length=50, primary_key=True)
+    item = models.ForeignKey(
+        "Item",
+        related_name="daily_heartbeats",
+        on_delete=models.DO_NOTHING,
+        db_column="item_id",
+    )
+    day = models.DateField(blank=True, null=True)
+    timecode = models.IntegerField()
+    count = models.IntegerField()
+
+    objects = DailyQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = "heartbeat_daily_counts_view"
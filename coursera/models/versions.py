@@ -0,0 +1,41 @@
+from django.db import connection, models
+
+__all__ = ["DataVersion"]
+
+
+class DataVersionManager(models.Manager):
+    def get_version(self):
+        """
+        Return the current data generation and the time at which the data was
+        last refreshed.
+        """
+        return self.values_list("generation", "refreshed_timestamp").get(pk=1)
+
+    def bump(self):
+        """
+        Increment the data generation and record the refresh time,
+        invalidating everything derived from the previous generation.
+
+        The database router does not allow writes through the ORM, so the
+        generation is updated with raw SQL.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE data_version
+                SET generation = generation + 1, refreshed_ts = clock_timestamp()
+                WHERE id = 1
+                """
+            )
+
+
+class DataVersion(models.Model):
+    id = models.IntegerField(primary_key=True)
+    generation = models.IntegerField()
+    refreshed_timestamp = models.DateTimeField(db_column="refreshed_ts")
+
+    objects = DataVersionManager()
+
+    class Meta:
+        managed = False
+        db_table = "data_version"
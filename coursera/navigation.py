@@ -0,0 +1,160 @@
+from collections import namedtuple
+from itertools import groupby
+
+from coursera.cache import GenerationCache
+from coursera.models import Item, ItemQuiz, ItemType
+
+__all__ = [
+    "NavigationIndex",
+    "navigation_indexes",
+    "get_navigation_index",
+    "NO_ITEM",
+    "NO_QUIZ",
+]
+
+NO_ITEM = {"item_id": "", "type": 0, "category": ""}
+NO_QUIZ = {"assessment_id": "", "assessment_version": 0}
+
+PEER_TYPES = [
+    ItemType.PEER,
+    ItemType.PHASED_PEER,
+    ItemType.GRADED_PEER,
+    ItemType.CLOSED_PEER,
+]
+
+
+class Entry(
+    namedtuple(
+        "Entry",
+        ["pk", "item_id", "type", "category", "assessment_id", "assessment_version"],
+    )
+):
+    """
+    An item in the navigation index, with the latest version of its quiz.
+    """
+
+    def as_item(self):
+        """
+        Return the item id, type and category of the item.
+        """
+        return {"item_id": self.item_id, "type": self.type, "category": self.category}
+
+    def as_quiz(self):
+        """
+        Return the base id and version of the latest version of the item's
+        quiz.
+        """
+        return {
+            "assessment_id": self.assessment_id,
+            "assessment_version": self.assessment_version,
+        }
+
+
+class NavigationIndex:
+    """
+    Index of the items in a branch, that maps each item to the next item in
+    its lesson, and to the next lecture, quiz and peer assignment in its
+    lesson.
+
+    The index is built with two queries: one for the items in the branch and
+    one for the latest version of the quizzes in the branch.
+    """
+
+    def __init__(self, branch_id):
+        self.branch_id = branch_id
+        self.next_item = {}
+        self.next_lecture = {}
+        self.next_quiz = {}
+        self.next_assignment = {}
+
+        quizzes = {}
+        for item_pk, base_id, version in (
+            ItemQuiz.objects.filter(item__branch_id=branch_id)
+            .values_list("item_id", "quiz__base_id", "quiz__version")
+            .order_by("item_id", "-quiz__version")
+        ):
+            quizzes.setdefault(item_pk, (base_id, version))
+
+        items = (
+            Item.objects.filter(branch_id=branch_id)
+            .select_related("type")
+            .order_by("lesson_id", "-order")
+        )
+        for _, lesson in groupby(items, key=lambda item: item.lesson_id):
+            following = None
+            lecture = quiz = assignment = None
+            for item in lesson:
+                if (
+                    following is not None
+                    and item.order is not None
+                    and following[0] == item.order + 1
+                ):
+                    self.next_item[item.pk] = following[1]
+                self.next_lecture[item.pk] = lecture
+                self.next_quiz[item.pk] = quiz
+                self.next_assignment[item.pk] = assignment
+
+                entry = Entry(
+                    item.pk,
+                    item.item_id,
+                    item.type_id,
+                    getattr(item.type, "category", None),
+                    *quizzes.get(item.pk, (None, None))
+                )
+                following = (item.order, entry)
+                description = getattr(item.type, "description", None)
+                if description == ItemType.LECTURE:
+                    lecture = entry
+                elif description in PEER_TYPES:
+                    assignment = entry
+                if entry.category == "quiz":
+                    quiz = entry
+
+    @classmethod
+    def build(cls, branch_ids):
+        """
+        Return a dict with the NavigationIndex of each branch in
+        `branch_ids`.
+        """
+        return {branch_id: cls(branch_id) for branch_id in branch_ids}
+
+    def get_next_item(self, item):
+        """
+        Return the entry of the item directly after `item` in its lesson, or
+        None if there is no such item.
+        """
+        return self.next_item.get(item.pk)
+
+    def get_next_lecture(self, item):
+        """
+        Return the entry of the first lecture after `item` in its lesson, or
+        None if there is no such lecture.
+        """
+        return self.next_lecture.get(item.pk)
+
+    def get_next_quiz(self, item):
+        """
+        Return the entry of the first quiz after `item` in its lesson, or None
+        if there is no such quiz.
+        """
+        return self.next_quiz.get(item.pk)
+
+    def get_next_assignment(self, item):
+        """
+        Return the entry of the first peer assignment after `item` in its
+        lesson, or None if there is no such assignment.
+        """
+        return self.next_assignment.get(item.pk)
+
+
+navigation_indexes = GenerationCache(NavigationIndex.build)
+
+
+def get_navigation_index(branch_id):
+    """
+    Return the NavigationIndex for `branch_id`.
+
+    The index is cached until the data generation changes, as the items of a
+    branch are replaced when a new export is imported.
+    """
+    return navigation_indexes.get(branch_id)
@@ -0,0 +1,634 @@
+from collections import namedtuple
+from datetime import date
+from hashlib import md5
+
+from django.db import connection, transaction
+from psycopg2 import sql
+
+from coursera.fingerprints import get_table_fingerprints
+
+__all__ = [
+    "PartitionedRelation",
+    "PARTITIONED_RELATIONS",
+    "PARTITION_NAME_PATTERN",
+    "PARTITION_SOURCES",
+    "PARTITION_BOOKKEEPING_TABLES",
+    "month_start",
+    "next_month",
+    "previous_month",
+    "months_between",
+    "get_partitions",
+    "get_month_checksums",
+    "get_source_fingerprints",
+    "get_recorded_partition_fingerprints",
+    "record_partition_fingerprint",
+    "get_stale_months",
+    "create_partition",
+    "refresh_partition",
+    "detach_partition",
+    "drop_partition",
+]
+
+# Matches the names of the partitions of all partitioned relations.
+PARTITION_NAME_PATTERN = "_[0-9]{6}$"
+
+# Tables that the partitioned relations select from.
+PARTITION_SOURCES = ["clickstream_events", "course_branches"]
+
+# Tables that record the state of the partitions. They describe the
+# partitions in the first schema of the search path that has them, so a
+# snapshot keeps its own copies with its partitions.
+PARTITION_BOOKKEEPING_TABLES = ["partition_checksums", "partition_fingerprints"]
+
+# Source table of which the rows of each month are selected into the
+# partitions of that month. The other sources are selected from in full for
+# every month.
+EVENTS_SOURCE = "clickstream_events"
+
+# Checksum of the rows of a table: the number of rows and the sum of a hash
+# of each row, which does not depend on the order of the rows.
+CHECKSUM = """
+COUNT(*) || ':' || COALESCE(SUM(('x' || LEFT(MD5({table}::text), 15))::bit(60)::bigint), 0)
+"""
+
+PartitionedRelation = namedtuple(
+    "PartitionedRelation", ["name", "columns", "query", "indexes", "sources"]
+)
+
+# Relations that are partitioned by month on server_timestamp, in the order
+# in which they must be refreshed. Each query selects the rows of one month,
+# between %(start)s (inclusive) and %(end)s (exclusive), from the tables in
+# PARTITION_SOURCES listed in its sources.
+PARTITIONED_RELATIONS = [
+    PartitionedRelation(
+        "clickstream_events_view",
+        [
+            "id",
+            "hashed_user_id",
+            "hashed_session_cookie_id",
+            "server_timestamp",
+            "hashed_ip",
+            "user_agent",
+            "url",
+            "initial_referrer_url",
+            "browser_language",
+            "course_id",
+            "country_cd",
+            "region_cd",
+            "timezone",
+            "os",
+            "browser",
+            "key",
+            "value",
+        ],
+        """
+        SELECT DISTINCT ON (id)
+            MD5(COALESCE(hashed_user_id, '') || COALESCE(hashed_session_cookie_id, '') || COALESCE(server_timestamp::text, '')
+                || COALESCE(hashed_ip, '') || COALESCE(user_agent, '') || COALESCE(url, '') || COALESCE(initial_referrer_url, '')
+                || COALESCE(browser_language, '') || COALESCE(course_id, '') || COALESCE(country_cd, '')
+                || COALESCE(region_cd, '') || COALESCE(timezone, '') || COALESCE(os, '') || COALESCE(browser, '')
+                || COALESCE(key, '') || COALESCE(value, ''))::varchar(50) as id,
+            hashed_user_id,
+            hashed_session_cookie_id,
+            server_timestamp,
+            hashed_ip,
+            user_agent,
+            url,
+            initial_referrer_url,
+            browser_language,
+            course_id,
+            country_cd,
+            region_cd,
+            timezone,
+            os,
+            browser,
+            key,
+            value::jsonb
+        FROM
+            clickstream_events
+        WHERE
+            server_timestamp >= %(start)s AND server_timestamp < %(end)s
+        """,
+        [
+            "course_id",
+            "key",
+            "course_id, key, server_timestamp",
+            "course_id, key, ((value)::jsonb -> 'item_id'), server_timestamp",
+        ],
+        ["clickstream_events"],
+    ),
+    PartitionedRelation(
+        "heartbeat_events_view",
+        [
+            "id",
+            "course_id",
+            "eitdigital_user_id",
+            "hashed_session_cookie_id",
+            "server_timestamp",
+            "hashed_ip",
+            "user_agent",
+            "url",
+            "initial_referrer_url",
+            "browser_language",
+            "country_cd",
+            "region_cd",
+            "timezone",
+            "os",
+            "browser",
+            "module_id",
+            "item_id",
+            "timecode",
+        ],
+        """
+        WITH latest_branches AS (
+            SELECT DISTINCT ON (course_id)
+                course_id, course_branch_id
+            FROM
+                course_branches
+            ORDER BY
+                course_id, authoring_course_branch_created_ts DESC NULLS LAST
+        )
+        SELECT
+            id,
+            course_id,
+            hashed_user_id as eitdigital_user_id,
+            hashed_session_cookie_id,
+            server_timestamp,
+            hashed_ip,
+            user_agent,
+            url,
+            initial_referrer_url,
+            browser_language,
+            country_cd,
+            region_cd,
+            timezone,
+            os,
+            browser,
+            MD5(MD5(course_branch_id) || (value->>'module_id'))::varchar(50) as module_id,
+            MD5(MD5(course_branch_id) || (value->>'item_id'))::varchar(50) as item_id,
+            (div(((value->>'timecode')::real)::int, 5) * 5)::int as timecode
+        FROM
+            clickstream_events_view
+            JOIN latest_branches USING (course_id)
+        WHERE
+            key = 'heartbeat'
+            AND server_timestamp >= %(start)s AND server_timestamp < %(end)s
+        """,
+        [
+            "course_id",
+            "module_id",
+            "eitdigital_user_id",
+            "item_id, server_timestamp",
+            "item_id, timecode",
+        ],
+        ["clickstream_events", "course_branches"],
+    ),
+    PartitionedRelation(
+        "clickstream_video_events_view",
+        ["id", "course_id", "item_id", "key", "server_timestamp", "eitdigital_user_id"],
+        """
+        SELECT
+            id,
+            course_id,
+            (value->>'item_id')::varchar(50) AS item_id,
+            key,
+            server_timestamp,
+            hashed_user_id AS eitdigital_user_id
+        FROM
+            clickstream_events_view
+        WHERE
+            key IN ('start', 'end')
+            AND value ? 'item_id'
+            AND server_timestamp >= %(start)s AND server_timestamp < %(end)s
+        """,
+        ["course_id, item_id, key, server_timestamp, eitdigital_user_id"],
+        ["clickstream_events"],
+    ),
+]
+
+
+def month_start(day):
+    """
+    Return the first day of the month of `day`.
+    """
+    return date(day.year, day.month, 1)
+
+
+def next_month(month):
+    """
+    Return the first day of the month after `month`.
+    """
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def previous_month(month):
+    """
+    Return the first day of the month before `month`.
+    """
+    return month_start(date.fromordinal(month_start(month).toordinal() - 1))
+
+
+def months_between(start, end):
+    """
+    Return the first days of the months from `start` up to and including
+    `end`.
+    """
+    months = []
+    month = month_start(start)
+    while month <= end:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def get_partition_name(relation, month):
+    """
+    Return the name of the partition of `relation` for `month`.
+    """
+    return "%s_%s" % (relation.name, month.strftime("%Y%m"))
+
+
+def get_partitions(relation):
+    """
+    Return a sorted list of (month, name, attached) tuples of the partitions
+    of `relation`, including the partitions that have been detached.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT relname, relispartition
+            FROM pg_class
+            WHERE relnamespace = 'public'::regnamespace AND relkind = 'r'
+                AND relname ~ %s
+            ORDER BY relname
+            """,
+            ["^%s%s" % (relation.name, PARTITION_NAME_PATTERN)],
+        )
+        return [
+            (date(int(name[-6:-2]), int(name[-2:]), 1), name, attached)
+            for name, attached in cursor.fetchall()
+        ]
+
+
+def get_month_checksums(start=None, end=None):
+    """
+    Return a dict with the checksum of the events of each month with events,
+    from the month `start` up to but excluding the month `end` if given.
+
+    The checksums of all months are stored with the fingerprint of the
+    events table, and only calculated again once that fingerprint changed,
+    so the events are only read after they were reloaded or changed. The
+    checksums of a range of months are calculated from the events within
+    the range only, and are not stored.
+    """
+    (fingerprint,) = get_table_fingerprints([EVENTS_SOURCE]).values()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT month, checksum, source_fingerprint FROM partition_checksums"
+        )
+        stored = cursor.fetchall()
+        if stored and all(row[2] == fingerprint for row in stored):
+            checksums = {month: checksum for month, checksum, _ in stored}
+        else:
+            cursor.execute(
+                sql.SQL(
+                    """
+                    SELECT date_trunc('month', server_timestamp)::date, {}
+                    FROM {}
+                    WHERE server_timestamp >= COALESCE(%s::date, '-infinity')
+                        AND server_timestamp < COALESCE(%s::date, 'infinity')
+                    GROUP BY 1
+                    """
+                ).format(
+                    sql.SQL(CHECKSUM).format(table=sql.Identifier(EVENTS_SOURCE)),
+                    sql.Identifier(EVENTS_SOURCE),
+                ),
+                [start, end],
+            )
+            checksums = dict(cursor.fetchall())
+            if start is None and end is None:
+                cursor.execute("DELETE FROM partition_checksums")
+                for month, checksum in checksums.items():
+                    cursor.execute(
+                        """
+                        INSERT INTO partition_checksums (month, checksum, source_fingerprint)
+                        VALUES (%s, %s, %s)
+                        """,
+                        [month, checksum, fingerprint],
+                    )
+    return {
+        month: checksum
+        for month, checksum in checksums.items()
+        if (start is None or month >= start) and (end is None or month < end)
+    }
+
+
+def get_source_fingerprints(start=None, end=None):
+    """
+    Return a dict with the fingerprint of the source rows of each month of
+    each partitioned relation, from the month `start` up to but excluding
+    the month `end` if given, keyed by (relation name, month). The
+    fingerprint covers the checksum of the events of the month and of the
+    other sources of the relation, so a partition must be refreshed when its
+    fingerprint changes.
+
+    The other sources are small, and are read in full.
+    """
+    month_checksums = get_month_checksums(start, end)
+    checksums = {}
+    with connection.cursor() as cursor:
+        for source in PARTITION_SOURCES:
+            if source == EVENTS_SOURCE:
+                continue
+            cursor.execute(
+                sql.SQL("SELECT {} FROM {}").format(
+                    sql.SQL(CHECKSUM).format(table=sql.Identifier(source)),
+                    sql.Identifier(source),
+                )
+            )
+            (checksums[source],) = cursor.fetchone()
+
+    fingerprints = {}
+    for relation in PARTITIONED_RELATIONS:
+        for month, checksum in month_checksums.items():
+            parts = [checksum] + [
+                checksums[source]
+                for source in relation.sources
+                if source != EVENTS_SOURCE
+            ]
+            fingerprints[relation.name, month] = md5(
+                ",".join(parts).encode()
+            ).hexdigest()
+    return fingerprints
+
+
+def get_recorded_partition_fingerprints():
+    """
+    Return a dict with the fingerprint of the source rows of each partition
+    at its last refresh, keyed by (relation name, month).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relation, month, fingerprint FROM partition_fingerprints"
+        )
+        return {
+            (relation, month): fingerprint
+            for relation, month, fingerprint in cursor.fetchall()
+        }
+
+
+def record_partition_fingerprint(relation, month, fingerprint):
+    """
+    Record `fingerprint` as the fingerprint of the source rows of the
+    partition of `relation` for `month` at its last refresh. A fingerprint
+    of None, for a month without source rows, removes the recorded one.
+    """
+    with connection.cursor() as cursor:
+        if fingerprint is None:
+            cursor.execute(
+                """
+                DELETE FROM partition_fingerprints
+                WHERE relation = %s AND month = %s
+                """,
+                [relation.name, month],
+            )
+            return
+        cursor.execute(
+            """
+            INSERT INTO partition_fingerprints (relation, month, fingerprint, recorded_ts)
+            VALUES (%s, %s, %s, clock_timestamp())
+            ON CONFLICT (relation, month) DO UPDATE
+            SET fingerprint = EXCLUDED.fingerprint,
+                recorded_ts = EXCLUDED.recorded_ts
+            """,
+            [relation.name, month, fingerprint],
+        )
+
+
+def get_stale_months(relation, fingerprints, recorded):
+    """
+    Return the sorted months of `relation` whose fingerprint in the dict
+    `fingerprints` differs from the one in the dict `recorded`, including
+    the months of which all source rows were removed.
+    """
+    months = {
+        month
+        for name, month in set(fingerprints) | set(recorded)
+        if name == relation.name
+    }
+    return sorted(
+        month
+        for month in months
+        if fingerprints.get((relation.name, month))
+        != recorded.get((relation.name, month))
+    )
+
+
+def _create_indexes(relation, table, cursor):
+    """
+    Create the indexes of the partitions of `relation` on `table`, named
+    after `table`, if they do not exist yet.
+    """
+    cursor.execute(
+        sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} (id)").format(
+            sql.Identifier("%s_id_idx" % table), sql.Identifier(table)
+        )
+    )
+    for i, columns in enumerate(relation.indexes):
+        cursor.execute(
+            sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})").format(
+                sql.Identifier("%s_%d_idx" % (table, i)),
+                sql.Identifier(table),
+                sql.SQL(columns),
+            )
+        )
+
+
+def _rename_indexes(relation, source, target, cursor):
+    """
+    Rename the indexes created by `_create_indexes` on the table `source`
+    after the table `target`.
+    """
+    for suffix in ["id"] + [str(i) for i in range(len(relation.indexes))]:
+        cursor.execute(
+            sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                sql.Identifier("%s_%s_idx" % (source, suffix)),
+                sql.Identifier("%s_%s_idx" % (target, suffix)),
+            )
+        )
+
+
+def create_partition(relation, month):
+    """
+    Create the partition of `relation` for `month` with its indexes, if it
+    does not exist yet. Return the name of the partition.
+    """
+    name = get_partition_name(relation, month)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL(
+                """
+                CREATE TABLE IF NOT EXISTS {} PARTITION OF {}
+                FOR VALUES FROM (%s) TO (%s)
+                """
+            ).format(sql.Identifier(name), sql.Identifier(relation.name)),
+            [month.isoformat(), next_month(month).isoformat()],
+        )
+        _create_indexes(relation, name, cursor)
+    return name
+
+
+def refresh_partition(relation, month, lock_timeout):
+    """
+    Replace the partition of `relation` for `month` with a new table of the
+    rows selected by its query, with its indexes and statistics. Return the
+    name of the partition.
+
+    The new table is filled while queries keep reading the old partition.
+    The old partition is then detached and dropped, and the new table is
+    attached in its place in one short transaction, which waits at most
+    `lock_timeout` seconds for each lock. A partition that was detached is
+    replaced, but not attached.
+
+    The partition is refreshed in the first schema of the search path, so
+    the partitions of a shadow snapshot can be refreshed. Its tables are
+    qualified with that schema, so a table that only exists in a later
+    schema of the search path is never dropped.
+    """
+    name = get_partition_name(relation, month)
+    new_name = "%s_new" % name
+    start, end = month.isoformat(), next_month(month).isoformat()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_schema()")
+        (schema,) = cursor.fetchone()
+
+        with transaction.atomic():
+            cursor.execute(
+                sql.SQL("DROP TABLE IF EXISTS {}.{}").format(
+                    sql.Identifier(schema), sql.Identifier(new_name)
+                )
+            )
+            # The check constraint implies the partition bounds, so attaching
+            # the table does not scan it to validate them.
+            cursor.execute(
+                sql.SQL(
+                    """
+                    CREATE TABLE {}.{} (
+                        LIKE {}.{} INCLUDING DEFAULTS,
+                        CONSTRAINT {} CHECK (
+                            server_timestamp IS NOT NULL
+                            AND server_timestamp >= %s AND server_timestamp < %s
+                        )
+                    )
+                    """
+                ).format(
+                    sql.Identifier(schema),
+                    sql.Identifier(new_name),
+                    sql.Identifier(schema),
+                    sql.Identifier(relation.name),
+                    sql.Identifier("%s_bounds" % new_name),
+                ),
+                [start, end],
+            )
+            cursor.execute(
+                sql.SQL("INSERT INTO {}.{} ({}) ").format(
+                    sql.Identifier(schema),
+                    sql.Identifier(new_name),
+                    sql.SQL(", ").join(map(sql.Identifier, relation.columns)),
+                )
+                + sql.SQL(relation.query),
+                {"start": start, "end": end},
+            )
+            _create_indexes(relation, new_name, cursor)
+            cursor.execute(
+                sql.SQL("ANALYZE {}.{}").format(
+                    sql.Identifier(schema), sql.Identifier(new_name)
+                )
+            )
+
+        with transaction.atomic():
+            cursor.execute("SET LOCAL lock_timeout = %s", ["%ds" % lock_timeout])
+            cursor.execute(
+                """
+                SELECT relispartition
+                FROM pg_class
+                WHERE relnamespace = %s::regnamespace AND relkind = 'r'
+                    AND relname = %s
+                """,
+                [schema, name],
+            )
+            row = cursor.fetchone()
+            attached = row is None or row[0]
+            if row is not None:
+                if row[0]:
+                    cursor.execute(
+                        sql.SQL("ALTER TABLE {}.{} DETACH PARTITION {}.{}").format(
+                            sql.Identifier(schema),
+                            sql.Identifier(relation.name),
+                            sql.Identifier(schema),
+                            sql.Identifier(name),
+                        )
+                    )
+                cursor.execute(
+                    sql.SQL("DROP TABLE {}.{}").format(
+                        sql.Identifier(schema), sql.Identifier(name)
+                    )
+                )
+            cursor.execute(
+                sql.SQL("ALTER TABLE {}.{} RENAME TO {}").format(
+                    sql.Identifier(schema),
+                    sql.Identifier(new_name),
+                    sql.Identifier(name),
+                )
+            )
+            _rename_indexes(relation, new_name, name, cursor)
+            if attached:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        ALTER TABLE {}.{} ATTACH PARTITION {}.{}
+                        FOR VALUES FROM (%s) TO (%s)
+                        """
+                    ).format(
+                        sql.Identifier(schema),
+                        sql.Identifier(relation.name),
+                        sql.Identifier(schema),
+                        sql.Identifier(name),
+                    ),
+                    [start, end],
+                )
+            cursor.execute(
+                sql.SQL("ALTER TABLE {}.{} DROP CONSTRAINT {}").format(
+                    sql.Identifier(schema),
+                    sql.Identifier(name),
+                    sql.Identifier("%s_bounds" % new_name),
+                )
+            )
+    return name
+
+
+def detach_partition(relation, month):
+    """
+    Detach the partition of `relation` for `month`, keeping its rows in a
+    separate table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(relation.name),
+                sql.Identifier(get_partition_name(relation, month)),
+            )
+        )
+
+
+def drop_partition(relation, month):
+    """
+    Drop the partition of `relation` for `month`, whether or not it is
+    attached.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("DROP TABLE IF EXISTS {}").format(
+                sql.Identifier(get_partition_name(relation, month))
+            )
+        )
@@ -1,39 +1,52 @@
 from datetime import timedelta
 from functools import partial
 
-from django.db.models import (
-    Count,
-    DateField,
-    DateTimeField,
-    F,
-    OuterRef,
-    Q,
-    Subquery,
-    Window,
-)
+from django.db import models
+from django.db.models import Count, DateField, DateTimeField, F, OuterRef, Q, Window
 from django.db.models.functions import Coalesce, TruncDate
 from django.utils.functional import cached_property
 from django.utils.timezone import now
 from rest_framework import serializers
 
+from coursera.cache import get_current_branch_id
 from coursera.filters import GenericFilterSet
 from coursera.models import (
     Branch,
     Course,
+    CourseLearnerStatus,
     CourseMembership,
     CourseProgress,
     CourseRating,
     EITDigitalUser,
     Grade,
-    LastActivity,
-    LastActivityPerModule,
     ModuleDuration,
 )
+from coursera.timeseries import (
+    course_time_series,
+    get_course_time_series,
+    get_time_series_window,
+)
 from coursera.utils import AvgSubquery, CountSubquery
 
 __all__ = ["CourseSerializer", "CourseAnalyticsSerializer"]
 
 
+class CourseListSerializer(serializers.ListSerializer):
+    """
+    Serialize a list of courses, calculating the analytics that would
+    otherwise require one or more queries per course in bulk.
+    """
+
+    def to_representation(self, data):
+        """
+        Add the leaving learners and ratings to each course, then serialize
+        the courses.
+        """
+        courses = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.add_bulk_analytics(courses)
+        return super().to_representation(courses)
+
+
 class CourseSerializer(serializers.ModelSerializer):
     """
     Serialize a Course with its basic properties and a few analytics.
@@ -49,6 +62,7 @@ class CourseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Course
+        list_serializer_class = CourseListSerializer
         fields = [
             "id",
             "slug",
@@ -63,9 +77,9 @@ class CourseSerializer(serializers.ModelSerializer):
         ]
 
     specialization = serializers.CharField()
-    enrolled_learners = serializers.IntegerField()
+    enrolled_learners = serializers.SerializerMethodField()
     leaving_learners = serializers.SerializerMethodField()
-    finished_learners = serializers.IntegerField()
+    finished_learners = serializers.SerializerMethodField()
     paying_learners = serializers.IntegerField()
     ratings = serializers.SerializerMethodField()
 
@@ -87,26 +101,27 @@ class CourseSerializer(serializers.ModelSerializer):
             get_filterset, self.context["request"].GET, request=self.context["request"]
         )
 
+    @cached_property
+    def time_series_window(self):
+        """
+        Return the (from_day, to_day) window of the date filters if the
+        analytics can be answered from the in-memory time series, or None.
+
+        Requires the request object to be in the context.
+        """
+        return get_time_series_window(self.context["request"])
+
     def _filter_current_branch(self, course_id):
         """
         Return a filtered queryset with just the current branch for `course_id`.
         """
-        return Branch.objects.filter(
-            pk=Subquery(
-                Branch.objects.filter(course_id=course_id)
-                .order_by(F("authoring_course_branch_created_ts").desc(nulls_last=True))
-                .values("pk")[:1]
-            )
-        )
+        return Branch.objects.filter(pk=get_current_branch_id(course_id))
 
-    def get_leaving_learners(self, obj):
+    def _get_date_range(self):
         """
-        Return the number of members for `obj` that have a LEARNER
-        or PRE_ENROLLED_LEARNER status, have not finished the course
-        and had their last activity more than 6 weeks before to_date,
-        or today if the to_date filter isn't set. If from_date is set,
-        calculate the difference in leaving learners between to_date and
-        from_date.
+        Return the from_date and to_date filters. If the to_date filter isn't
+        set or is before from_date, return from_date or the current time as
+        to_date instead.
         """
         form = GenericFilterSet(
             self.context["request"].GET,
@@ -123,57 +138,97 @@ class CourseSerializer(serializers.ModelSerializer):
         if from_date and from_date > to_date:
             to_date = from_date
 
-        if from_date:
-            past_leavers = (
-                CourseMembership.objects.filter(course_id=obj.pk)
-                .filter(timestamp__lte=from_date)
-                .filter(
-                    role__in=[
-                        CourseMembership.LEARNER,
-                        CourseMembership.PRE_ENROLLED_LEARNER,
-                    ]
-                )
-                .values("eitdigital_user_id")
-                .difference(
-                    Grade.objects.filter(course_id=obj.pk)
-                    .filter(timestamp__lte=from_date)
-                    .filter(passing_state__in=[Grade.PASSED, Grade.VERIFIED_PASSED])
-                    .values("eitdigital_user_id")
-                )
-                .difference(
-                    LastActivity.objects.filter(course_id=obj.pk)
-                    .filter(timestamp__gt=from_date - timedelta(weeks=6))
-                    .values("eitdigital_user_id")
-                )
-                .count()
-            )
-        else:
-            past_leavers = 0
+        return from_date, to_date
 
-        return (
-            CourseMembership.objects.filter(course_id=obj.pk)
-            .filter(timestamp__lte=to_date)
+    def _count_leaving_learners(self, course_ids):
+        """
+        Return a dict with the number of leaving learners for each course in
+        `course_ids`.
+        """
+        from_date, to_date = self._get_date_range()
+        leaving_learners = CourseLearnerStatus.objects.filter(
+            course_id__in=course_ids
+        ).count_leaving_learners(to_date, from_date)
+        return {
+            course_id: leaving_learners.get(course_id, 0) for course_id in course_ids
+        }
+
+    def _get_ratings(self, course_ids):
+        """
+        Return a dict with a list of (rating, count) tuples, ordered by
+        rating, for each course in `course_ids`.
+        """
+        if self.time_series_window is not None:
+            return {
+                course_id: time_series.get_ratings(self.time_series_window)
+                for course_id, time_series in course_time_series.get_many(
+                    course_ids
+                ).items()
+            }
+
+        ratings = {course_id: [] for course_id in course_ids}
+        for course_id, rating, count in (
+            self.filter(CourseRating.objects.filter(course_id__in=course_ids))
             .filter(
-                role__in=[
-                    CourseMembership.LEARNER,
-                    CourseMembership.PRE_ENROLLED_LEARNER,
+                feedback_system__in=[
+                    CourseRating.NPS_FIRST_WEEK,
+                    CourseRating.NPS_END_OF_COURSE,
                 ]
             )
-            .values("eitdigital_user_id")
-            .difference(
-                Grade.objects.filter(course_id=obj.pk)
-                .filter(timestamp__lte=to_date)
-                .filter(passing_state__in=[Grade.PASSED, Grade.VERIFIED_PASSED])
-                .values("eitdigital_user_id")
-            )
-            .difference(
-                LastActivity.objects.filter(course_id=obj.pk)
-                .filter(timestamp__gt=to_date - timedelta(weeks=6))
-                .values("eitdigital_user_id")
+            .values_list("course_id", "rating")
+            .annotate(Count("id"))
+            .order_by("course_id", "rating")
+        ):
+            ratings[course_id].append((rating, count))
+        return ratings
+
+    def add_bulk_analytics(self, courses):
+        """
+        Calculate the leaving learners and ratings for all `courses` at once,
+        and add them to the course objects.
+        """
+        course_ids = {course.pk for course in courses}
+        leaving_learners = self._count_leaving_learners(course_ids)
+        ratings = self._get_ratings(course_ids)
+        for course in courses:
+            course.leaving_learners = leaving_learners[course.pk]
+            course.ratings = list(ratings[course.pk])
+
+    def get_enrolled_learners(self, obj):
+        """
+        Return the number of learners enrolled in `obj` within the given
+        timespan, annotated by the view or read from the time series.
+        """
+        try:
+            return obj.enrolled_learners
+        except AttributeError:
+            return get_course_time_series(obj.pk).enrollments.count(
+                self.time_series_window
             )
-            .count()
-            - past_leavers
-        )
+
+    def get_finished_learners(self, obj):
+        """
+        Return the number of learners that passed `obj` within the given
+        timespan, annotated by the view or read from the time series.
+        """
+        try:
+            return obj.finished_learners
+        except AttributeError:
+            return get_course_time_series(obj.pk).passes.count(self.time_series_window)
+
+    def get_leaving_learners(self, obj):
+        """
+        Return the number of members for `obj` that have a LEARNER
+        or PRE_ENROLLED_LEARNER status, have not finished the course
+        and had their last activity more than 6 weeks before to_date,
+        or today if the to_date filter isn't set. If from_date is set,
+        calculate the difference in leaving learners between to_date and
+        from_date.
+        """
+        try:
+            return obj.leaving_learners
+        except AttributeError:
+            return self._count_leaving_learners([obj.pk])[obj.pk]
 
     def get_ratings(self, obj):
         """
@@ -183,18 +238,7 @@ class CourseSerializer(serializers.ModelSerializer):
         try:
             ratings = obj.ratings
         except AttributeError:
-            ratings = list(
-                self.filter(CourseRating.objects.filter(course_id=obj.pk))
-                .filter(
-                    feedback_system__in=[
-                        CourseRating.NPS_FIRST_WEEK,
-                        CourseRating.NPS_END_OF_COURSE,
-                    ]
-                )
-                .values_list("rating")
-                .annotate(Count("id"))
-                .order_by("rating")
-            )
+            ratings = self._get_ratings([obj.pk])[obj.pk]
         missing = set(range(1, 11)) - {rating for rating, _ in ratings}
         for i in missing:
             ratings.insert(i - 1, (i, 0))
@@ -240,7 +284,7 @@ class CourseAnalyticsSerializer(CourseSerializer):
     quizzes = serializers.IntegerField()
     assignments = serializers.IntegerField()
     videos = serializers.IntegerField()
-    cohorts = serializers.IntegerField()
+    cohorts = serializers.SerializerMethodField()
     finished_learners_over_time = serializers.SerializerMethodField()
     leaving_learners_per_module = serializers.SerializerMethodField()
     average_time = serializers.SerializerMethodField()
@@ -248,6 +292,16 @@ class CourseAnalyticsSerializer(CourseSerializer):
     geo_data = serializers.SerializerMethodField()
     cohort_list = serializers.SerializerMethodField()
 
+    def get_cohorts(self, obj):
+        """
+        Return the number of cohorts of `obj` that started within the given
+        timespan, annotated by the view or read from the time series.
+        """
+        try:
+            return obj.cohorts
+        except AttributeError:
+            return get_course_time_series(obj.pk).cohorts.count(self.time_series_window)
+
     def get_finished_learners_over_time(self, obj):
         """
         For each date, show the cumulative number of students that has passed
@@ -281,30 +335,18 @@ class CourseAnalyticsSerializer(CourseSerializer):
         haven't passed the course and whose activity furtherst in the course
         was in that module.
         """
-        form = GenericFilterSet(
-            self.context["request"].GET,
-            CourseMembership.objects.none(),
-            request=self.context["request"],
-        ).form
-        form.errors
-        from_date = form.cleaned_data.get("from_date")
-        to_date = form.cleaned_data.get("to_date")
-
-        if not to_date:
-            to_date = now()
-
-        if from_date and from_date > to_date:
-            to_date = from_date
+        from_date, to_date = self._get_date_range()
 
+        leavers = CourseLearnerStatus.objects.filter(
+            last_module_id=OuterRef("pk"), pass_timestamp__isnull=True
+        )
         subquery = CountSubquery(
-            LastActivityPerModule.objects.filter(module_id=OuterRef("pk")).filter(
-                timestamp__lt=to_date - timedelta(weeks=6)
-            )
+            leavers.filter(last_activity_timestamp__lt=to_date - timedelta(weeks=6))
         )
         if from_date:
             subquery -= CountSubquery(
-                LastActivityPerModule.objects.filter(module_id=OuterRef("pk")).filter(
-                    timestamp__lt=from_date - timedelta(weeks=6)
+                leavers.filter(
+                    last_activity_timestamp__lt=from_date - timedelta(weeks=6)
                 )
             )
 
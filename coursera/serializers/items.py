@@ -1,18 +1,22 @@
 from functools import partial
 
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Sum
 from django.db.models.functions import Coalesce
 from django.utils.functional import cached_property
 from rest_framework import serializers
 
-from coursera.filters import ClickstreamEventFilterSet, GenericFilterSet
+from coursera.filters import ClickstreamEventFilterSet, GenericFilterSet, get_day_window
 from coursera.models import (
-    ClickstreamEvent,
+    ClickstreamVideoEvent,
     DiscussionQuestion,
+    HeartbeatDailyCount,
     Item,
+    ItemDailyActivity,
     ItemGrade,
     ItemRating,
 )
+from coursera.navigation import NO_ITEM, get_navigation_index
+from coursera.timeseries import get_branch_time_series, get_time_series_window
 
 __all__ = [
     "ItemSerializer",
@@ -128,6 +132,82 @@ class VideoAnalyticsSerializer(ItemSerializer):
             get_filterset, self.context["request"].GET, request=self.context["request"]
         )
 
+    @cached_property
+    def day_window(self):
+        """
+        Return the (from_day, to_day) window of the date filters if they
+        align to days, or None if the raw events must be filtered instead.
+
+        Requires the request object to be in the context.
+        """
+        return get_day_window(
+            self.context["request"].GET, request=self.context["request"]
+        )
+
+    @cached_property
+    def time_series_window(self):
+        """
+        Return the (from_day, to_day) window of the date filters if the
+        analytics can be answered from the in-memory time series, or None.
+
+        Requires the request object to be in the context.
+        """
+        return get_time_series_window(self.context["request"])
+
+    def _add_watchers(self, obj):
+        """
+        Add the number of unique learners that have started and finished
+        watching the video within the given timespan to `obj`, counted in a
+        single pass over the video events.
+        """
+        watchers = self.clickstream_filter(
+            ClickstreamVideoEvent.objects.filter(
+                course_id=obj.branch_id, item_id=obj.item_id, key__in=["start", "end"]
+            )
+        ).aggregate(
+            watched_video=Coalesce(
+                Count("eitdigital_user_id", distinct=True, filter=Q(key="start")), 0
+            ),
+            finished_video=Coalesce(
+                Count("eitdigital_user_id", distinct=True, filter=Q(key="end")), 0
+            ),
+        )
+        obj.watched_video = watchers["watched_video"]
+        obj.finished_video = watchers["finished_video"]
+
+    def _add_ratings(self, obj):
+        """
+        Add the number of likes and dislikes on the video within the given
+        timespan to `obj`, counted in a single pass over the item ratings, or
+        from the time series or daily rollups if the timespan aligns to days.
+        """
+        if self.time_series_window is not None:
+            time_series = get_branch_time_series(obj.branch_id)
+            ratings = {
+                "video_likes": time_series.count("likes", obj, self.time_series_window),
+                "video_dislikes": time_series.count(
+                    "dislikes", obj, self.time_series_window
+                ),
+            }
+        elif self.day_window is not None:
+            ratings = (
+                ItemDailyActivity.objects.filter(item=obj)
+                .within(self.day_window)
+                .aggregate(
+                    video_likes=Coalesce(Sum("likes"), 0),
+                    video_dislikes=Coalesce(Sum("dislikes"), 0),
+                )
+            )
+        else:
+            ratings = self.filter(
+                ItemRating.objects.filter(item=obj, system="LIKE_OR_DISLIKE")
+            ).aggregate(
+                video_likes=Coalesce(Count("rating", filter=Q(rating=1)), 0),
+                video_dislikes=Coalesce(Count("rating", filter=Q(rating=0)), 0),
+            )
+        obj.video_likes = ratings["video_likes"]
+        obj.video_dislikes = ratings["video_dislikes"]
+
     def get_watched_video(self, obj):
         """
         Return the number of unique learners that have started watching the
@@ -136,17 +216,8 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.watched_video
         except AttributeError:
-            return self.clickstream_filter(
-                ClickstreamEvent.objects.filter(
-                    course_id=obj.branch_id, value__item_id=obj.item_id, key="start"
-                )
-            ).aggregate(
-                watchers_for_video=Coalesce(
-                    Count("eitdigital_user_id", distinct=True), 0
-                )
-            )[
-                "watchers_for_video"
-            ]
+            self._add_watchers(obj)
+            return obj.watched_video
 
     def get_finished_video(self, obj):
         """
@@ -156,17 +227,8 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.finished_video
         except AttributeError:
-            return self.clickstream_filter(
-                ClickstreamEvent.objects.filter(
-                    course_id=obj.branch_id, value__item_id=obj.item_id, key="end"
-                )
-            ).aggregate(
-                watchers_for_video=Coalesce(
-                    Count("eitdigital_user_id", distinct=True), 0
-                )
-            )[
-                "watchers_for_video"
-            ]
+            self._add_watchers(obj)
+            return obj.finished_video
 
     def get_video_comments(self, obj):
         """
@@ -175,6 +237,18 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.video_comments
         except AttributeError:
+            if self.time_series_window is not None:
+                return get_branch_time_series(obj.branch_id).count(
+                    "comments", obj, self.time_series_window
+                )
+            if self.day_window is not None:
+                return (
+                    ItemDailyActivity.objects.filter(item=obj)
+                    .within(self.day_window)
+                    .aggregate(video_comments=Coalesce(Sum("comments"), 0))[
+                        "video_comments"
+                    ]
+                )
             return self.filter(DiscussionQuestion.objects.filter(item=obj)).aggregate(
                 video_comments=Coalesce(Count("pk"), 0)
             )["video_comments"]
@@ -186,11 +260,8 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.video_likes
         except AttributeError:
-            return self.filter(
-                ItemRating.objects.filter(item=obj, system="LIKE_OR_DISLIKE")
-            ).aggregate(video_likes=Coalesce(Count("rating", filter=Q(rating=1)), 0))[
-                "video_likes"
-            ]
+            self._add_ratings(obj)
+            return obj.video_likes
 
     def get_video_dislikes(self, obj):
         """
@@ -199,11 +270,8 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.video_dislikes
         except AttributeError:
-            return self.filter(
-                ItemRating.objects.filter(item=obj, system="LIKE_OR_DISLIKE")
-            ).aggregate(video_likes=Coalesce(Count("rating", filter=Q(rating=0)), 0))[
-                "video_likes"
-            ]
+            self._add_ratings(obj)
+            return obj.video_dislikes
 
     def get_next_item(self, obj):
         """
@@ -215,46 +283,28 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.next_item_id
         except AttributeError:
-            try:
-                item = Item.objects.get(
-                    branch=obj.branch, lesson=obj.lesson, order=obj.order + 1
-                )
-                if item.type.category == "quiz":
-                    passing_fraction = (
-                        item.item_grades.aggregate(
-                            passing_fraction=Count(
-                                "id",
-                                filter=Q(
-                                    passing_state__in=[
-                                        ItemGrade.PASSED,
-                                        ItemGrade.VERIFIED_PASSED,
-                                    ]
-                                ),
-                            )
-                        )["passing_fraction"]
-                        / item.item_grades.aggregate(passing_fraction=Count("id"))[
-                            "passing_fraction"
-                        ]
-                    )
-                    return {
-                        "item_id": item.item_id,
-                        "type": item.type.id,
-                        "category": item.type.category,
-                        "assessment_id": getattr(
-                            item.quizzes.order_by("-version").first(), "base_id", None
+            entry = get_navigation_index(obj.branch_id).get_next_item(obj)
+            if entry is None:
+                return NO_ITEM
+            if entry.category == "quiz":
+                grades = ItemGrade.objects.filter(item_id=entry.pk).aggregate(
+                    passed=Count(
+                        "id",
+                        filter=Q(
+                            passing_state__in=[
+                                ItemGrade.PASSED,
+                                ItemGrade.VERIFIED_PASSED,
+                            ]
                         ),
-                        "assessment_version": getattr(
-                            item.quizzes.order_by("-version").first(), "version", None
-                        ),
-                        "passing_fraction": passing_fraction,
-                    }
+                    ),
+                    total=Count("id"),
+                )
                 return {
-                    "item_id": item.item_id,
-                    "type": item.type.id,
-                    "category": item.type.category,
+                    **entry.as_item(),
+                    **entry.as_quiz(),
+                    "passing_fraction": grades["passed"] / grades["total"],
                 }
-            except Item.DoesNotExist:
-                return {"item_id": "", "type": 0, "category": ""}
+            return entry.as_item()
 
     def get_next_video(self, obj):
         """
@@ -263,20 +313,10 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.next_video_id
         except AttributeError:
-            try:
-                item = Item.objects.filter(
-                    branch=obj.branch,
-                    lesson=obj.lesson,
-                    order__gt=obj.order,
-                    type__id=1,
-                ).order_by("order")[0]
-                return {
-                    "item_id": item.item_id,
-                    "type": item.type.id,
-                    "category": item.type.category,
-                }
-            except IndexError:
-                return {"item_id": "", "type": 0, "category": ""}
+            entry = get_navigation_index(obj.branch_id).get_next_lecture(obj)
+            if entry is None:
+                return NO_ITEM
+            return entry.as_item()
 
     def get_views_over_runtime(self, obj):
         """
@@ -286,6 +326,14 @@ class VideoAnalyticsSerializer(ItemSerializer):
         try:
             return obj.views_over_runtime
         except AttributeError:
+            if self.day_window is not None:
+                return list(
+                    HeartbeatDailyCount.objects.filter(item=obj)
+                    .within(self.day_window)
+                    .values_list("timecode")
+                    .annotate(count=Sum("count"))
+                    .order_by("timecode")
+                )
             return list(
                 self.clickstream_filter(
                     obj.heartbeats.values_list("timecode")
@@ -336,17 +384,10 @@ class AssignmentAnalyticsSerializer(ItemSerializer):
         try:
             return obj.next_item_id
         except AttributeError:
-            try:
-                item = Item.objects.get(
-                    branch=obj.branch, lesson=obj.lesson, order=obj.order + 1
-                )
-                return {
-                    "item_id": item.item_id,
-                    "type": item.type.id,
-                    "category": item.type.category,
-                }
-            except Item.DoesNotExist:
-                return {"item_id": "", "type": 0, "category": ""}
+            entry = get_navigation_index(obj.branch_id).get_next_item(obj)
+            if entry is None:
+                return NO_ITEM
+            return entry.as_item()
 
     def get_next_assignment(self, obj):
         """
@@ -355,14 +396,7 @@ class AssignmentAnalyticsSerializer(ItemSerializer):
         try:
             return obj.next_video_id
         except AttributeError:
-            try:
-                item = Item.peer_assignment_objects.filter(
-                    branch=obj.branch, lesson=obj.lesson, order__gt=obj.order
-                ).order_by("order")[0]
-                return {
-                    "item_id": item.item_id,
-                    "type": item.type.id,
-                    "category": item.type.category,
-                }
-            except IndexError:
-                return {"item_id": "", "type": 0, "category": ""}
+            entry = get_navigation_index(obj.branch_id).get_next_assignment(obj)
+            if entry is None:
+                return NO_ITEM
+            return entry.as_item()
@@ -1,20 +1,14 @@
 from functools import partial
 
-from django.db.models import Avg, Count, DecimalField, FloatField, Max, Min, OuterRef, Q
+from django.db.models import Avg, Count, DecimalField, FloatField, Max, Min, Q
 from django.db.models.functions import Cast, Coalesce
 from django.utils.functional import cached_property
 from rest_framework import serializers
 
 from coursera.filters import GenericFilterSet
-from coursera.models import (
-    Attempt,
-    DiscussionQuestion,
-    Item,
-    ItemGrade,
-    ItemRating,
-    Quiz,
-)
-from coursera.utils import CountSubquery, NullIf
+from coursera.models import Attempt, DiscussionQuestion, ItemGrade, ItemRating, Quiz
+from coursera.navigation import NO_ITEM, NO_QUIZ, get_navigation_index
+from coursera.utils import NullIf, histogram
 
 __all__ = ["QuizSerializer", "QuizAnalyticsSerializer"]
 
@@ -161,22 +155,12 @@ class QuizAnalyticsSerializer(QuizSerializer):
         on the quiz within the given timespan. Every day on which a user
         submitted at least one response is counted as an attempt.
         """
-        return list(
+        return histogram(
             self.filter(Attempt.objects.filter(quiz=obj))
-            .annotate(
-                number_of_attempts=CountSubquery(
-                    GenericFilterSet(
-                        self.context["request"].GET,
-                        Attempt.objects.filter(
-                            quiz_id=OuterRef("quiz_id"),
-                            eitdigital_user_id=OuterRef("eitdigital_user_id"),
-                        ),
-                    ).qs
-                )
-            )
-            .values_list("number_of_attempts")
-            .order_by("number_of_attempts")
-            .annotate(num_people=Count("number_of_attempts"))
+            .values("eitdigital_user_id")
+            .annotate(number_of_attempts=Count("timestamp"))
+            .order_by(),
+            "number_of_attempts",
         )
 
     def get_correct_ratio_per_question(self, obj):
@@ -274,6 +258,16 @@ class QuizAnalyticsSerializer(QuizSerializer):
             ).annotate(count=Count("eitdigital_user_id"))
         )
 
+    def _get_item(self, obj):
+        """
+        Return the item of the quiz, or None if the quiz has no item.
+        """
+        try:
+            return obj.item
+        except AttributeError:
+            obj.item = next(iter(obj.items.all()), None)
+            return obj.item
+
     def get_next_item(self, obj):
         """
         Return the next item in the lesson, if any.
@@ -281,19 +275,13 @@ class QuizAnalyticsSerializer(QuizSerializer):
         try:
             return obj.next_item_id
         except AttributeError:
-            try:
-                item = Item.objects.get(
-                    branch=obj.items.all()[0].branch,
-                    lesson=obj.items.all()[0].lesson,
-                    order=obj.items.all()[0].order + 1,
-                )
-                return {
-                    "item_id": item.item_id,
-                    "type": item.type.id,
-                    "category": item.type.category,
-                }
-            except Item.DoesNotExist:
-                return {"item_id": "", "type": 0, "category": ""}
+            item = self._get_item(obj)
+            if item is None:
+                return NO_ITEM
+            entry = get_navigation_index(item.branch_id).get_next_item(item)
+            if entry is None:
+                return NO_ITEM
+            return entry.as_item()
 
     def get_next_quiz(self, obj):
         """
@@ -302,20 +290,10 @@ class QuizAnalyticsSerializer(QuizSerializer):
         try:
             return obj.next_video_id
         except AttributeError:
-            try:
-                item = Item.objects.filter(
-                    branch=obj.items.all()[0].branch,
-                    lesson=obj.items.all()[0].lesson,
-                    order__gt=obj.items.all()[0].order,
-                    type__category="quiz",
-                ).order_by("order")[0]
-                return {
-                    "assessment_id": getattr(
-                        item.quizzes.order_by("-version").first(), "base_id", None
-                    ),
-                    "assessment_version": getattr(
-                        item.quizzes.order_by("-version").first(), "version", None
-                    ),
-                }
-            except IndexError:
-                return {"assessment_id": "", "assessment_version": 0}
+            item = self._get_item(obj)
+            if item is None:
+                return NO_QUIZ
+            entry = get_navigation_index(item.branch_id).get_next_quiz(item)
+            if entry is None:
+                return NO_QUIZ
+            return entry.as_quiz()
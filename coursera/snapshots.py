@@ -0,0 +1,323 @@
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from psycopg2 import sql
+
+from coursera.partitions import PARTITIONED_RELATIONS
+
+__all__ = [
+    "SHADOW_SCHEMA",
+    "PREVIOUS_SCHEMA",
+    "qualified",
+    "use_schema",
+    "create_shadow_schema",
+    "create_shadow_tables",
+    "create_shadow_partitioned_relations",
+    "get_view_definitions",
+    "create_shadow_view",
+    "analyze_schema",
+    "swap_schema",
+    "rollback_snapshot",
+    "schema_exists",
+    "drop_schema",
+]
+
+# Schema in which a new snapshot of the data is built, while the
+# application keeps reading the current snapshot in the public schema.
+SHADOW_SCHEMA = "coursera_shadow"
+
+# Schema with the previous snapshot after a swap, to roll back to.
+PREVIOUS_SCHEMA = "coursera_previous"
+
+# Schema that holds the replaced snapshot during a rollback.
+ROLLBACK_SCHEMA = "coursera_rollback"
+
+# All materialized views with their indexes, in the order in which they can
+# be created. The definitions only qualify the names that are not visible
+# in the search path. Each index is described by its name, uniqueness,
+# access method, the definition of each column and its predicate, so it can
+# be created on a view in another schema.
+VIEW_DEFINITIONS_QUERY = """
+WITH RECURSIVE matview_dependencies AS (
+    SELECT
+        matviewname,
+        0 as "level"
+    FROM
+        pg_matviews
+    WHERE
+        schemaname = 'public'
+    UNION ALL
+    SELECT
+        child.matviewname,
+        parent.level + 1 as "level"
+    FROM
+        matview_dependencies parent
+        JOIN pg_depend ON (parent.matviewname::regclass::oid = pg_depend.refobjid)
+        JOIN pg_rewrite ON (pg_depend.objid = pg_rewrite.oid)
+        JOIN pg_matviews child ON (pg_rewrite.ev_class = child.matviewname::regclass::oid)
+    WHERE parent.matviewname != child.matviewname AND child.schemaname = 'public'
+)
+
+SELECT
+    matviewname,
+    pg_get_viewdef(matviewname::regclass),
+    (
+        SELECT COALESCE(
+            json_agg(
+                json_build_object(
+                    'name', index_class.relname,
+                    'unique', indisunique,
+                    'method', amname,
+                    'columns', ARRAY(
+                        SELECT pg_get_indexdef(indexrelid, k, true)
+                        FROM generate_series(1, indnatts) k
+                        ORDER BY k
+                    ),
+                    'predicate', pg_get_expr(indpred, indrelid, true)
+                )
+                ORDER BY index_class.relname
+            ),
+            '[]'
+        )
+        FROM
+            pg_index
+            JOIN pg_class index_class ON (pg_index.indexrelid = index_class.oid)
+            JOIN pg_am ON (index_class.relam = pg_am.oid)
+        WHERE indrelid = matviewname::regclass
+    )
+FROM
+    matview_dependencies
+GROUP BY
+    matviewname
+ORDER BY
+    MAX(level), matviewname
+"""
+
+
+def qualified(schema, name):
+    """
+    Return the SQL for the relation `name` in `schema`.
+    """
+    return sql.SQL("{}.{}").format(sql.Identifier(schema), sql.Identifier(name))
+
+
+@contextmanager
+def use_schema(schema):
+    """
+    Create unqualified relations in `schema`, and look up unqualified names
+    in `schema` before the public schema, on the current connection.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW search_path")
+        (search_path,) = cursor.fetchone()
+        cursor.execute(
+            sql.SQL("SET search_path TO {}, public").format(sql.Identifier(schema))
+        )
+        try:
+            yield
+        finally:
+            cursor.execute("SELECT set_config('search_path', %s, false)", [search_path])
+
+
+def create_shadow_schema():
+    """
+    Create an empty shadow schema, dropping the previous shadow schema.
+    """
+    drop_schema(SHADOW_SCHEMA)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(SHADOW_SCHEMA))
+        )
+
+
+def create_shadow_tables(tables):
+    """
+    Create an empty copy of each table in `tables` in the shadow schema,
+    with the same columns, defaults, constraints and indexes.
+    """
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(
+                sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING ALL)").format(
+                    qualified(SHADOW_SCHEMA, table), qualified("public", table)
+                )
+            )
+
+
+def create_shadow_partitioned_relations():
+    """
+    Create an empty copy of each partitioned relation in the shadow schema,
+    without partitions.
+    """
+    with connection.cursor() as cursor:
+        for relation in PARTITIONED_RELATIONS:
+            cursor.execute(
+                sql.SQL(
+                    "CREATE TABLE {} (LIKE {}) PARTITION BY RANGE (server_timestamp)"
+                ).format(
+                    qualified(SHADOW_SCHEMA, relation.name),
+                    qualified("public", relation.name),
+                )
+            )
+
+
+def get_view_definitions():
+    """
+    Return a list of (view, definition, indexes) tuples for the materialized
+    views in the public schema, in dependency order.
+
+    Must be called with the default search path, so the definitions refer
+    to relations by their unqualified names.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(VIEW_DEFINITIONS_QUERY)
+        return cursor.fetchall()
+
+
+def create_shadow_view(view, definition, indexes):
+    """
+    Create and populate the materialized view `view` with its `indexes` in
+    the shadow schema. The indexes have the names of the indexes on the view
+    in the public schema, which are unique within the shadow schema.
+
+    Must be called within `use_schema(SHADOW_SCHEMA)`, so unqualified names
+    in `definition` refer to the relations in the shadow schema if they
+    exist, and to the relations in the public schema otherwise.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("CREATE MATERIALIZED VIEW {} AS ").format(
+                qualified(SHADOW_SCHEMA, view)
+            )
+            + sql.SQL(definition.rstrip().rstrip(";"))
+        )
+        for index in indexes:
+            cursor.execute(
+                sql.SQL("CREATE {}INDEX {} ON {} USING {} ({}){}").format(
+                    sql.SQL("UNIQUE " if index["unique"] else ""),
+                    sql.Identifier(index["name"]),
+                    qualified(SHADOW_SCHEMA, view),
+                    sql.Identifier(index["method"]),
+                    sql.SQL(", ").join(map(sql.SQL, index["columns"])),
+                    sql.SQL(" WHERE (%s)" % index["predicate"])
+                    if index["predicate"]
+                    else sql.SQL(""),
+                )
+            )
+
+
+def analyze_schema(schema):
+    """
+    Update the statistics of all tables and materialized views in `schema`.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT relname
+            FROM pg_class LEFT JOIN pg_namespace ON (pg_class.relnamespace = pg_namespace.oid)
+            WHERE nspname = %s AND relkind IN ('r', 'm')
+            ORDER BY relname
+            """,
+            [schema],
+        )
+        for (relation,) in cursor.fetchall():
+            cursor.execute(sql.SQL("ANALYZE {}").format(qualified(schema, relation)))
+
+
+def _move_relations(cursor, source, relations, target):
+    """
+    Move the `relations` in `source`, a list of (name, relkind) tuples, to
+    the schema `target`.
+    """
+    for name, relkind in relations:
+        statement = (
+            "ALTER MATERIALIZED VIEW {} SET SCHEMA {}"
+            if relkind == "m"
+            else "ALTER TABLE {} SET SCHEMA {}"
+        )
+        cursor.execute(
+            sql.SQL(statement).format(qualified(source, name), sql.Identifier(target))
+        )
+
+
+def swap_schema(source, backup, lock_timeout):
+    """
+    Replace the relations in the public schema with the relations of the
+    same name in `source`, and move the replaced relations, including the
+    partitions of replaced partitioned tables, to `backup`. Must run in a
+    transaction, so the application sees either snapshot.
+
+    Waits at most `lock_timeout` seconds for each lock, so requests that
+    queue behind the swap are not stalled for long.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL lock_timeout = %s", ["%ds" % lock_timeout])
+        cursor.execute(
+            """
+            SELECT relname, relkind
+            FROM pg_class LEFT JOIN pg_namespace ON (pg_class.relnamespace = pg_namespace.oid)
+            WHERE nspname = %s AND relkind IN ('r', 'p', 'm')
+            """,
+            [source],
+        )
+        replacements = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT relname, relkind
+            FROM pg_class LEFT JOIN pg_namespace ON (pg_class.relnamespace = pg_namespace.oid)
+            WHERE nspname = 'public' AND relkind IN ('r', 'p', 'm') AND (
+                relname = ANY(%s) OR pg_class.oid IN (
+                    SELECT inhrelid
+                    FROM pg_inherits JOIN pg_class parent ON (pg_inherits.inhparent = parent.oid)
+                    WHERE parent.relnamespace = 'public'::regnamespace
+                        AND parent.relname = ANY(%s)
+                )
+            )
+            """,
+            [[name for name, _ in replacements]] * 2,
+        )
+        replaced = cursor.fetchall()
+        cursor.execute(
+            sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(backup))
+        )
+        _move_relations(cursor, "public", replaced, backup)
+        _move_relations(cursor, source, replacements, "public")
+    return [name for name, _ in replacements]
+
+
+def rollback_snapshot(lock_timeout):
+    """
+    Swap the previous snapshot back into the public schema, and keep the
+    replaced snapshot as the previous snapshot, so a rollback can be undone
+    with another rollback. Return the names of the restored relations.
+    """
+    with transaction.atomic():
+        drop_schema(ROLLBACK_SCHEMA)
+        relations = swap_schema(PREVIOUS_SCHEMA, ROLLBACK_SCHEMA, lock_timeout)
+        drop_schema(PREVIOUS_SCHEMA)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.SQL("ALTER SCHEMA {} RENAME TO {}").format(
+                    sql.Identifier(ROLLBACK_SCHEMA), sql.Identifier(PREVIOUS_SCHEMA)
+                )
+            )
+    return relations
+
+
+def drop_schema(schema):
+    """
+    Drop `schema` with all relations in it, if it exists.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema))
+        )
+
+
+def schema_exists(schema):
+    """
+    Return whether `schema` exists.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s", [schema])
+        return cursor.fetchone() is not None
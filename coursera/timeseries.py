@@ -0,0 +1,228 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from coursera.cache import GenerationCache
+from coursera.filters import get_day_window
+from coursera.models import (
+    CourseDailyActivity,
+    CourseRating,
+    ItemDailyActivity,
+    OnDemandSession,
+)
+
+__all__ = [
+    "Series",
+    "CourseTimeSeries",
+    "BranchTimeSeries",
+    "get_course_time_series",
+    "get_branch_time_series",
+    "get_time_series_window",
+]
+
+
+class Series:
+    """
+    Cumulative daily counts of a single metric.
+
+    The days with a count are stored as sorted ordinals, along with the
+    cumulative count up to each day, so the count within any window of days
+    is the difference between two cumulative counts. Counts without a day are
+    only included when the window is unbounded.
+    """
+
+    def __init__(self, rows=()):
+        self.days = array("l")
+        self.totals = array("q", [0])
+        self.undated = 0
+        for day, count in sorted(rows, key=lambda row: (row[0] is None, row[0])):
+            if day is None:
+                self.undated += count
+            elif self.days and self.days[-1] == day.toordinal():
+                self.totals[-1] += count
+            else:
+                self.days.append(day.toordinal())
+                self.totals.append(self.totals[-1] + count)
+
+    def count(self, window):
+        """
+        Return the sum of the daily counts within `window`, a (from_day,
+        to_day) tuple as returned by `coursera.filters.get_day_window()`.
+        """
+        from_day, to_day = window
+        start = 0 if from_day is None else bisect_left(self.days, from_day.toordinal())
+        end = (
+            len(self.days)
+            if to_day is None
+            else bisect_left(self.days, to_day.toordinal())
+        )
+        count = self.totals[max(end, start)] - self.totals[start]
+        if from_day is None and to_day is None:
+            count += self.undated
+        return count
+
+
+def group_series(rows):
+    """
+    Return a dict of Series for rows of (key, day, count) tuples.
+    """
+    grouped = defaultdict(list)
+    for key, day, count in rows:
+        grouped[key].append((day, count))
+    return {key: Series(values) for key, values in grouped.items()}
+
+
+class CourseTimeSeries:
+    """
+    Cumulative daily enrollments, passes, cohorts and ratings per score of a
+    course.
+    """
+
+    def __init__(self, course_id, enrollments, passes, cohorts, ratings):
+        self.course_id = course_id
+        self.enrollments = enrollments
+        self.passes = passes
+        self.cohorts = cohorts
+        self.ratings = ratings
+
+    @classmethod
+    def build(cls, course_ids):
+        """
+        Return a dict with the CourseTimeSeries of each course in
+        `course_ids`, built with one grouped query per source view.
+        """
+        activity = list(
+            CourseDailyActivity.objects.filter(course_id__in=course_ids).values_list(
+                "course_id", "day", "enrollments", "passes"
+            )
+        )
+        enrollments = group_series(row[:3] for row in activity)
+        passes = group_series(
+            (course_id, day, count) for course_id, day, _, count in activity
+        )
+        cohorts = group_series(
+            OnDemandSession.objects.filter(course_id__in=course_ids)
+            .annotate(day=TruncDate("timestamp"))
+            .values_list("course_id", "day")
+            .annotate(Count("pk"))
+            .order_by()
+        )
+        ratings = defaultdict(list)
+        for course_id, rating, day, count in (
+            CourseRating.objects.filter(course_id__in=course_ids)
+            .filter(
+                feedback_system__in=[
+                    CourseRating.NPS_FIRST_WEEK,
+                    CourseRating.NPS_END_OF_COURSE,
+                ]
+            )
+            .annotate(day=TruncDate("timestamp"))
+            .values_list("course_id", "rating", "day")
+            .annotate(Count("id"))
+            .order_by()
+        ):
+            ratings[course_id].append((rating, day, count))
+
+        return {
+            course_id: cls(
+                course_id,
+                enrollments.get(course_id, Series()),
+                passes.get(course_id, Series()),
+                cohorts.get(course_id, Series()),
+                group_series(ratings[course_id]),
+            )
+            for course_id in course_ids
+        }
+
+    def get_ratings(self, window):
+        """
+        Return a list of (rating, count) tuples, ordered by rating, for the
+        ratings with a non-zero count within `window`.
+        """
+        ratings = [
+            (rating, series.count(window))
+            for rating, series in sorted(
+                self.ratings.items(), key=lambda rating: (rating[0] is None, rating[0])
+            )
+        ]
+        return [(rating, count) for rating, count in ratings if count]
+
+
+class BranchTimeSeries:
+    """
+    Cumulative daily comments, likes and dislikes of each item in a branch.
+    """
+
+    def __init__(self, branch_id, comments, likes, dislikes):
+        self.branch_id = branch_id
+        self.comments = comments
+        self.likes = likes
+        self.dislikes = dislikes
+
+    @classmethod
+    def build(cls, branch_ids):
+        """
+        Return a dict with the BranchTimeSeries of each branch in
+        `branch_ids`, built with a single query over the daily item rollups.
+        """
+        activity = defaultdict(list)
+        for row in ItemDailyActivity.objects.filter(
+            item__branch_id__in=branch_ids
+        ).values_list(
+            "item__branch_id", "item_id", "day", "comments", "likes", "dislikes"
+        ):
+            activity[row[0]].append(row[1:])
+
+        return {
+            branch_id: cls(
+                branch_id,
+                group_series(row[:3] for row in activity[branch_id]),
+                group_series(
+                    (item, day, count) for item, day, _, count, _ in activity[branch_id]
+                ),
+                group_series(
+                    (item, day, count) for item, day, _, _, count in activity[branch_id]
+                ),
+            )
+            for branch_id in branch_ids
+        }
+
+    def count(self, metric, item, window):
+        """
+        Return the count of `metric` for `item` within `window`.
+        """
+        series = getattr(self, metric).get(item.pk)
+        return series.count(window) if series is not None else 0
+
+
+course_time_series = GenerationCache(CourseTimeSeries.build)
+branch_time_series = GenerationCache(BranchTimeSeries.build)
+
+
+def get_course_time_series(course_id):
+    """
+    Return the CourseTimeSeries for `course_id`.
+    """
+    return course_time_series.get(course_id)
+
+
+def get_branch_time_series(branch_id):
+    """
+    Return the BranchTimeSeries for `branch_id`.
+    """
+    return branch_time_series.get(branch_id)
+
+
+def get_time_series_window(request):
+    """
+    Return the (from_day, to_day) window of the date filters of `request` if
+    the analytics can be answered from the time series, or None if they must
+    be calculated in the database.
+    """
+    if not settings.ANALYTICS_TIME_SERIES:
+        return None
+    return get_day_window(request.GET, request=request)
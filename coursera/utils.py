@@ -1,3 +1,4 @@
+from django.db import connections
 from django.db.models import FloatField, Func, IntegerField, Subquery
 
 
@@ -13,3 +14,28 @@ class CountSubquery(Subquery):
 class AvgSubquery(Subquery):
     template = "(SELECT AVG(%(db_column)s) FROM (%(subquery)s) _avg)"
     output_field = FloatField()
+
+
+class SumSubquery(Subquery):
+    template = "(SELECT SUM(%(db_column)s) FROM (%(subquery)s) _sum)"
+    output_field = IntegerField()
+
+
+def histogram(queryset, column):
+    """
+    Return a list of (value, count) tuples with the number of rows in
+    `queryset` for each distinct value of `column`, ordered by value.
+
+    Unlike `values_list(column).annotate(Count(...))`, `column` may be an
+    aggregate annotation of `queryset`.
+    """
+    connection = connections[queryset.db]
+    column = connection.ops.quote_name(column)
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT %s, COUNT(*) FROM (%s) _histogram GROUP BY %s ORDER BY %s"
+            % (column, sql, column, column),
+            params,
+        )
+        return cursor.fetchall()
@@ -1,14 +1,19 @@
+from calendar import timegm
 from functools import partial
 
 from django.db.models import F, OuterRef, Subquery
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.functional import cached_property
+from django.utils.http import http_date
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from coursera.filters import GenericFilterSet
-from coursera.models import Branch, ClickstreamEvent, Course, Item, ItemType, Quiz
+from coursera.cache import response_cache
+from coursera.filters import GenericFilterSet, get_day_window
+from coursera.models import ClickstreamEvent, Course, Item, ItemType, Quiz
 from coursera.serializers import (
     AssignmentAnalyticsSerializer,
     CourseAnalyticsSerializer,
@@ -18,12 +23,107 @@ from coursera.serializers import (
     QuizSerializer,
     VideoAnalyticsSerializer,
 )
+from coursera.timeseries import get_time_series_window
+from coursera_dashboard.middleware import timing
 
 
-class CourseAnalyticsViewSet(ReadOnlyModelViewSet):
+class AnalyticsViewSet(ReadOnlyModelViewSet):
+    """
+    Read-only viewset that caches the serialized responses until the
+    materialized views are refreshed, supports conditional requests, and
+    records the time spent serializing the response in the request's server
+    timing.
+
+    Set `depends_on_now` on viewsets whose responses depend on the current
+    time if no to_date is given, so their cached responses expire daily.
+    """
+
+    depends_on_now = False
+
+    def cached_response(self, request, get_data):
+        """
+        Return a response with the cached data for this request, or with the
+        data returned by `get_data` if the request is not in the cache.
+
+        The response has an ETag and Last-Modified header based on the data
+        version. If the client already has the current version, return a 304
+        Not Modified response without calculating any analytics.
+        """
+        with timing(request, "cache"):
+            key = response_cache.make_key(request, self)
+            etag = response_cache.make_etag(key)
+            last_modified = timegm(
+                response_cache.get_last_modified(request, self).utctimetuple()
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                data = response_cache.get(key)
+        if response is None:
+            if data is None:
+                data = get_data()
+                with timing(request, "cache"):
+                    response_cache.set(key, data)
+            response = Response(data)
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Return a list of serialized objects.
+        """
+
+        def get_data():
+            queryset = self.filter_queryset(self.get_queryset())
+            serializer = self.get_serializer(queryset, many=True)
+            with timing(request, "serialize"):
+                return serializer.data
+
+        return self.cached_response(request, get_data)
+
+    def check_object_exists(self):
+        """
+        Raise Http404 unless the object of this request exists and is visible
+        to the user. Unlike `get_object()`, only checks for the object with a
+        single query, without calculating its analytics.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if not queryset.filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).exists():
+            raise Http404
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return a single serialized object.
+
+        The object is looked up before the cache and the conditional headers
+        are checked, so a request for an object that the user may not see is
+        never answered with a cached response or 304 Not Modified.
+        """
+        self.check_object_exists()
+
+        def get_data():
+            instance = self.get_object()
+            serializer = self.get_serializer(instance)
+            with timing(request, "serialize"):
+                return serializer.data
+
+        return self.cached_response(request, get_data)
+
+
+class CourseAnalyticsViewSet(AnalyticsViewSet):
     queryset = Course.objects.filter_current_branch()
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
+    # The leaving learners are counted at the current time if no to_date is
+    # given.
+    depends_on_now = True
 
     @cached_property
     def generic_filterset(self):
@@ -54,22 +154,30 @@ class CourseAnalyticsViewSet(ReadOnlyModelViewSet):
         Return the queryset of courses that the current user has access to.
 
         Annotate with the number of enrolled, finished and paying learners and
-        the specialization name. For a single object, additionally annotate
-        with the number of modules, quizzes, assignments, videos and cohorts,
-        and with the average time spent on the course.
+        the specialization name. If the date filters align to days, the
+        enrolled and finished learners and the cohorts are read from the
+        in-memory time series by the serializer instead, or summed from the
+        daily rollups if the time series are disabled. For a single object,
+        additionally annotate with the number of modules, quizzes,
+        assignments, videos and cohorts, and with the average time spent on
+        the course.
 
         Order by specialization, then by name.
         """
+        use_time_series = get_time_series_window(self.request) is not None
+        window = get_day_window(self.request.GET, request=self.request)
         queryset = (
             super()
             .get_queryset()
             .filter(id__in=self.request.user.courses)
-            .with_enrolled_learners(self.generic_filterset)
-            .with_finished_learners(self.generic_filterset)
             .with_paying_learners(self.generic_filterset)
             .annotate(specialization=F("specializations__name"))
             .order_by("specialization", "name")
         )
+        if not use_time_series:
+            queryset = queryset.with_enrolled_learners(
+                self.generic_filterset, window
+            ).with_finished_learners(self.generic_filterset, window)
         if self.action == "retrieve":
             queryset = (
                 queryset
@@ -78,19 +186,16 @@ class CourseAnalyticsViewSet(ReadOnlyModelViewSet):
                 .with_quizzes()
                 .with_assignments()
                 .with_videos()
-                .with_cohorts(self.generic_filterset)
                 .with_average_time(self.generic_filterset)
             )
+            if not use_time_series:
+                queryset = queryset.with_cohorts(self.generic_filterset)
         return queryset
 
 
-class VideoAnalyticsViewSet(ReadOnlyModelViewSet):
+class VideoAnalyticsViewSet(AnalyticsViewSet):
     queryset = Item.objects.filter(type__description=ItemType.LECTURE).filter(
-        branch=Subquery(
-            Branch.objects.filter(pk=OuterRef("branch_id"))
-            .order_by(F("authoring_course_branch_created_ts").desc(nulls_last=True))
-            .values("pk")[:1]
-        )
+        branch__current__isnull=False
     )
     serializer_class = ItemSerializer
     permission_classes = [IsAuthenticated]
@@ -126,14 +231,8 @@ class VideoAnalyticsViewSet(ReadOnlyModelViewSet):
         return queryset
 
 
-class QuizAnalyticsViewSet(ReadOnlyModelViewSet):
-    queryset = Quiz.objects.filter(
-        items__branch=Subquery(
-            Branch.objects.filter(pk=OuterRef("items__branch_id"))
-            .order_by(F("authoring_course_branch_created_ts").desc(nulls_last=True))
-            .values("pk")[:1]
-        )
-    )
+class QuizAnalyticsViewSet(AnalyticsViewSet):
+    queryset = Quiz.objects.filter(items__branch__current__isnull=False)
     serializer_class = QuizSerializer
     permission_classes = [IsAuthenticated]
 
@@ -213,14 +312,8 @@ class QuizAnalyticsViewSet(ReadOnlyModelViewSet):
         return queryset
 
 
-class AssignmentAnalyticsViewSet(ReadOnlyModelViewSet):
-    queryset = Item.peer_assignment_objects.filter(
-        branch=Subquery(
-            Branch.objects.filter(pk=OuterRef("branch_id"))
-            .order_by(F("authoring_course_branch_created_ts").desc(nulls_last=True))
-            .values("pk")[:1]
-        )
-    )
+class AssignmentAnalyticsViewSet(AnalyticsViewSet):
+    queryset = Item.peer_assignment_objects.filter(branch__current__isnull=False)
     serializer_class = ItemSerializer
     permission_classes = [IsAuthenticated]
 
@@ -0,0 +1,132 @@
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTiming:
+    """
+    Collect the time spent in each phase of a request, and the number of
+    database queries.
+    """
+
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.queries = 0
+
+    def add(self, name, duration):
+        """
+        Add `duration` seconds to the time spent in phase `name`.
+        """
+        self.durations[name] = self.durations.get(name, 0) + duration
+
+    @contextmanager
+    def time(self, name):
+        """
+        Add the time spent in the enclosed block to phase `name`.
+
+        Database queries in the block, such as the queries of querysets that
+        are evaluated lazily during serialization, are only added to the "db"
+        phase, so the phases other than "total" do not overlap.
+        """
+        start = perf_counter()
+        db_start = self.durations.get("db", 0)
+        try:
+            yield
+        finally:
+            duration = perf_counter() - start
+            if name not in ("db", "total"):
+                duration -= self.durations.get("db", 0) - db_start
+            self.add(name, duration)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper that counts each query and adds its
+        execution time to the "db" phase.
+        """
+        self.queries += 1
+        with self.time("db"):
+            return execute(sql, params, many, context)
+
+    def header(self):
+        """
+        Return the value of the Server-Timing header.
+        """
+        metrics = []
+        for name, duration in self.durations.items():
+            if name == "db":
+                metrics.append(
+                    '%s;desc="%d queries";dur=%.1f'
+                    % (name, self.queries, duration * 1000)
+                )
+            else:
+                metrics.append("%s;dur=%.1f" % (name, duration * 1000))
+        return ", ".join(metrics)
+
+
+@contextmanager
+def timing(request, name):
+    """
+    Add the time spent in the enclosed block to phase `name` of `request`,
+    if the request is timed by ServerTimingMiddleware.
+    """
+    server_timing = getattr(request, "server_timing", None)
+    if server_timing is None:
+        yield
+    else:
+        with server_timing.time(name):
+            yield
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware that measures the time spent in authentication, database
+    queries, serialization and rendering for each request.
+
+    The measurements are added to the response in a "Server-Timing" header,
+    so they can be inspected in the browser's developer tools, and are
+    logged as a single line per request.
+
+    Must come before any middleware that should be included in the
+    measurements.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.server_timing = server_timing = ServerTiming()
+        with server_timing.time("total"), connection.execute_wrapper(
+            server_timing.execute_wrapper
+        ):
+            response = self.get_response(request)
+
+        response["Server-Timing"] = server_timing.header()
+        logger.info(
+            "method=%s path=%s status=%s queries=%d %s",
+            request.method,
+            request.path,
+            response.status_code,
+            server_timing.queries,
+            " ".join(
+                "%s=%.1f" % (name, duration * 1000)
+                for name, duration in server_timing.durations.items()
+            ),
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Measure the time spent rendering the response.
+        """
+        start = perf_counter()
+
+        def add_render_time(response):
+            request.server_timing.add("render", perf_counter() - start)
+
+        response.add_post_render_callback(add_render_time)
+        return response
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "coursera_dashboard.middleware.ServerTimingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "auth.middleware.OAuth2TokenMiddleware",
@@ -118,6 +119,143 @@ EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 AUTHORIZATION_SERVER_URL = os.environ["AUTHORIZATION_SERVER_URL"]
 AUTHORIZATION_SERVER_ACCESS_TOKEN = os.environ["AUTHORIZATION_SERVER_ACCESS_TOKEN"]
 
+# Introspection requests share a pool of at most AUTHORIZATION_SERVER_POOL_SIZE
+# keep-alive connections, and are retried on connection errors and 502, 503
+# and 504 responses.
+AUTHORIZATION_SERVER_POOL_SIZE = int(
+    os.environ.get("AUTHORIZATION_SERVER_POOL_SIZE", 10)
+)
+AUTHORIZATION_SERVER_CONNECT_TIMEOUT = float(
+    os.environ.get("AUTHORIZATION_SERVER_CONNECT_TIMEOUT", 3.05)
+)
+AUTHORIZATION_SERVER_READ_TIMEOUT = float(
+    os.environ.get("AUTHORIZATION_SERVER_READ_TIMEOUT", 10)
+)
+AUTHORIZATION_SERVER_RETRIES = int(os.environ.get("AUTHORIZATION_SERVER_RETRIES", 2))
+AUTHORIZATION_SERVER_BACKOFF = float(
+    os.environ.get("AUTHORIZATION_SERVER_BACKOFF", 0.1)
+)
+
+# Introspection results are cached for at most AUTHORIZATION_SERVER_CACHE_TTL
+# seconds, or until the token expires. Set AUTHORIZATION_SERVER_CACHE_ALIAS to
+# the alias of a shared cache in CACHES to share results between processes.
+AUTHORIZATION_SERVER_CACHE_SIZE = int(
+    os.environ.get("AUTHORIZATION_SERVER_CACHE_SIZE", 1024)
+)
+AUTHORIZATION_SERVER_CACHE_TTL = int(
+    os.environ.get("AUTHORIZATION_SERVER_CACHE_TTL", 300)
+)
+AUTHORIZATION_SERVER_CACHE_ALIAS = os.environ.get("AUTHORIZATION_SERVER_CACHE_ALIAS")
+
+# Rejected tokens are cached for AUTHORIZATION_SERVER_NEGATIVE_CACHE_TTL
+# seconds. Tokens with AUTHORIZATION_SERVER_THROTTLE_RATE failed attempts within
+# AUTHORIZATION_SERVER_THROTTLE_WINDOW seconds are rejected without contacting
+# the Authorization Server.
+AUTHORIZATION_SERVER_NEGATIVE_CACHE_TTL = int(
+    os.environ.get("AUTHORIZATION_SERVER_NEGATIVE_CACHE_TTL", 30)
+)
+AUTHORIZATION_SERVER_THROTTLE_RATE = int(
+    os.environ.get("AUTHORIZATION_SERVER_THROTTLE_RATE", 20)
+)
+AUTHORIZATION_SERVER_THROTTLE_WINDOW = int(
+    os.environ.get("AUTHORIZATION_SERVER_THROTTLE_WINDOW", 60)
+)
+
+# Set AUTHORIZATION_SERVER_IP_THROTTLE to also reject tokens from IP addresses
+# with AUTHORIZATION_SERVER_IP_THROTTLE_RATE failed attempts within the window.
+# Behind a reverse proxy or load balancer, list their addresses in
+# AUTHORIZATION_SERVER_TRUSTED_PROXIES (comma-separated), so the client's
+# address is read from the X-Forwarded-For header instead of throttling all
+# clients behind the proxy together.
+AUTHORIZATION_SERVER_IP_THROTTLE = "AUTHORIZATION_SERVER_IP_THROTTLE" in os.environ
+AUTHORIZATION_SERVER_IP_THROTTLE_RATE = int(
+    os.environ.get("AUTHORIZATION_SERVER_IP_THROTTLE_RATE", 200)
+)
+AUTHORIZATION_SERVER_TRUSTED_PROXIES = [
+    address.strip()
+    for address in os.environ.get("AUTHORIZATION_SERVER_TRUSTED_PROXIES", "").split(",")
+    if address.strip()
+]
+
+# If the Authorization Server issues signed access tokens, set
+# AUTHORIZATION_SERVER_PUBLIC_KEY to its PEM-encoded public key to validate
+# signed tokens locally instead of with token introspection.
+AUTHORIZATION_SERVER_PUBLIC_KEY = os.environ.get("AUTHORIZATION_SERVER_PUBLIC_KEY")
+AUTHORIZATION_SERVER_TOKEN_ALGORITHMS = os.environ.get(
+    "AUTHORIZATION_SERVER_TOKEN_ALGORITHMS", "RS256"
+).split(",")
+AUTHORIZATION_SERVER_TOKEN_AUDIENCE = os.environ.get(
+    "AUTHORIZATION_SERVER_TOKEN_AUDIENCE"
+)
+AUTHORIZATION_SERVER_REQUIRED_SCOPES = ["read"]
+
+if AUTHORIZATION_SERVER_PUBLIC_KEY:
+    AUTHENTICATION_BACKENDS = ["auth.backends.SignedTokenBackend"]
+
+# Responses of the analytics endpoints are cached in the ANALYTICS_CACHE_ALIAS
+# cache until the next refresh of the materialized views. By default, each
+# process has its own cache of at most ANALYTICS_CACHE_MAX_ENTRIES responses.
+# Set ANALYTICS_CACHE_REDIS_URL, e.g. "redis://localhost:6379/1", to share the
+# cache between all processes, so the responses precomputed by
+# `manage.py warmanalytics` are served by the web server. Redis should then
+# have a maxmemory limit with the allkeys-lru policy. Cached responses take a
+# few kilobytes each, and warmanalytics stores about one per item of every
+# course for each date window. Set ANALYTICS_CACHE_BACKEND and
+# ANALYTICS_CACHE_LOCATION to use another cache backend instead. The data
+# generation is read from the database at most once every
+# DATA_VERSION_CACHE_TTL seconds.
+ANALYTICS_CACHE_REDIS_URL = os.environ.get("ANALYTICS_CACHE_REDIS_URL")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "analytics": {
+        "BACKEND": os.environ.get(
+            "ANALYTICS_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("ANALYTICS_CACHE_LOCATION", "analytics"),
+        "TIMEOUT": int(os.environ.get("ANALYTICS_CACHE_TIMEOUT", 24 * 60 * 60)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("ANALYTICS_CACHE_MAX_ENTRIES", 10000))
+        },
+    },
+}
+if ANALYTICS_CACHE_REDIS_URL:
+    CACHES["analytics"].update(
+        {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": ANALYTICS_CACHE_REDIS_URL,
+            "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        }
+    )
+ANALYTICS_CACHE_ALIAS = "analytics"
+DATA_VERSION_CACHE_TTL = int(os.environ.get("DATA_VERSION_CACHE_TTL", 10))
+
+# The hit rate of the analytics cache in each process is logged every
+# ANALYTICS_CACHE_STATS_INTERVAL lookups.
+ANALYTICS_CACHE_STATS_INTERVAL = int(
+    os.environ.get("ANALYTICS_CACHE_STATS_INTERVAL", 1000)
+)
+
+# Date windows that align to days are answered from in-memory cumulative daily
+# counts per course, which are rebuilt when the data generation changes. Set
+# ANALYTICS_DISABLE_TIME_SERIES to sum the daily rollups in the database
+# instead.
+ANALYTICS_TIME_SERIES = "ANALYTICS_DISABLE_TIME_SERIES" not in os.environ
+
+# The clickstream relations are partitioned by month. `manage.py refreshviews`
+# refreshes the partitions whose source rows changed, and `manage.py
+# partitions create` creates the partitions of the last
+# CLICKSTREAM_REFRESH_MONTHS months by default.
+CLICKSTREAM_REFRESH_MONTHS = int(os.environ.get("CLICKSTREAM_REFRESH_MONTHS", 2))
+
+# Number of materialized views that `manage.py refreshviews` refreshes in
+# parallel, each over a separate database connection.
+REFRESH_VIEWS_WORKERS = int(os.environ.get("REFRESH_VIEWS_WORKERS", 4))
+
+# `manage.py refreshviews` rewrites a table with VACUUM FULL when its fraction
+# of dead tuples exceeds VACUUM_FULL_BLOAT_THRESHOLD, and runs a plain VACUUM
+# otherwise.
+VACUUM_FULL_BLOAT_THRESHOLD = float(os.environ.get("VACUUM_FULL_BLOAT_THRESHOLD", 0.2))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -126,6 +264,14 @@ LOGGING = {
         "django": {
             "handlers": ["console"],
             "level": os.getenv("DJANGO_LOG_LEVEL", "INFO"),
-        }
+        },
+        "coursera_dashboard.middleware": {
+            "handlers": ["console"],
+            "level": os.getenv("SERVER_TIMING_LOG_LEVEL", "INFO"),
+        },
+        "coursera.cache": {
+            "handlers": ["console"],
+            "level": os.getenv("ANALYTICS_CACHE_LOG_LEVEL", "INFO"),
+        },
     },
 }
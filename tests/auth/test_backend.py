@@ -1,7 +1,20 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Thread
+from time import sleep, time
+
+import jwt
 import pytest
+import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
 from django.conf import settings
 from django.contrib.auth import authenticate
 
+from auth.backends import OAuth2Backend, SignedTokenBackend
+
 INTROSPECTION_URL = f"{settings.AUTHORIZATION_SERVER_URL}/o/introspect/"
 
 
@@ -50,3 +63,316 @@ def test_unauthorized_backend(rf, unauthorized_request_mock):
         )
         is None
     ), "user is authenticated without access to authorization server"
+
+
+def test_valid_token_is_cached(rf, requests_mock, valid_token_mock):
+    """
+    Test that a valid token is only validated once against the authorization
+    server, and that subsequent requests are served from the cache.
+    """
+    for _ in range(3):
+        user = authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer valid_token")
+        )
+        assert user is not None, "authentication failed"
+    assert requests_mock.call_count == 1, "token was validated more than once"
+    assert OAuth2Backend.cache.stats["hits"] == 2
+    assert OAuth2Backend.cache.stats["misses"] == 1
+
+
+def test_invalid_token_is_negatively_cached(rf, requests_mock, invalid_token_mock):
+    """
+    Test that a rejected token is rejected locally on subsequent requests,
+    without another request to the authorization server.
+    """
+    for _ in range(3):
+        assert (
+            authenticate(
+                rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer invalid_token")
+            )
+            is None
+        ), "user authenticated with invalid token"
+    assert requests_mock.call_count == 1, "invalid token was not cached"
+    assert OAuth2Backend.negative_cache.stats["hits"] == 2
+
+
+@pytest.mark.parametrize(
+    "response", [{"status_code": 503}, {"exc": requests.exceptions.ConnectTimeout}]
+)
+def test_unavailable_authorization_server(rf, requests_mock, teacher, response):
+    """
+    Test that a token is not rejected or throttled when the authorization
+    server is unavailable, and is validated once the server recovers.
+    """
+    requests_mock.post(INTROSPECTION_URL, **response)
+    assert (
+        authenticate(rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer token"))
+        is None
+    ), "user authenticated without the authorization server"
+    assert OAuth2Backend.negative_cache.get("token") is None
+    assert OAuth2Backend.throttle.stats["failures"] == 0
+
+    requests_mock.post(
+        INTROSPECTION_URL,
+        json={"active": True, "username": teacher.username, "scope": "read"},
+    )
+    assert (
+        authenticate(rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer token"))
+        is not None
+    ), "token was rejected after the authorization server recovered"
+
+
+@pytest.mark.parametrize("token", ["", "<script>", "a b", "a" * 5000])
+def test_malformed_token(rf, requests_mock, token):
+    """
+    Test that a malformed token is rejected without a request to the
+    authorization server.
+    """
+    assert (
+        authenticate(rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION=f"Bearer {token}"))
+        is None
+    ), "user authenticated with malformed token"
+    assert requests_mock.call_count == 0, "malformed token was introspected"
+
+
+def test_throttle_ip_address(rf, requests_mock, invalid_token_mock, settings):
+    """
+    Test that an IP address is throttled after too many failed attempts, and
+    that a throttled IP address can still use a cached token.
+    """
+    settings.AUTHORIZATION_SERVER_IP_THROTTLE = True
+    OAuth2Backend.cache.set("valid_token", {"active": True, "username": "teacher"})
+    for i in range(OAuth2Backend.ip_throttle.rate + 5):
+        authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION=f"Bearer invalid_{i}")
+        )
+
+    assert requests_mock.call_count == OAuth2Backend.ip_throttle.rate
+    assert OAuth2Backend.ip_throttle.stats["throttled"] == 5
+    assert (
+        authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer valid_token")
+        )
+        is not None
+    ), "cached token was throttled"
+
+
+def test_ip_address_is_not_throttled_by_default(rf, requests_mock, invalid_token_mock):
+    """
+    Test that IP addresses are not throttled unless IP throttling is enabled.
+    """
+    for i in range(OAuth2Backend.ip_throttle.rate + 5):
+        authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION=f"Bearer invalid_{i}")
+        )
+
+    assert requests_mock.call_count == OAuth2Backend.ip_throttle.rate + 5
+    assert OAuth2Backend.ip_throttle.stats["failures"] == 0
+
+
+@pytest.mark.parametrize(
+    "remote_addr,forwarded_for,client_ip",
+    [
+        ("203.0.113.1", "", "203.0.113.1"),
+        ("203.0.113.1", "198.51.100.1", "203.0.113.1"),
+        ("10.0.0.1", "198.51.100.1", "198.51.100.1"),
+        ("10.0.0.1", "192.0.2.1, 198.51.100.1", "198.51.100.1"),
+        ("10.0.0.1", "198.51.100.1, 10.0.0.2", "198.51.100.1"),
+        ("10.0.0.1", "10.0.0.2", "10.0.0.2"),
+    ],
+)
+def test_client_ip(rf, settings, remote_addr, forwarded_for, client_ip):
+    """
+    Test that the client's IP address is only read from the X-Forwarded-For
+    header if the request was forwarded by a trusted proxy, and that addresses
+    set by the client are ignored.
+    """
+    settings.AUTHORIZATION_SERVER_TRUSTED_PROXIES = ["10.0.0.1", "10.0.0.2"]
+    request = rf.get("/", REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for)
+    assert OAuth2Backend().get_client_ip(request) == client_ip
+
+
+def test_expired_token_is_not_cached(rf, requests_mock, teacher):
+    """
+    Test that a token is not cached beyond its expiry time.
+    """
+    requests_mock.post(
+        INTROSPECTION_URL,
+        json={
+            "username": teacher.username,
+            "active": True,
+            "scope": "read",
+            "exp": int(time()) - 1,
+        },
+    )
+    for _ in range(2):
+        authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer valid_token")
+        )
+    assert requests_mock.call_count == 2, "expired token was cached"
+
+
+def test_concurrent_requests_share_introspection(rf, requests_mock, teacher):
+    """
+    Test that concurrent requests with the same token share a single
+    introspection request.
+    """
+
+    def introspect(request, context):
+        sleep(0.2)
+        return {"username": teacher.username, "active": True, "scope": "read"}
+
+    requests_mock.post(INTROSPECTION_URL, json=introspect)
+
+    def request_user(_):
+        return authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer valid_token")
+        )
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        users = list(executor.map(request_user, range(4)))
+
+    assert all(user is not None for user in users), "authentication failed"
+    assert requests_mock.call_count == 1, "token was validated more than once"
+
+
+class IntrospectionServer(ThreadingMixIn, HTTPServer):
+    """
+    Local authorization server that accepts every token, and records the
+    client address of every introspection request.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        self.client_addresses = []
+        super().__init__(("127.0.0.1", 0), self.Handler)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.server.client_addresses.append(self.client_address)
+            body = json.dumps({"username": "teacher", "active": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+
+def test_introspection_client_reuses_connections(rf, settings, monkeypatch):
+    """
+    Test that all threads share a single introspection client, and that the
+    client reuses a bounded pool of connections under concurrent load.
+    """
+    server = IntrospectionServer()
+    Thread(target=server.serve_forever, daemon=True).start()
+    settings.AUTHORIZATION_SERVER_URL = "http://%s:%s" % server.server_address
+    settings.AUTHORIZATION_SERVER_POOL_SIZE = 4
+    monkeypatch.setattr(OAuth2Backend, "_client", None)
+
+    def request_user(i):
+        backend = OAuth2Backend()
+        user = backend.authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION=f"Bearer token_{i}")
+        )
+        return user, backend.get_introspection_client()
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(request_user, range(64)))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert all(user is not None for user, _ in results), "authentication failed"
+    assert len({id(client) for _, client in results}) == 1, "client is not shared"
+    assert len(server.client_addresses) == 64
+    assert (
+        len(set(server.client_addresses)) <= 4
+    ), "more connections were opened than the size of the pool"
+
+
+def sign(private_key, **claims):
+    """
+    Return an access token with the given claims, signed with `private_key`.
+    """
+    token = jwt.encode(claims, private_key, algorithm="RS256")
+    return token.decode() if isinstance(token, bytes) else token
+
+
+@pytest.mark.parametrize(
+    "claims,valid",
+    [
+        ({"scope": "read write", "courses": ["abc"], "exp": time() + 60}, True),
+        ({"scope": "read write", "courses": ["abc"], "exp": time() - 60}, False),
+        ({"scope": "read write", "courses": ["abc"]}, False),
+        ({"scope": "write", "courses": ["abc"], "exp": time() + 60}, False),
+        ({"scope": "read write", "exp": time() + 60}, False),
+    ],
+)
+def test_signed_token(rf, requests_mock, public_key, private_key, claims, valid):
+    """
+    Test that a signed token is only valid if it is not expired, contains the
+    required scopes and contains a list of courses, and that it is validated
+    without a request to the authorization server.
+    """
+    token = sign(private_key, username="teacher", role="teacher", **claims)
+    user = SignedTokenBackend().authenticate(
+        rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION=f"Bearer {token}")
+    )
+    if valid:
+        assert user is not None, "authentication failed"
+        assert user.is_authenticated
+        assert user.courses == {"abc"}
+        assert user.scopes == {"read", "write"}
+    else:
+        assert user is None, "user authenticated with invalid token"
+    assert requests_mock.call_count == 0, "signed token was introspected"
+
+
+def test_signed_token_invalid_signature(rf, public_key):
+    """
+    Test that a token signed with a different key is rejected.
+    """
+    other_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()
+    )
+    token = sign(other_key, scope="read", courses=[], exp=time() + 60)
+    assert (
+        SignedTokenBackend().authenticate(
+            rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION=f"Bearer {token}")
+        )
+        is None
+    ), "user authenticated with token signed by another key"
+
+
+def test_signed_token_backend_opaque_token(rf, public_key, valid_token_mock):
+    """
+    Test that an opaque token is validated with token introspection.
+    """
+    user = SignedTokenBackend().authenticate(
+        rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION="Bearer valid_token")
+    )
+    assert user is not None, "authentication failed"
+
+
+@pytest.mark.parametrize("token", ["valid.token.abc", "e30.e30.abc", "bm90.anNvbg.abc"])
+def test_signed_token_backend_opaque_token_with_dots(
+    rf, requests_mock, public_key, valid_token_mock, token
+):
+    """
+    Test that an opaque token with three segments, but without a decodable
+    header naming the signing algorithm, is validated with token
+    introspection.
+    """
+    user = SignedTokenBackend().authenticate(
+        rf.post(INTROSPECTION_URL, HTTP_AUTHORIZATION=f"Bearer {token}")
+    )
+    assert user is not None, "authentication failed"
+    assert requests_mock.call_count == 1, "opaque token was not introspected"
@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import sleep, time
+
+import pytest
+
+from auth.cache import IntrospectionCache, SingleFlight, Throttle
+
+
+def test_cache_key_does_not_contain_token():
+    """
+    Test that the cache key is derived from a hash of the token, and does not
+    contain the token itself.
+    """
+    cache = IntrospectionCache()
+    key = cache.make_key("secret_token")
+    assert "secret_token" not in key
+    assert key == cache.make_key("secret_token")
+    assert key != cache.make_key("other_token")
+
+
+def test_cache_expires_at_max_ttl():
+    """
+    Test that an entry without an expiry time is cached for at most the
+    maximum ttl, and that an entry with an expiry time is cached until it
+    expires.
+    """
+    cache = IntrospectionCache(max_ttl=300)
+    assert cache.get_timeout({"active": True}) == 300
+    assert cache.get_timeout({"active": True, "exp": time() + 3600}) == 300
+    assert 0 < cache.get_timeout({"active": True, "exp": time() + 60}) <= 60
+
+
+def test_cache_lru_eviction():
+    """
+    Test that the least recently used entry is evicted when the cache is full.
+    """
+    cache = IntrospectionCache(max_size=2)
+    cache.set("a", {"active": True})
+    cache.set("b", {"active": True})
+    assert cache.get("a") is not None
+    cache.set("c", {"active": True})
+
+    assert cache.get("b") is None, "least recently used entry was not evicted"
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats == {"hits": 3, "misses": 1, "size": 2}
+
+
+def test_cache_shared():
+    """
+    Test that entries are shared through the Django cache between cache
+    instances with the same alias.
+    """
+    first = IntrospectionCache(alias="default")
+    second = IntrospectionCache(alias="default")
+    first.set("token", {"active": True, "username": "teacher"})
+
+    assert second.get("token") == {"active": True, "username": "teacher"}
+    assert second.stats["hits"] == 1
+
+
+def test_cache_clear():
+    """
+    Test that clearing the cache removes all entries and resets the counters.
+    """
+    cache = IntrospectionCache()
+    cache.set("token", {"active": True})
+    cache.get("token")
+    cache.clear()
+
+    assert cache.stats == {"hits": 0, "misses": 0, "size": 0}
+    assert cache.get("token") is None
+
+
+def test_throttle():
+    """
+    Test that a key is throttled after the maximum number of failures, and
+    that other keys are not affected.
+    """
+    throttle = Throttle(rate=2, window=60)
+    throttle.record_failure("a")
+    assert not throttle.is_throttled("a")
+    throttle.record_failure("a")
+
+    assert throttle.is_throttled("a")
+    assert not throttle.is_throttled("b")
+    assert throttle.stats == {"failures": 2, "throttled": 1, "size": 1}
+
+
+def test_throttle_window_expires():
+    """
+    Test that a key is no longer throttled after the window has passed.
+    """
+    throttle = Throttle(rate=1, window=0)
+    throttle.record_failure("a")
+    assert not throttle.is_throttled("a")
+
+
+def test_single_flight_shares_result():
+    """
+    Test that concurrent calls with the same key execute the function once,
+    and all return its result.
+    """
+    single_flight = SingleFlight()
+    release = Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait(1)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(single_flight.do, "key", func) for _ in range(4)]
+        while single_flight.stats["shared"] < 3:
+            sleep(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert single_flight.stats == {"calls": 1, "shared": 3}
+
+
+def test_single_flight_shares_exception():
+    """
+    Test that an exception raised by the function is raised in every waiting
+    thread, and that the next call executes the function again.
+    """
+    single_flight = SingleFlight()
+    release = Event()
+
+    def func():
+        release.wait(1)
+        raise ValueError("introspection failed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(single_flight.do, "key", func) for _ in range(2)]
+        while single_flight.stats["shared"] < 1:
+            sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+
+    assert single_flight.do("key", lambda: "retried") == "retried"
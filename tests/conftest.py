@@ -1,15 +1,41 @@
 import os
 
 import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from django.conf import settings
 from pytest_factoryboy import register
 from rest_framework.test import APIClient, APIRequestFactory
 
+from auth.backends import OAuth2Backend
 from auth.users import User
+from coursera.cache import response_cache
 from coursera.models import Course
 from coursera_dashboard.db_router import DatabaseRouter
 
 
+@pytest.fixture(autouse=True)
+def clear_introspection_cache():
+    """
+    Clear the introspection caches and throttles, so that tokens validated or
+    rejected in one test do not affect another test.
+    """
+    OAuth2Backend.cache.clear()
+    OAuth2Backend.negative_cache.clear()
+    OAuth2Backend.throttle.clear()
+    OAuth2Backend.ip_throttle.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """
+    Clear the analytics response cache, so that every test calculates the
+    analytics it requests.
+    """
+    response_cache.clear()
+
+
 @pytest.fixture
 def coursera_course_id():
     """
@@ -145,6 +171,41 @@ def unauthorized_request_mock(requests_mock):
     )
 
 
+@pytest.fixture(scope="session")
+def private_key():
+    """
+    Return a PEM-encoded RSA private key to sign access tokens in the tests.
+    """
+    key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()
+    )
+    return key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+@pytest.fixture
+def public_key(settings, private_key):
+    """
+    Return the PEM-encoded public key for `private_key`, and configure it as
+    the authorization server's public key.
+    """
+    key = (
+        serialization.load_pem_private_key(
+            private_key, password=None, backend=default_backend()
+        )
+        .public_key()
+        .public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    settings.AUTHORIZATION_SERVER_PUBLIC_KEY = key
+    return key
+
+
 @pytest.fixture
 def rf():
     """
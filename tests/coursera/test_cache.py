@@ -0,0 +1,208 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+
+from coursera.cache import ResponseCache, response_cache
+from coursera.models import DataVersion
+from coursera.views import CourseAnalyticsViewSet
+
+
+@pytest.mark.django_db
+def test_response_cache_hit(
+    teacher_api_client, coursera_course_id, django_assert_num_queries
+):
+    """
+    Test that a repeated request is answered from the response cache, with
+    only the query that checks that the course exists.
+    """
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    response = teacher_api_client.get(url)
+    assert response.status_code == 200, str(response.content)
+
+    with django_assert_num_queries(1):
+        cached_response = teacher_api_client.get(url)
+    assert cached_response.status_code == 200, str(cached_response.content)
+    assert cached_response.data == response.data
+    assert response_cache.stats == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+@pytest.mark.django_db
+def test_response_cache_normalizes_dates(teacher_api_client, coursera_course_id):
+    """
+    Test that equivalent date filters share a cache entry, and that different
+    date filters do not.
+    """
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    teacher_api_client.get(url, {"from_date": "2018-01-01"})
+    teacher_api_client.get(url, {"from_date": "2018-01-01 00:00:00"})
+    assert response_cache.stats["hits"] == 1
+
+    teacher_api_client.get(url, {"from_date": "2018-01-02"})
+    assert response_cache.stats["misses"] == 2
+
+
+@pytest.mark.django_db
+def test_response_cache_courses(teacher, teacher_api_client):
+    """
+    Test that users who may see different courses do not share a cache entry.
+    """
+    url = reverse("coursera-api:course-list")
+    response = teacher_api_client.get(url)
+
+    teacher.courses = teacher.courses[:1]
+    restricted_response = teacher_api_client.get(url)
+    assert response_cache.stats["hits"] == 0
+    assert len(restricted_response.data) < len(response.data)
+
+
+@pytest.mark.django_db
+def test_response_cache_generation(teacher_api_client, coursera_course_id):
+    """
+    Test that incrementing the data generation invalidates the cache.
+    """
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    teacher_api_client.get(url)
+    generation = response_cache.generation
+
+    DataVersion.objects.bump()
+    response_cache.clear()
+    assert response_cache.generation == generation + 1
+
+    teacher_api_client.get(url)
+    assert response_cache.stats == {"hits": 0, "misses": 1, "hit_rate": 0}
+
+
+@pytest.mark.django_db
+def test_conditional_get(
+    teacher_api_client, coursera_course_id, django_assert_num_queries
+):
+    """
+    Test that the analytics endpoints return an ETag and Last-Modified header,
+    and answer a request for an unchanged response with 304 Not Modified
+    with only the query that checks that the course exists.
+    """
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    response = teacher_api_client.get(url)
+    assert response.status_code == 200, str(response.content)
+    assert response["ETag"]
+    assert response["Last-Modified"]
+
+    with django_assert_num_queries(1):
+        not_modified = teacher_api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert not_modified.status_code == 304
+    assert not_modified["ETag"] == response["ETag"]
+
+    not_modified = teacher_api_client.get(
+        url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+    )
+    assert not_modified.status_code == 304
+
+
+@pytest.mark.django_db
+def test_conditional_get_without_access(
+    rf, teacher, teacher_api_client, coursera_course_id
+):
+    """
+    Test that a conditional request for a course that the user may not see
+    is answered with 404 Not Found, even if it matches the user's ETag for
+    that course.
+    """
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    teacher.courses = [
+        course for course in teacher.courses if course != coursera_course_id
+    ]
+    request = rf.get(url)
+    request.user = teacher
+    view = CourseAnalyticsViewSet(action="retrieve", kwargs={"pk": coursera_course_id})
+    etag = response_cache.make_etag(response_cache.make_key(request, view))
+
+    response = teacher_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_conditional_get_changed(teacher_api_client, coursera_course_id):
+    """
+    Test that a request with different parameters or after a refresh of the
+    data does not match the ETag of an earlier response.
+    """
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    etag = teacher_api_client.get(url)["ETag"]
+
+    response = teacher_api_client.get(
+        url, {"from_date": "2018-01-01"}, HTTP_IF_NONE_MATCH=etag
+    )
+    assert response.status_code == 200, str(response.content)
+    assert response["ETag"] != etag
+
+    DataVersion.objects.bump()
+    response_cache.clear()
+    response = teacher_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200, str(response.content)
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_warmanalytics(
+    teacher_api_client, coursera_course_id, django_assert_num_queries
+):
+    """
+    Test that `manage.py warmanalytics` precomputes the responses that a
+    teacher requests for a course.
+    """
+    call_command(
+        "warmanalytics", courses=[coursera_course_id], force=True, stdout=StringIO()
+    )
+    assert response_cache.stats["hits"] == 0
+    assert response_cache.stats["misses"] > 0
+
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    with django_assert_num_queries(1):
+        response = teacher_api_client.get(url)
+    assert response.status_code == 200, str(response.content)
+    assert response_cache.stats["hits"] == 1
+
+
+def test_warmanalytics_local_cache():
+    """
+    Test that `manage.py warmanalytics` refuses to precompute the analytics
+    into a cache that is local to its own process.
+    """
+    with pytest.raises(CommandError):
+        call_command("warmanalytics", stdout=StringIO())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params,hits", [({}, 0), ({"to_date": "2018-09-20"}, 1)])
+def test_response_cache_current_day(
+    teacher_api_client, coursera_course_id, freezer, params, hits
+):
+    """
+    Test that responses that depend on the current time are only cached for
+    the current day, unless the timespan ends at to_date.
+    """
+    url = reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
+    freezer.move_to("2018-09-25 23:00")
+    teacher_api_client.get(url, params)
+    freezer.move_to("2018-09-26 01:00")
+    teacher_api_client.get(url, params)
+    assert response_cache.stats["hits"] == hits
+
+
+def test_response_cache_logs_stats(caplog):
+    """
+    Test that the hit rate of the response cache is logged every
+    `stats_interval` lookups.
+    """
+    cache = ResponseCache(stats_interval=2)
+    cache.set("key", {"data": 1})
+    with caplog.at_level("INFO", logger="coursera.cache"):
+        cache.get("key")
+        assert not caplog.records
+        cache.get("missing")
+    assert [record.getMessage() for record in caplog.records] == [
+        "alias=analytics hits=1 misses=1 hit_rate=0.500"
+    ]
@@ -0,0 +1,41 @@
+from datetime import date
+
+from coursera.filters import get_day_window
+
+
+def test_day_window_unfiltered():
+    """
+    Test that a request without date filters aligns to days.
+    """
+    assert get_day_window({}) == (None, None)
+
+
+def test_day_window_aligned():
+    """
+    Test that date filters at midnight UTC are converted to days.
+    """
+    assert get_day_window(
+        {"from_date": "2018-01-01", "to_date": "2018-02-01 00:00:00"}
+    ) == (date(2018, 1, 1), date(2018, 2, 1))
+    assert get_day_window({"to_date": "2018-02-01"}) == (None, date(2018, 2, 1))
+
+
+def test_day_window_unaligned():
+    """
+    Test that date filters that are not at midnight UTC do not align to days.
+    """
+    assert get_day_window({"from_date": "2018-01-01 12:00:00"}) is None
+    assert (
+        get_day_window({"from_date": "2018-01-01", "to_date": "2018-02-01 00:00:01"})
+        is None
+    )
+
+
+def test_day_window_invalid():
+    """
+    Test that invalid date filters are ignored.
+    """
+    assert get_day_window({"from_date": "yesterday", "to_date": "2018-02-01"}) == (
+        None,
+        date(2018, 2, 1),
+    )
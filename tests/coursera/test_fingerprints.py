@@ -0,0 +1,54 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection, transaction
+
+from coursera.fingerprints import BOOKKEEPING_TABLES, get_fingerprints, get_view_sources
+
+
+@pytest.mark.django_db
+def test_view_sources():
+    """
+    Test that the sources of a materialized view include the partitioned
+    relations it selects from, and that each has a fingerprint.
+    """
+    sources = get_view_sources()
+    assert sources["heartbeat_daily_counts_view"] == {"heartbeat_events_view"}
+    assert "heartbeat_events_view" in get_fingerprints()
+
+
+@pytest.mark.django_db
+def test_import_changes_fingerprint(tmp_path):
+    """
+    Test that importing a table changes its fingerprint within the
+    transaction, and that the bookkeeping tables have no fingerprint.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE fingerprints_test (id integer)")
+    (tmp_path / "fingerprints_test.csv").write_text("id\n1\n")
+
+    fingerprints = get_fingerprints()
+    assert not set(BOOKKEEPING_TABLES) & set(fingerprints)
+
+    call_command("importexport", str(tmp_path), workers=1, stdout=StringIO())
+    assert get_fingerprints()["fingerprints_test"] != fingerprints["fingerprints_test"]
+
+
+@pytest.mark.django_db
+def test_reload_changes_fingerprint():
+    """
+    Test that truncating and reloading a table other than with importexport
+    changes its fingerprint, even if it has the same rows.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE fingerprints_test (id integer)")
+        cursor.execute("INSERT INTO fingerprints_test VALUES (1)")
+    fingerprint = get_fingerprints()["fingerprints_test"]
+
+    # A table that was created in the current subtransaction is truncated in
+    # place, so the table is reloaded in a new subtransaction.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("TRUNCATE fingerprints_test")
+        cursor.execute("INSERT INTO fingerprints_test VALUES (1)")
+    assert get_fingerprints()["fingerprints_test"] != fingerprint
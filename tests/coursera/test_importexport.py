@@ -0,0 +1,75 @@
+import csv
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+
+
+@pytest.mark.django_db
+def test_importexport(tmp_path):
+    """
+    Test that `manage.py importexport` replaces the rows of a table with the
+    rows of its CSV file, with the columns in the order of the header.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE importexport_test (id integer, value text)")
+        cursor.execute("INSERT INTO importexport_test VALUES (0, 'old')")
+
+    rows = [(str(i), 'value %d, with\n"quotes"' % i) for i in range(1000)]
+    with open(tmp_path / "importexport_test.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["value", "id"])
+        writer.writerows((value, id) for id, value in rows)
+
+    stdout = StringIO()
+    call_command(
+        "importexport", str(tmp_path), workers=1, chunk_size=1024, stdout=stdout
+    )
+    assert "Imported 1000 rows into 'importexport_test'" in stdout.getvalue()
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id::text, value FROM importexport_test ORDER BY id")
+        assert cursor.fetchall() == sorted(rows, key=lambda row: int(row[0]))
+
+
+@pytest.mark.django_db
+def test_importexport_foreign_keys(tmp_path):
+    """
+    Test that `manage.py importexport` replaces the rows of tables that
+    reference each other, importing the referenced table first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE importexport_parent (id integer PRIMARY KEY)")
+        cursor.execute(
+            """
+            CREATE TABLE importexport_child (
+                id integer PRIMARY KEY,
+                parent_id integer REFERENCES importexport_parent
+            )
+            """
+        )
+        cursor.execute("INSERT INTO importexport_parent VALUES (0)")
+        cursor.execute("INSERT INTO importexport_child VALUES (0, 0)")
+
+    (tmp_path / "importexport_child.csv").write_text("id,parent_id\n1,1\n")
+    (tmp_path / "importexport_parent.csv").write_text("id\n1\n")
+
+    stdout = StringIO()
+    call_command("importexport", str(tmp_path), workers=1, stdout=stdout)
+    assert "Importing 2 tables in 1 groups" in stdout.getvalue()
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, parent_id FROM importexport_child")
+        assert cursor.fetchall() == [(1, 1)]
+
+
+@pytest.mark.django_db
+def test_importexport_unknown_table(tmp_path):
+    """
+    Test that `manage.py importexport` does not import any files if a file
+    does not belong to a table.
+    """
+    (tmp_path / "unknown_table.csv").write_text("id\n1\n")
+    with pytest.raises(CommandError):
+        call_command("importexport", str(tmp_path), stdout=StringIO())
@@ -1,8 +1,11 @@
+from datetime import datetime, timedelta, timezone
+
 import pytest
-from django.db.models import ProtectedError
+from django.db.models import F, ProtectedError, Sum
 from django.db.models.base import ModelBase
 
 from coursera import models
+from coursera.cache import current_branches, get_current_branch_id, response_cache
 
 model_list = [
     model
@@ -42,3 +45,115 @@ def test_can_access_foreign_keys(model):
             assert hasattr(
                 instance, field.name
             ), f"Could not get foreign key {field.name} from model {model._meta.object_name}"
+
+
+@pytest.mark.django_db
+def test_current_branch_is_latest_branch(coursera_course_id, django_assert_num_queries):
+    """
+    Test that the current branch of a course is its most recently created
+    branch, and that the mapping is cached until the data generation changes.
+    """
+    response_cache.generation
+    current_branches.clear()
+    latest = (
+        models.Branch.objects.filter(course_id=coursera_course_id)
+        .order_by(F("authoring_course_branch_created_ts").desc(nulls_last=True))
+        .first()
+    )
+    with django_assert_num_queries(1):
+        assert get_current_branch_id(coursera_course_id) == latest.pk
+    with django_assert_num_queries(0):
+        assert get_current_branch_id(coursera_course_id) == latest.pk
+
+    models.DataVersion.objects.bump()
+    response_cache.forget_version()
+    with django_assert_num_queries(2):
+        assert get_current_branch_id(coursera_course_id) == latest.pk
+
+
+@pytest.mark.django_db
+def test_count_leaving_learners(coursera_course_id):
+    """
+    Test that the leaving learners counted from the learner status relation
+    match the learners that were a member, had not passed and had not been
+    active for 6 weeks.
+    """
+    date = datetime(2018, 6, 1, tzinfo=timezone.utc)
+    expected = (
+        models.CourseMembership.objects.filter(course_id=coursera_course_id)
+        .filter(timestamp__lte=date)
+        .filter(
+            role__in=[
+                models.CourseMembership.LEARNER,
+                models.CourseMembership.PRE_ENROLLED_LEARNER,
+            ]
+        )
+        .values("eitdigital_user_id")
+        .difference(
+            models.Grade.objects.filter(course_id=coursera_course_id)
+            .filter(timestamp__lte=date)
+            .filter(
+                passing_state__in=[models.Grade.PASSED, models.Grade.VERIFIED_PASSED]
+            )
+            .values("eitdigital_user_id")
+        )
+        .difference(
+            models.LastActivity.objects.filter(course_id=coursera_course_id)
+            .filter(timestamp__gt=date - timedelta(weeks=6))
+            .values("eitdigital_user_id")
+        )
+        .count()
+    )
+    leaving_learners = models.CourseLearnerStatus.objects.filter(
+        course_id=coursera_course_id
+    ).count_leaving_learners(date)
+    assert leaving_learners.get(coursera_course_id, 0) == expected
+
+
+@pytest.mark.django_db
+def test_course_daily_activity(coursera_course_id):
+    """
+    Test that the enrollments and passes summed from the daily rollups match
+    the memberships and grades in the same window.
+    """
+    from_date = datetime(2018, 1, 1, tzinfo=timezone.utc)
+    to_date = datetime(2018, 6, 1, tzinfo=timezone.utc)
+    activity = (
+        models.CourseDailyActivity.objects.filter(course_id=coursera_course_id)
+        .within((from_date.date(), to_date.date()))
+        .aggregate(enrollments=Sum("enrollments"), passes=Sum("passes"))
+    )
+    assert (
+        activity["enrollments"]
+        == models.CourseMembership.objects.filter(course_id=coursera_course_id)
+        .filter(timestamp__gte=from_date, timestamp__lt=to_date)
+        .filter(
+            role__in=[
+                models.CourseMembership.LEARNER,
+                models.CourseMembership.PRE_ENROLLED_LEARNER,
+            ]
+        )
+        .count()
+    )
+    assert (
+        activity["passes"]
+        == models.Grade.objects.filter(course_id=coursera_course_id)
+        .filter(timestamp__gte=from_date, timestamp__lt=to_date)
+        .filter(passing_state__in=[models.Grade.PASSED, models.Grade.VERIFIED_PASSED])
+        .count()
+    )
+
+
+@pytest.mark.django_db
+def test_clickstream_video_events(coursera_video_id):
+    """
+    Test that the video events match the clickstream events that start or end
+    the video.
+    """
+    events = models.ClickstreamVideoEvent.objects.filter(item_id=coursera_video_id)
+    assert events.exists(), "no video events found"
+    assert sorted(events.values_list("pk", flat=True)) == sorted(
+        models.ClickstreamEvent.objects.filter(
+            value__item_id=coursera_video_id, key__in=["start", "end"]
+        ).values_list("pk", flat=True)
+    )
@@ -0,0 +1,49 @@
+import pytest
+
+from coursera.cache import response_cache
+from coursera.models import DataVersion, Item
+from coursera.navigation import get_navigation_index, navigation_indexes
+
+
+@pytest.mark.django_db
+def test_navigation_index_next_item(coursera_alt_course_id):
+    """
+    Test that the navigation index returns the item directly after an item in
+    its lesson.
+    """
+    item = Item.objects.get(branch__course_id=coursera_alt_course_id, item_id="Fzhxo")
+    entry = get_navigation_index(item.branch_id).get_next_item(item)
+    assert entry is not None, "no next item found"
+    assert entry.item_id == "X9UsA", "item_id is not correct"
+    assert entry.as_item() == {
+        "item_id": "X9UsA",
+        "type": 1,
+        "category": entry.category,
+    }
+
+
+@pytest.mark.django_db
+def test_navigation_index_is_cached(coursera_alt_course_id, django_assert_num_queries):
+    """
+    Test that the navigation index of a branch is only built once.
+    """
+    item = Item.objects.filter(branch__course_id=coursera_alt_course_id)[0]
+    response_cache.generation
+    navigation_indexes.clear()
+    with django_assert_num_queries(2):
+        index = get_navigation_index(item.branch_id)
+    with django_assert_num_queries(0):
+        assert get_navigation_index(item.branch_id) is index
+
+
+@pytest.mark.django_db
+def test_navigation_index_is_rebuilt_for_new_generation(coursera_alt_course_id):
+    """
+    Test that the navigation index of a branch is rebuilt when the data
+    generation changes.
+    """
+    item = Item.objects.filter(branch__course_id=coursera_alt_course_id)[0]
+    index = get_navigation_index(item.branch_id)
+    DataVersion.objects.bump()
+    response_cache.forget_version()
+    assert get_navigation_index(item.branch_id) is not index
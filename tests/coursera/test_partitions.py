@@ -0,0 +1,191 @@
+from datetime import date
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from coursera.partitions import (
+    PARTITIONED_RELATIONS,
+    get_month_checksums,
+    get_partitions,
+    get_stale_months,
+    months_between,
+    next_month,
+    previous_month,
+    refresh_partition,
+)
+
+
+def test_months_between():
+    """
+    Test that the months between two days include the months of both days,
+    also across the end of a year.
+    """
+    assert next_month(date(2018, 12, 1)) == date(2019, 1, 1)
+    assert previous_month(date(2019, 1, 15)) == date(2018, 12, 1)
+    assert months_between(date(2018, 11, 20), date(2019, 2, 1)) == [
+        date(2018, 11, 1),
+        date(2018, 12, 1),
+        date(2019, 1, 1),
+        date(2019, 2, 1),
+    ]
+    assert months_between(date(2019, 2, 1), date(2018, 11, 20)) == []
+
+
+def test_stale_months():
+    """
+    Test that the stale months of a relation are the months of which the
+    fingerprint of the source rows changed, was added or was removed.
+    """
+    relation, other = PARTITIONED_RELATIONS[:2]
+    recorded = {
+        (relation.name, date(2018, 9, 1)): "a",
+        (relation.name, date(2018, 10, 1)): "b",
+        (relation.name, date(2018, 11, 1)): "c",
+        (other.name, date(2018, 9, 1)): "d",
+    }
+    fingerprints = {
+        (relation.name, date(2018, 9, 1)): "a",
+        (relation.name, date(2018, 10, 1)): "e",
+        (relation.name, date(2018, 12, 1)): "f",
+        (other.name, date(2018, 9, 1)): "g",
+    }
+    assert get_stale_months(relation, fingerprints, recorded) == [
+        date(2018, 10, 1),
+        date(2018, 11, 1),
+        date(2018, 12, 1),
+    ]
+    assert get_stale_months(relation, recorded, recorded) == []
+
+
+@pytest.mark.django_db
+def test_clickstream_partitions():
+    """
+    Test that every month with clickstream events has an attached partition
+    for each partitioned relation.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT DISTINCT date_trunc('month', server_timestamp)::date
+            FROM clickstream_events
+            WHERE server_timestamp IS NOT NULL
+            """
+        )
+        months = {month for (month,) in cursor.fetchall()}
+    assert months
+
+    for relation in PARTITIONED_RELATIONS:
+        partitions = {
+            month for month, _, attached in get_partitions(relation) if attached
+        }
+        assert months <= partitions, relation.name
+
+
+@pytest.mark.django_db
+def test_refresh_partition():
+    """
+    Test that refreshing a partition swaps in a new attached partition with
+    the same rows and indexes, and drops the old partition.
+    """
+    relation = PARTITIONED_RELATIONS[0]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT MIN(date_trunc('month', server_timestamp))::date
+            FROM clickstream_events
+            """
+        )
+        (month,) = cursor.fetchone()
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+            FROM clickstream_events_view
+            WHERE server_timestamp >= %s AND server_timestamp < %s
+            """,
+            [month, next_month(month)],
+        )
+        (rows,) = cursor.fetchone()
+
+        name = refresh_partition(relation, month, lock_timeout=5)
+
+        assert (month, name, True) in get_partitions(relation)
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+            FROM clickstream_events_view
+            WHERE server_timestamp >= %s AND server_timestamp < %s
+            """,
+            [month, next_month(month)],
+        )
+        assert cursor.fetchone() == (rows,)
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %s ORDER BY indexname",
+            [name],
+        )
+        assert [index for (index,) in cursor.fetchall()] == sorted(
+            ["%s_id_idx" % name]
+            + ["%s_%d_idx" % (name, i) for i in range(len(relation.indexes))]
+        )
+        cursor.execute("SELECT to_regclass(%s)", ["%s_new" % name])
+        assert cursor.fetchone() == (None,)
+
+
+@pytest.mark.django_db
+def test_refresh_changed_partitions():
+    """
+    Test that refreshing without a range of months only refreshes the
+    partitions whose source rows changed since their last refresh, and all
+    heartbeat partitions when the course branches changed.
+    """
+    call_command("partitions", "refresh", stdout=StringIO())
+    output = StringIO()
+    call_command("partitions", "refresh", stdout=output)
+    assert "Refreshed partition" not in output.getvalue()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE course_branches
+            SET authoring_course_branch_created_ts = authoring_course_branch_created_ts
+                + interval '1 second'
+            """
+        )
+        cursor.execute(
+            """
+            SELECT COUNT(DISTINCT date_trunc('month', server_timestamp))
+            FROM clickstream_events
+            """
+        )
+        (months,) = cursor.fetchone()
+    output = StringIO()
+    call_command("partitions", "refresh", stdout=output)
+    refreshed = [
+        line.split("'")[1]
+        for line in output.getvalue().splitlines()
+        if line.startswith("Refreshed partition")
+    ]
+    assert len(refreshed) == months
+    assert all(name.startswith("heartbeat_events_view_") for name in refreshed)
+
+
+@pytest.mark.django_db
+def test_month_checksums(django_assert_num_queries):
+    """
+    Test that the checksums of the events of each month are stored, and
+    only calculated again once the fingerprint of the events table changed.
+    """
+    checksums = get_month_checksums()
+    assert checksums
+    with django_assert_num_queries(2):
+        assert get_month_checksums() == checksums
+
+    month = min(checksums)
+    assert get_month_checksums(month, next_month(month)) == {month: checksums[month]}
+
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE partition_checksums SET source_fingerprint = 'stale'")
+    assert get_month_checksums() == checksums
+    with django_assert_num_queries(2):
+        get_month_checksums()
@@ -0,0 +1,69 @@
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from coursera.journal import (
+    SUCCEEDED,
+    finish_view,
+    get_unfinished_run,
+    record_run_fingerprints,
+    start_run,
+    start_view,
+)
+
+
+@pytest.mark.django_db
+def test_refreshviews_dry_run():
+    """
+    Test that `manage.py refreshviews --dry-run --force` plans to refresh
+    every materialized view, without refreshing any.
+    """
+    stdout = StringIO()
+    call_command("refreshviews", dry_run=True, force=True, stdout=stdout)
+    output = stdout.getvalue()
+    assert "Would refresh the clickstream partitions" in output
+    assert "heartbeat_daily_counts_view" in output
+    assert "Would skip 0 unchanged materialized views" in output
+
+
+@pytest.mark.django_db
+def test_refreshviews_compaction_plan():
+    """
+    Test that `manage.py refreshviews --compact-only --dry-run` plans a
+    VACUUM FULL only for tables over the bloat threshold.
+    """
+    stdout = StringIO()
+    call_command(
+        "refreshviews",
+        compact_only=True,
+        dry_run=True,
+        bloat_threshold=1,
+        stdout=stdout,
+    )
+    output = stdout.getvalue()
+    assert "Would VACUUM table 'clickstream_events'" in output
+    assert "VACUUM FULL" not in output
+    assert "Would refresh" not in output
+
+
+@pytest.mark.django_db
+def test_refreshviews_resume():
+    """
+    Test that `manage.py refreshviews --resume` continues an unfinished run
+    with the views that it did not refresh.
+    """
+    with pytest.raises(CommandError):
+        call_command("refreshviews", resume=True, dry_run=True, stdout=StringIO())
+
+    run_id = start_run([(0, ["course_progress_view", "grades_view"])], False)
+    record_run_fingerprints(run_id, {})
+    start_view(run_id, "course_progress_view")
+    finish_view(run_id, "course_progress_view", SUCCEEDED, 1.0)
+    assert get_unfinished_run() == (run_id, False, {})
+
+    stdout = StringIO()
+    call_command("refreshviews", resume=True, dry_run=True, stdout=stdout)
+    output = stdout.getvalue()
+    assert "Would resume run %d" % run_id in output
+    assert "Would refresh level 0: grades_view" in output
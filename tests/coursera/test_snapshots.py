@@ -0,0 +1,142 @@
+from datetime import date
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from coursera.snapshots import (
+    create_shadow_schema,
+    create_shadow_tables,
+    get_view_definitions,
+)
+
+
+@pytest.mark.django_db
+def test_view_definitions():
+    """
+    Test that the view definitions include the materialized views with
+    their unique indexes, which the refresh of a swapped in view needs.
+    """
+    definitions = get_view_definitions()
+    views = [view for view, _, _ in definitions]
+    assert "heartbeat_daily_counts_view" in views
+    for view, definition, indexes in definitions:
+        assert definition
+        assert any(index["unique"] for index in indexes), view
+
+
+@pytest.mark.django_db
+def test_snapshot_build_and_swap(tmp_path):
+    """
+    Test that `manage.py snapshot build --swap` imports an export directory
+    into the shadow schema, rebuilds the materialized views with their
+    indexes there, and swaps them into the public schema.
+    """
+
+    def get_indexes(view):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT indexname
+                FROM pg_indexes
+                WHERE schemaname = 'public' AND tablename = %s
+                ORDER BY indexname
+                """,
+                [view],
+            )
+            return cursor.fetchall()
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 'course_branches'::regclass::oid")
+        (table_oid,) = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) FROM course_branches")
+        (rows,) = cursor.fetchone()
+        with open(tmp_path / "course_branches.csv", "w") as f:
+            cursor.copy_expert(
+                "COPY course_branches TO STDOUT WITH (FORMAT csv, HEADER)", f
+            )
+    indexes = get_indexes("heartbeat_daily_counts_view")
+
+    call_command(
+        "snapshot", "build", str(tmp_path), swap=True, workers=1, stdout=StringIO()
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 'course_branches'::regclass::oid")
+        assert cursor.fetchone() != (table_oid,)
+        cursor.execute("SELECT COUNT(*) FROM course_branches")
+        assert cursor.fetchone() == (rows,)
+        cursor.execute("SELECT to_regclass('coursera_previous.course_branches')")
+        assert cursor.fetchone() != (None,)
+    assert get_indexes("heartbeat_daily_counts_view") == indexes
+
+
+@pytest.mark.django_db
+def test_snapshot_partition_fingerprints(tmp_path):
+    """
+    Test that `manage.py snapshot build` records the fingerprints of the
+    partitions it builds in the shadow schema, and that `manage.py snapshot
+    swap` swaps them in along with the partitions.
+    """
+
+    def get_fingerprints(schema):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relation, month, fingerprint FROM {}.partition_fingerprints "
+                "ORDER BY relation, month".format(schema)
+            )
+            return cursor.fetchall()
+
+    with connection.cursor() as cursor:
+        with open(tmp_path / "course_branches.csv", "w") as f:
+            cursor.copy_expert(
+                "COPY course_branches TO STDOUT WITH (FORMAT csv, HEADER)", f
+            )
+        cursor.execute(
+            "INSERT INTO partition_fingerprints VALUES "
+            "('clickstream_events_view', '2000-01-01', 'live', now())"
+        )
+    fingerprints = get_fingerprints("public")
+
+    call_command("snapshot", "build", str(tmp_path), workers=1, stdout=StringIO())
+
+    assert get_fingerprints("public") == fingerprints
+    shadow_fingerprints = get_fingerprints("coursera_shadow")
+    assert ("clickstream_events_view", date(2000, 1, 1), "live") not in (
+        shadow_fingerprints
+    )
+
+    call_command("snapshot", "swap", stdout=StringIO())
+
+    assert get_fingerprints("public") == shadow_fingerprints
+    assert get_fingerprints("coursera_previous") == fingerprints
+
+
+@pytest.mark.django_db
+def test_snapshot_swap_and_rollback():
+    """
+    Test that `manage.py snapshot swap` replaces a table with its copy in the
+    shadow schema, and that `manage.py snapshot rollback` swaps the previous
+    table back and forth.
+    """
+
+    def get_value():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT value FROM snapshot_test")
+            return cursor.fetchone()[0]
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE snapshot_test (value text)")
+        cursor.execute("INSERT INTO snapshot_test VALUES ('old')")
+    create_shadow_schema()
+    create_shadow_tables(["snapshot_test"])
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO coursera_shadow.snapshot_test VALUES ('new')")
+
+    call_command("snapshot", "swap", stdout=StringIO())
+    assert get_value() == "new"
+    call_command("snapshot", "rollback", stdout=StringIO())
+    assert get_value() == "old"
+    call_command("snapshot", "rollback", stdout=StringIO())
+    assert get_value() == "new"
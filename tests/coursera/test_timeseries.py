@@ -0,0 +1,77 @@
+from datetime import date, datetime, timezone
+
+import pytest
+from django.db.models import Count
+
+from coursera import models
+from coursera.timeseries import Series, get_course_time_series
+
+
+def test_series_count():
+    """
+    Test that the series sums the daily counts within a window, with an
+    inclusive from_day and an exclusive to_day.
+    """
+    series = Series(
+        [
+            (date(2018, 1, 3), 4),
+            (date(2018, 1, 1), 1),
+            (None, 7),
+            (date(2018, 1, 2), 2),
+            (date(2018, 1, 2), 3),
+        ]
+    )
+    assert series.count((None, None)) == 17
+    assert series.count((date(2018, 1, 2), None)) == 9
+    assert series.count((None, date(2018, 1, 3))) == 6
+    assert series.count((date(2018, 1, 2), date(2018, 1, 3))) == 5
+    assert series.count((date(2017, 1, 1), date(2019, 1, 1))) == 10
+
+
+def test_series_count_empty_window():
+    """
+    Test that empty and inverted windows have a count of zero.
+    """
+    series = Series([(date(2018, 1, 1), 1), (date(2018, 1, 2), 2)])
+    assert series.count((date(2018, 1, 2), date(2018, 1, 2))) == 0
+    assert series.count((date(2018, 1, 2), date(2018, 1, 1))) == 0
+    assert series.count((date(2019, 1, 1), None)) == 0
+    assert Series().count((None, None)) == 0
+
+
+@pytest.mark.django_db
+def test_course_time_series(coursera_course_id):
+    """
+    Test that the course time series match the memberships and ratings in
+    the same window.
+    """
+    from_date = datetime(2018, 1, 1, tzinfo=timezone.utc)
+    to_date = datetime(2018, 6, 1, tzinfo=timezone.utc)
+    window = (from_date.date(), to_date.date())
+    time_series = get_course_time_series(coursera_course_id)
+
+    assert (
+        time_series.enrollments.count(window)
+        == models.CourseMembership.objects.filter(course_id=coursera_course_id)
+        .filter(timestamp__gte=from_date, timestamp__lt=to_date)
+        .filter(
+            role__in=[
+                models.CourseMembership.LEARNER,
+                models.CourseMembership.PRE_ENROLLED_LEARNER,
+            ]
+        )
+        .count()
+    )
+    assert time_series.get_ratings(window) == list(
+        models.CourseRating.objects.filter(course_id=coursera_course_id)
+        .filter(timestamp__gte=from_date, timestamp__lt=to_date)
+        .filter(
+            feedback_system__in=[
+                models.CourseRating.NPS_FIRST_WEEK,
+                models.CourseRating.NPS_END_OF_COURSE,
+            ]
+        )
+        .values_list("rating")
+        .annotate(Count("id"))
+        .order_by("rating")
+    )
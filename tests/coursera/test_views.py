@@ -1,11 +1,20 @@
 from collections import Counter
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta, timezone
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from coursera.models import Course
+from coursera.cache import response_cache
+from coursera.models import Attempt, Course, Item
+from coursera.navigation import get_navigation_index
 from coursera.serializers import CourseAnalyticsSerializer
+from coursera.timeseries import (
+    course_time_series,
+    get_branch_time_series,
+    get_course_time_series,
+)
 
 
 @pytest.mark.django_db
@@ -43,7 +52,11 @@ def test_course_analytics_view(
     Also asserts that the number of database queries does not exceed the
     predetermined number of queries required for this endpoint.
     """
-    with django_assert_max_num_queries(10) as captured:
+    # Read the data generation and build the time series outside of the
+    # measured queries.
+    response_cache.generation
+    get_course_time_series(coursera_course_id)
+    with django_assert_max_num_queries(11) as captured:
         response = teacher_api_client.get(
             reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id})
         )
@@ -244,9 +257,42 @@ def test_course_list_view(teacher_api_client):
         assert list(item.keys()) == keys
 
 
+@pytest.mark.django_db
+@pytest.mark.freeze_time("2018-09-25 15:00")
+def test_course_list_view_bulk_analytics(
+    teacher, teacher_api_client, coursera_course_id, django_assert_num_queries
+):
+    """
+    Test that the number of queries for the course list view does not depend
+    on the number of courses, and that the leaving learners and ratings in
+    the list match those of the course detail view.
+    """
+    url = reverse("coursera-api:course-list")
+    params = {"from_date": "2018-01-01"}
+    # Read the data generation and build the time series outside of the
+    # measured queries.
+    response_cache.generation
+    course_time_series.get_many(teacher.courses)
+    with CaptureQueriesContext(connection) as captured:
+        response = teacher_api_client.get(url, params)
+    assert response.status_code == 200, str(response.content)
+    assert len({item["id"] for item in response.data}) > 1
+
+    teacher.courses = [coursera_course_id]
+    with django_assert_num_queries(len(captured)):
+        assert teacher_api_client.get(url, params).status_code == 200
+
+    detail = teacher_api_client.get(
+        reverse("coursera-api:course-detail", kwargs={"pk": coursera_course_id}), params
+    )
+    item = next(item for item in response.data if item["id"] == coursera_course_id)
+    assert item["leaving_learners"] == detail.data["leaving_learners"]
+    assert item["ratings"] == detail.data["ratings"]
+
+
 @pytest.mark.django_db
 def test_video_analytics_view(
-    teacher_api_client, coursera_course_id, coursera_video_id
+    teacher_api_client, coursera_course_id, coursera_video_id, django_assert_num_queries
 ):
     """
     Test that the video detail view can be accessed and returns the
@@ -269,13 +315,30 @@ def test_video_analytics_view(
     - next_item
     - next_video
     - views_over_runtime
+
+    Also asserts the number of database queries required for this endpoint:
+    one to check that the video exists, one for the video, one for the
+    watchers, one for the views over runtime, and one for the passing
+    fraction if the next item is a quiz.
     """
-    response = teacher_api_client.get(
-        reverse(
-            "coursera-api:video-detail",
-            kwargs={"course_id": coursera_course_id, "item_id": coursera_video_id},
-        )
+    # Read the data generation, and build the time series and navigation
+    # index of the branch outside of the measured queries.
+    response_cache.generation
+    video = Item.objects.get(
+        branch__course=coursera_course_id,
+        branch__current__isnull=False,
+        item_id=coursera_video_id,
     )
+    get_branch_time_series(video.branch_id)
+    next_item = get_navigation_index(video.branch_id).get_next_item(video)
+    queries = 4 if next_item is None or next_item.category != "quiz" else 5
+    with django_assert_num_queries(queries):
+        response = teacher_api_client.get(
+            reverse(
+                "coursera-api:video-detail",
+                kwargs={"course_id": coursera_course_id, "item_id": coursera_video_id},
+            )
+        )
     keys = [
         "id",
         "branch",
@@ -601,6 +664,55 @@ def test_quiz_analytics_view(
     assert list(response.data.keys()) == keys
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params,lookup",
+    [
+        (
+            {"from_date": "2018-01-01"},
+            {"timestamp__gte": datetime(2018, 1, 1, tzinfo=timezone.utc)},
+        ),
+        (
+            {"to_date": "2018-09-20"},
+            {"timestamp__lte": datetime(2018, 9, 20, tzinfo=timezone.utc)},
+        ),
+    ],
+)
+def test_quiz_analytics_number_of_attempts(
+    teacher_api_client,
+    coursera_course_id,
+    coursera_assessment_id,
+    coursera_assessment_base_id,
+    coursera_assessment_version,
+    params,
+    lookup,
+):
+    """
+    Test that "number_of_attempts" counts each user once, in the bucket of
+    their number of attempts within the given timespan.
+    """
+    response = teacher_api_client.get(
+        reverse(
+            "coursera-api:quiz-detail",
+            kwargs={
+                "course_id": coursera_course_id,
+                "base_id": coursera_assessment_base_id,
+                "version": coursera_assessment_version,
+            },
+        ),
+        params,
+    )
+    assert response.status_code == 200, str(response.content)
+
+    attempts = Counter(
+        Attempt.objects.filter(quiz_id=coursera_assessment_id)
+        .filter(**lookup)
+        .values_list("eitdigital_user_id", flat=True)
+    )
+    expected = sorted(Counter(attempts.values()).items())
+    assert [tuple(bucket) for bucket in response.data["number_of_attempts"]] == expected
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize("filter_type", ["from_date", "to_date"])
 def test_quiz_analytics_date_filter(
@@ -0,0 +1,73 @@
+from time import sleep
+
+import pytest
+from django.http import HttpResponse
+from django.urls import reverse
+
+from coursera_dashboard.middleware import ServerTimingMiddleware, timing
+
+
+def test_server_timing_header(rf):
+    """
+    Test that the Server-Timing header contains the total time, and the time
+    of any phase that was timed during the request.
+    """
+
+    def get_response(request):
+        with timing(request, "auth"):
+            pass
+        return HttpResponse()
+
+    response = ServerTimingMiddleware(get_response)(rf.get("/"))
+    metrics = [metric.split(";")[0] for metric in response["Server-Timing"].split(", ")]
+    assert metrics == ["auth", "total"]
+
+
+def test_server_timing_excludes_queries_from_phases(rf):
+    """
+    Test that the time spent in database queries during a phase is added to
+    the "db" phase, and not to the phase itself.
+    """
+
+    def execute(sql, params, many, context):
+        sleep(0.05)
+
+    def get_response(request):
+        with timing(request, "serialize"):
+            request.server_timing.execute_wrapper(execute, "SELECT 1", None, False, {})
+        return HttpResponse()
+
+    request = rf.get("/")
+    ServerTimingMiddleware(get_response)(request)
+    durations = request.server_timing.durations
+    assert durations["db"] >= 0.05
+    assert durations["serialize"] < 0.05
+    assert request.server_timing.queries == 1
+
+
+def test_timing_without_middleware(rf):
+    """
+    Test that timing a request that is not handled by ServerTimingMiddleware
+    does not raise an error.
+    """
+    request = rf.get("/")
+    with timing(request, "auth"):
+        pass
+    assert not hasattr(request, "server_timing")
+
+
+@pytest.mark.django_db
+def test_server_timing_api_response(api_client, valid_token_mock):
+    """
+    Test that an API response includes the time spent in authentication,
+    database queries, serialization and rendering, and the number of queries.
+    """
+    response = api_client.get(
+        reverse("coursera-api:course-list"), HTTP_AUTHORIZATION="Bearer valid_token"
+    )
+    assert response.status_code == 200, str(response.content)
+    metrics = dict(
+        metric.split(";", 1) for metric in response["Server-Timing"].split(", ")
+    )
+    assert set(metrics) == {"auth", "db", "serialize", "render", "total"}
+    assert "queries" in metrics["db"]